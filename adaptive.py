@@ -0,0 +1,244 @@
+"""Adaptive decode settings: trade accuracy for speed based on the measured real-time factor.
+
+The controller keeps a ladder of decode settings ("rungs"). At the top is the largest allowed
+model with beam search; at the bottom, the smallest model decoding greedily without
+temperature fallback. Each finished job reports its real-time factor (decode time / audio
+time). From that the controller keeps a running estimate of how slow the machine is right
+now, and predicts the latency of a typical recording on every rung. The current level
+steps down as soon as that prediction nears the latency target, and back up one rung at a
+time once there is clear headroom, so it doesn't flap; a single clip too long for the
+current level is decoded on a faster rung without moving the level. The decoder thread
+count follows how much of its CPU time the decode actually got. Every change is printed
+and, with TRANSCRIBE_ADAPTIVE_LOG, appended to a JSON-lines log.
+"""
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+
+import backends
+import engine
+import metrics
+
+ADAPTIVE_TARGET_SECONDS = float(os.getenv("TRANSCRIBE_LATENCY_TARGET", "0"))  # Stop-to-text target (0 = off)
+ADAPTIVE_BACKGROUND_RTF = float(os.getenv("TRANSCRIBE_BACKGROUND_RTF", "1.0"))  # Target RTF for spooled recordings
+ADAPTIVE_MAX_MODEL = os.getenv("TRANSCRIBE_ADAPTIVE_MAX_MODEL", "")  # Largest model (default: the selected one)
+ADAPTIVE_MIN_MODEL = os.getenv("TRANSCRIBE_ADAPTIVE_MIN_MODEL", "tiny")
+ADAPTIVE_LOG = os.getenv("TRANSCRIBE_ADAPTIVE_LOG", "")  # JSON-lines file every decision is appended to
+
+DOWNGRADE_AT = 0.9            # Step down once a rung is predicted above this share of the target...
+UPGRADE_HEADROOM = 0.6        # ...and up only when the better rung is predicted under this share
+SPEED_WEIGHT = 0.3            # Weight of the newest job in the machine-speed estimate
+CORRECTION_WEIGHT = 0.1       # ...and in each rung's learned correction to its prior cost
+MIN_BILLED_SECONDS = 5.0      # Short clips still pay for a whole 30 s encoder pass
+BEAM_COST = 2.0               # Prior cost of beam search (5 beams) relative to greedy decoding
+FALLBACK_COST = 1.15          # Prior cost of temperature fallback (occasional re-decodes)
+THREAD_EFFICIENCY_LOW = 0.6   # CPU time / (wall time x threads) below this: cores are contended
+THREAD_EFFICIENCY_HIGH = 0.85 # ...above this: the decode could use another core
+
+@dataclass(frozen=True)
+class Rung:
+    """One combination of model and decoding strategy."""
+    model: str
+    beam_size: int = None   # None: greedy
+    fallback: bool = True   # Retry at higher temperatures when a window fails Whisper's quality checks
+
+    @property
+    def name(self):
+        return f"{self.model}/{'beam' + str(self.beam_size) if self.beam_size else 'greedy'}" \
+               f"{'+fallback' if self.fallback else ''}"
+
+    @property
+    def cost(self):
+        """Prior decode cost relative to greedy 'base' without fallback."""
+        params = backends.MODEL_PARAMS_M.get(_model_size(self.model), backends.MODEL_PARAMS_M["base"])
+        return params / backends.MODEL_PARAMS_M["base"] * (BEAM_COST if self.beam_size else 1.0) \
+            * (FALLBACK_COST if self.fallback else 1.0)
+
+    def decode_options(self, backend=None):
+        options = {}
+        if self.beam_size:
+            options.update(beam_size=self.beam_size, best_of=self.beam_size)
+        elif (backend or backends.WHISPER_BACKEND) == "ctranslate2":
+            options["beam_size"] = 1  # faster-whisper defaults to beam search; openai-whisper to greedy
+        if not self.fallback:
+            options["temperature"] = 0.0
+        return options
+
+def _model_size(name):
+    """"small.en" -> "small", "large-v3" -> "large"."""
+    return name.split(".")[0].split("-")[0]
+
+def build_ladder(max_model, min_model=ADAPTIVE_MIN_MODEL):
+    """Rungs from most accurate to fastest: the largest model with beam search, then every model
+    greedy with and without fallback. (Beam search on a smaller model would cost more than
+    greedy decoding on the larger one.)"""
+    sizes = engine.MODEL_SIZES
+    top = sizes.index(_model_size(max_model)) if _model_size(max_model) in sizes else 0
+    bottom = sizes.index(min_model) if min_model in sizes else 0
+    models = [max_model] + [sizes[i] for i in range(top - 1, bottom - 1, -1)]
+    return [Rung(max_model, 5)] + [Rung(model, None, fallback) for model in models for fallback in (True, False)]
+
+def _default_threads():
+    return backends.INTRA_OP_THREADS or os.cpu_count() or 1
+
+def apply_threads(threads):
+    """Use `threads` intra-op threads for the next decode (PyTorch backends; CTranslate2 fixes them at load).
+
+    The setting is process-wide. Returns the previous count to restore, or None if nothing changed.
+    """
+    if threads and backends.WHISPER_BACKEND in ("torch", "int8") and "torch" in sys.modules:
+        torch = sys.modules["torch"]
+        previous = torch.get_num_threads()
+        torch.set_num_threads(threads)
+        return previous
+    return None
+
+class AdaptiveController:
+    """Chooses a Rung (and thread count) per job from the real-time factors of recent jobs."""
+
+    def __init__(self, target_seconds=ADAPTIVE_TARGET_SECONDS, background_rtf=ADAPTIVE_BACKGROUND_RTF,
+                 max_model=ADAPTIVE_MAX_MODEL, min_model=ADAPTIVE_MIN_MODEL, log_path=ADAPTIVE_LOG):
+        self.target_seconds = target_seconds
+        self.background_rtf = background_rtf
+        self.max_model = max_model
+        self.min_model = min_model
+        self.log_path = log_path
+        self.speed = None        # EWMA of RTF / rung cost: how slow the machine is right now
+        self.corrections = {}    # Rung -> EWMA of measured / predicted RTF
+        self.ladder = None       # Rungs for the selected model, most accurate first
+        self.current = None      # Rung of the current level
+        self.typical_duration = None  # EWMA of dictated clip lengths
+        self.threads = _default_threads()
+        self.decisions = deque(maxlen=200)
+        self.lock = threading.Lock()
+        # Only resident models are used; missing ones are loaded in the background meanwhile
+        self.is_available = lambda model: model in engine.loaded_models
+        self.request_model = lambda model: model in engine.model_loading or engine.preload_model(model)
+
+    @property
+    def enabled(self):
+        return self.target_seconds > 0
+
+    def predict(self, rung, duration):
+        """Predicted decode seconds for `duration` seconds of audio on `rung`."""
+        rtf = self.speed * rung.cost * self.corrections.get(rung, 1.0)
+        return rtf * max(duration, MIN_BILLED_SECONDS)
+
+    def choose(self, duration, model_name=None, background=False):
+        """The rung and thread count to decode a recording of `duration` seconds with.
+
+        `model_name` is the selected model, the top of the ladder unless ADAPTIVE_MAX_MODEL is
+        set. The rung follows the current level, which record() moves with the load; a clip
+        too long to meet the target at that level gets a faster rung just for itself.
+        Background (spooled) recordings aim at a real-time factor instead of a latency.
+        """
+        model_name = model_name or engine.WHISPER_MODEL
+        ladder = build_ladder(self.max_model or model_name, self.min_model)
+        budget = duration * self.background_rtf if background else self.target_seconds
+        with self.lock:
+            if ladder != self.ladder:
+                # First job, or the selected model changed: start from Whisper's own defaults
+                default = Rung(model_name)
+                self.ladder, self.current = ladder, default if default in ladder else ladder[1]
+                self._log("start", f"starting at {self.current.name}", rung=self.current.name)
+            if not background:
+                self.typical_duration = duration if self.typical_duration is None else \
+                    self.typical_duration + SPEED_WEIGHT * (duration - self.typical_duration)
+            level = ladder.index(self.current)
+            if self.speed is not None and self.predict(self.current, duration) > budget * DOWNGRADE_AT:
+                predicted = self.predict(self.current, duration)
+                while level < len(ladder) - 1 and self.predict(ladder[level], duration) > budget * DOWNGRADE_AT:
+                    level += 1
+                self._log("clip", f"{duration:.1f}s recording on {ladder[level].name} ({self.current.name} "
+                          f"predicted {predicted:.2f}s, target {budget:.2f}s)", rung=ladder[level].name,
+                          level_rung=self.current.name, duration=duration, budget=budget, predicted=predicted)
+            return self._usable(ladder, level, budget, duration), self.threads
+
+    def _adapt_level(self):
+        """Move the level one way or the other when the typical clip no longer fits (or fits easily)."""
+        if self.speed is None or self.typical_duration is None:
+            return
+        ladder, typical, target = self.ladder, self.typical_duration, self.target_seconds
+        level = ladder.index(self.current)
+        predicted = self.predict(self.current, typical)
+        if predicted > target * DOWNGRADE_AT:
+            while level < len(ladder) - 1 and self.predict(ladder[level], typical) > target * DOWNGRADE_AT:
+                level += 1
+            kind, reason = "downgrade", f"{self.current.name} predicted {predicted:.2f}s"
+        elif level > 0 and self.predict(ladder[level - 1], typical) <= target * UPGRADE_HEADROOM:
+            level -= 1
+            kind, reason = "upgrade", f"{ladder[level].name} predicted {self.predict(ladder[level], typical):.2f}s"
+        else:
+            return
+        if ladder[level] == self.current:
+            return  # Already the fastest rung
+        self._log(kind, f"{kind} to {ladder[level].name}: {reason} for a typical {typical:.1f}s clip "
+                  f"(target {target:.2f}s)", rung=ladder[level].name, previous=self.current.name,
+                  typical_duration=typical, speed=self.speed)
+        self.current = ladder[level]
+        metrics.set_gauge("adaptive_level", level)
+
+    def _usable(self, ladder, level, budget, duration):
+        """ladder[level] if its model is resident, else the best resident rung that fits (or the fastest)."""
+        rung = ladder[level]
+        if self.is_available(rung.model):
+            return rung
+        self.request_model(rung.model)
+        resident = [r for r in ladder if self.is_available(r.model)]
+        if not resident:
+            return rung  # Nothing loaded yet: the first decode loads it anyway
+        fitting = [r for r in resident if self.speed is None or self.predict(r, duration) <= budget]
+        chosen = fitting[0] if fitting else resident[-1]
+        self._log("substitute", f"{rung.model} is still loading, using {chosen.name}", rung=chosen.name,
+                  wanted=rung.name)
+        return chosen
+
+    def record(self, rung, duration, decode_seconds, cpu_seconds=None, threads=None):
+        """Feed back a finished decode: its wall time and (optionally) the CPU time it used."""
+        if duration <= 0 or decode_seconds <= 0:
+            return
+        rtf = decode_seconds / max(duration, MIN_BILLED_SECONDS)
+        with self.lock:
+            correction = self.corrections.get(rung, 1.0)
+            if self.speed is None:
+                self.speed = rtf / (rung.cost * correction)
+            else:
+                predicted = self.speed * rung.cost * correction
+                self.corrections[rung] = correction + CORRECTION_WEIGHT * (rtf / predicted * correction - correction)
+                self.speed += SPEED_WEIGHT * (rtf / (rung.cost * self.corrections[rung]) - self.speed)
+            metrics.set_gauge("adaptive_rtf", rtf)
+            metrics.set_gauge("adaptive_speed", self.speed)
+            self._adapt_level()
+            if cpu_seconds is not None and threads:
+                self._adjust_threads(cpu_seconds / (decode_seconds * threads), threads)
+
+    def _adjust_threads(self, efficiency, threads):
+        if backends.WHISPER_BACKEND not in ("torch", "int8"):
+            return
+        cores = _default_threads()
+        if efficiency < THREAD_EFFICIENCY_LOW and threads > 1:
+            self.threads = max(1, threads // 2)
+        elif efficiency > THREAD_EFFICIENCY_HIGH and threads < cores:
+            self.threads = threads + 1
+        else:
+            return
+        self._log("threads", f"{threads} -> {self.threads} threads (CPU efficiency {efficiency:.0%})",
+                  threads=self.threads, previous=threads, efficiency=efficiency)
+
+    def _log(self, kind, message, **fields):
+        entry = {"time": time.time(), "kind": kind, "message": message, **fields}
+        self.decisions.append(entry)
+        metrics.increment("adaptive_decisions")
+        print(f"Adaptive decoding: {message}")
+        if self.log_path:
+            try:
+                with open(self.log_path, "a") as f:
+                    f.write(json.dumps(entry) + "\n")
+            except OSError as e:
+                print(f"Error writing adaptive decoding log: {e}")
+
+controller = AdaptiveController()
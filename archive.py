@@ -0,0 +1,264 @@
+"""Compressed audio archive: keep every recording, encoded off the critical path.
+
+Finished recordings are handed to a background worker, which encodes them after the
+transcript is on screen and then links the archive file to the transcript in the store.
+FLAC and Opus are written through the optional `soundfile` package. Without it, the
+in-house ".dza" codec is used. It is lossless: each one-second chunk of 16-bit samples goes
+through the fixed polynomial predictor (order 0-3, as in FLAC) that leaves the smallest
+residuals, and the residuals are zigzag-coded, split into low and high byte planes and
+zlib-compressed. A chunk index at the end of the file lets read() decode just the chunks
+that cover the requested range.
+"""
+import os
+import queue
+import struct
+import sys
+import threading
+import zlib
+from datetime import datetime
+
+import numpy as np
+
+import engine
+import metrics
+
+ARCHIVE_DIR = os.getenv("TRANSCRIBE_ARCHIVE_DIR")  # Archive every recording here (unset = off)
+ARCHIVE_FORMAT = os.getenv("TRANSCRIBE_ARCHIVE_FORMAT", "auto")  # flac, opus, dza or auto
+ARCHIVE_CHUNK_SECONDS = 1.0   # Audio per independently decodable .dza chunk
+ARCHIVE_ZLIB_LEVEL = 6
+ARCHIVE_NICE = 10             # Niceness of the encoder thread, so decoding keeps the CPU (Linux)
+FORMATS = ("flac", "opus", "dza")
+EXTENSIONS = {"flac": ".flac", "opus": ".opus", "dza": ".dza"}
+
+DZA_MAGIC = b"DZA1"
+DZA_HEADER = struct.Struct("<4sIHIQQ")  # magic, rate, channels, chunk frames, frames, index offset
+DZA_CHUNK_HEADER = struct.Struct("<IB")  # compressed length, predictor order
+DZA_MAX_ORDER = 3
+
+def _soundfile():
+    try:
+        import soundfile
+        return soundfile
+    except (ImportError, OSError):  # OSError: the package is there but libsndfile isn't
+        return None
+
+def resolve_format(name=ARCHIVE_FORMAT):
+    """The archive format to write: `name`, or for "auto" FLAC when soundfile is available, else dza."""
+    if name == "auto":
+        return "flac" if _soundfile() is not None else "dza"
+    if name not in FORMATS:
+        raise ValueError(f"Unknown archive format {name!r} (expected one of {', '.join(FORMATS)}, auto)")
+    if name != "dza" and _soundfile() is None:
+        raise ValueError(f"The {name} archive format needs soundfile (pip install soundfile)")
+    return name
+
+def to_int16(samples):
+    return (np.clip(samples, -1.0, 1.0) * 32767).astype(np.int16)
+
+def encode_chunk(samples):
+    """Compress int16 mono samples into one self-contained .dza chunk: (predictor order, data)."""
+    # The order-k residual is the k-th difference (with zeros before the chunk), in wrapping
+    # 16-bit arithmetic like the decoder's
+    zero = np.zeros(1, dtype=np.int16)
+    residuals = [samples.astype(np.int16, copy=False)]
+    for _ in range(DZA_MAX_ORDER):
+        residuals.append(np.diff(residuals[-1], prepend=zero))
+    order = int(np.argmin([np.abs(residual.astype(np.int32)).sum() for residual in residuals]))
+    residual = residuals[order]
+    zigzag = (residual.view(np.uint16) << 1) ^ (residual >> 15).view(np.uint16)
+    planes = zigzag.astype("<u2").view(np.uint8).reshape(-1, 2).T  # Low bytes, then high bytes
+    return order, zlib.compress(planes.tobytes(), ARCHIVE_ZLIB_LEVEL)
+
+def decode_chunk(order, data, frames):
+    planes = np.frombuffer(zlib.decompress(data), dtype=np.uint8).reshape(2, frames)
+    zigzag = planes.T.copy().view("<u2").reshape(-1).astype(np.uint16)
+    samples = ((zigzag >> 1) ^ (0 - (zigzag & 1))).view(np.int16)
+    for _ in range(order):
+        samples = np.cumsum(samples, dtype=np.int16)  # Undo one difference
+    return samples
+
+class DzaWriter:
+    """Streaming .dza encoder: write() float32 samples as they come, close() to finish the file."""
+
+    def __init__(self, path, rate=engine.RATE, chunk_seconds=ARCHIVE_CHUNK_SECONDS):
+        self.path = path
+        self.rate = rate
+        self.chunk_frames = int(rate * chunk_seconds)
+        self.frames = 0
+        self.offsets = []
+        self.pending = np.empty(0, dtype=np.int16)
+        self.file = open(path, "wb")
+        self.file.write(DZA_HEADER.pack(DZA_MAGIC, rate, 1, self.chunk_frames, 0, 0))
+
+    def write(self, samples):
+        self.pending = np.concatenate([self.pending, to_int16(samples)])
+        while len(self.pending) >= self.chunk_frames:
+            self._write_chunk(self.pending[:self.chunk_frames])
+            self.pending = self.pending[self.chunk_frames:]
+
+    def _write_chunk(self, chunk):
+        order, data = encode_chunk(chunk)
+        self.offsets.append(self.file.tell())
+        self.file.write(DZA_CHUNK_HEADER.pack(len(data), order))
+        self.file.write(data)
+        self.frames += len(chunk)
+
+    def close(self):
+        if self.file.closed:
+            return
+        if len(self.pending):
+            self._write_chunk(self.pending)
+            self.pending = self.pending[:0]
+        index_offset = self.file.tell()
+        self.file.write(np.array(self.offsets, dtype="<u8").tobytes())
+        self.file.seek(0)
+        self.file.write(DZA_HEADER.pack(DZA_MAGIC, self.rate, 1, self.chunk_frames, self.frames, index_offset))
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def read_dza(path, start=0.0, seconds=None):
+    """Samples [start, start + seconds) of a .dza file as float32; returns (samples, rate)."""
+    with open(path, "rb") as f:
+        magic, rate, _, chunk_frames, frames, index_offset = DZA_HEADER.unpack(f.read(DZA_HEADER.size))
+        if magic != DZA_MAGIC:
+            raise ValueError(f"{path} is not a .dza archive")
+        f.seek(index_offset)
+        offsets = np.frombuffer(f.read(8 * -(-frames // chunk_frames)), dtype="<u8")
+        first = min(int(start * rate), frames)
+        last = frames if seconds is None else min(first + int(seconds * rate), frames)
+        pieces = []
+        for index in range(first // chunk_frames, -(-last // chunk_frames)):
+            f.seek(int(offsets[index]))
+            length, order = DZA_CHUNK_HEADER.unpack(f.read(DZA_CHUNK_HEADER.size))
+            chunk = decode_chunk(order, f.read(length), min(chunk_frames, frames - index * chunk_frames))
+            lo = max(first - index * chunk_frames, 0)
+            pieces.append(chunk[lo:last - index * chunk_frames])
+    samples = np.concatenate(pieces) if pieces else np.empty(0, dtype=np.int16)
+    return (samples / 32768.0).astype(np.float32), rate
+
+def read(path, start=0.0, seconds=None):
+    """Samples [start, start + seconds) of an archive file (any format) as float32 mono; returns (samples, rate)."""
+    if path.endswith(".dza"):
+        return read_dza(path, start, seconds)
+    soundfile = _soundfile()
+    if soundfile is None:
+        raise ValueError(f"Reading {path} needs soundfile (pip install soundfile)")
+    with soundfile.SoundFile(path) as f:
+        f.seek(min(int(start * f.samplerate), f.frames))
+        samples = f.read(-1 if seconds is None else int(seconds * f.samplerate), dtype="float32", always_2d=True)
+        return samples.mean(axis=1), f.samplerate
+
+def _chunks(audio):
+    """A recording (float32 array or SpoolBuffer) one spool segment at a time."""
+    if isinstance(audio, engine.SpoolBuffer):
+        yield from audio.iter_segments()
+    else:
+        for start in range(0, len(audio), engine.SPOOL_SEGMENT_SECONDS * engine.RATE):
+            yield audio[start:start + engine.SPOOL_SEGMENT_SECONDS * engine.RATE]
+
+def encode(audio, path, fmt):
+    """Write a recording to `path` in `fmt`."""
+    if fmt == "dza":
+        with DzaWriter(path) as writer:
+            for chunk in _chunks(audio):
+                writer.write(chunk)
+        return
+    soundfile = _soundfile()
+    options = {"format": "FLAC", "subtype": "PCM_16"} if fmt == "flac" else {"format": "OGG", "subtype": "OPUS"}
+    # Opus runs at 48 kHz internally; libsndfile resamples 16 kHz input itself
+    with soundfile.SoundFile(path, "w", samplerate=engine.RATE, channels=1, **options) as f:
+        for chunk in _chunks(audio):
+            f.write(chunk)
+
+class Archiver:
+    """Background worker that encodes finished recordings into ARCHIVE_DIR.
+
+    submit() only queues the recording, so it never delays the transcript. A SpoolBuffer is
+    handed over and removed once it has been encoded. Files are written under a temporary
+    name and renamed when complete, so an interrupted encode never leaves a truncated archive.
+    """
+
+    def __init__(self, directory=ARCHIVE_DIR, fmt=ARCHIVE_FORMAT):
+        self.directory = directory
+        self.format = fmt
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return bool(self.directory)
+
+    def submit(self, audio, name=None, on_done=None):
+        """Queue a recording (float32 array or closed SpoolBuffer); on_done(path) runs after encoding."""
+        if name is None:
+            name = os.path.basename(audio.directory) if isinstance(audio, engine.SpoolBuffer) else \
+                datetime.now().strftime("recording_%Y%m%d_%H%M%S")
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._worker, daemon=True, name="archiver")
+                self._thread.start()
+        self._queue.put((audio, name, on_done))
+        metrics.set_gauge("archive_queue", self._queue.qsize())
+
+    def join(self):
+        """Wait until everything submitted so far is archived."""
+        self._queue.join()
+
+    def _path(self, name, fmt):
+        path = os.path.join(self.directory, name + EXTENSIONS[fmt])
+        counter = 1
+        while os.path.exists(path):
+            path = os.path.join(self.directory, f"{name}_{counter}{EXTENSIONS[fmt]}")
+            counter += 1
+        return path
+
+    def archive(self, audio, name):
+        """Encode one recording now; returns the archive path."""
+        fmt = resolve_format(self.format)
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(name, fmt)
+        tmp_path = path + ".tmp"
+        try:
+            with metrics.span("archive_encode"):
+                encode(audio, tmp_path, fmt)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        metrics.increment("archive_audio_seconds", len(audio) / engine.RATE)
+        metrics.increment("archive_bytes", os.path.getsize(path))
+        return path
+
+    def _worker(self):
+        if sys.platform.startswith("linux"):
+            try:
+                os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), ARCHIVE_NICE)
+            except (AttributeError, OSError):
+                pass
+        while True:
+            audio, name, on_done = self._queue.get()
+            try:
+                path = self.archive(audio, name)
+                print(f"Archived {len(audio) / engine.RATE:.1f}s of audio to {path}")
+                if isinstance(audio, engine.SpoolBuffer):
+                    audio.remove()
+                if on_done is not None:
+                    on_done(path)
+            except Exception as e:
+                print(f"Error archiving audio: {e}")
+                if isinstance(audio, engine.SpoolBuffer):
+                    # The spool is complete, so find_unfinished_spools() won't list it: say where it is
+                    print(f"Keeping {audio.directory} (turn it into a WAV with "
+                          f"'python transcribe.py recover {audio.directory}')")
+            finally:
+                metrics.set_gauge("archive_queue", self._queue.qsize())
+                self._queue.task_done()
+
+archiver = Archiver()
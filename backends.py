@@ -0,0 +1,149 @@
+"""Whisper inference backends, selected by WHISPER_BACKEND.
+
+Every backend loads a model whose transcribe(audio, **decode_options) returns a Whisper-style
+result ({"text", "segments", "language"}), so the rest of the pipeline doesn't care which
+one is active:
+
+- "torch":       openai-whisper in PyTorch fp32 (the reference implementation)
+- "int8":        the same model with its linear layers dynamically quantized to int8 (CPU)
+- "ctranslate2": CTranslate2 through the faster-whisper package (optional dependency)
+"""
+import os
+
+import numpy as np
+
+BACKENDS = ["torch", "int8", "ctranslate2"]
+WHISPER_BACKEND = os.getenv("WHISPER_BACKEND", "torch")
+INTRA_OP_THREADS = int(os.getenv("WHISPER_THREADS", "0"))           # Threads per operation (0 = library default)
+INTER_OP_THREADS = int(os.getenv("WHISPER_INTEROP_THREADS", "0"))   # Operations run in parallel (0 = default)
+CT2_COMPUTE_TYPE = os.getenv("WHISPER_CT2_COMPUTE_TYPE", "int8")     # CTranslate2 weight type
+
+# Approximate parameter counts (millions), for backends that don't expose their weights
+MODEL_PARAMS_M = {"tiny": 39, "base": 74, "small": 244, "medium": 769, "large": 1550}
+
+torch_threads_applied = False
+
+def set_backend(name):
+    """Make `name` the backend used for models loaded from now on."""
+    global WHISPER_BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f"unknown backend '{name}' (choose from {', '.join(BACKENDS)})")
+    WHISPER_BACKEND = name
+
+def configure_threads(intra=None, inter=None):
+    """Set the intra-op/inter-op thread counts used by models loaded from now on (0 = default)."""
+    global INTRA_OP_THREADS, INTER_OP_THREADS, torch_threads_applied
+    if intra is not None:
+        INTRA_OP_THREADS = intra
+    if inter is not None:
+        INTER_OP_THREADS = inter
+    torch_threads_applied = False
+
+def _apply_torch_threads():
+    """Pass the thread settings to PyTorch (inter-op only works before any parallel work starts)."""
+    global torch_threads_applied
+    if torch_threads_applied:
+        return
+    import torch
+    if INTRA_OP_THREADS > 0:
+        torch.set_num_threads(INTRA_OP_THREADS)
+    if INTER_OP_THREADS > 0:
+        try:
+            torch.set_num_interop_threads(INTER_OP_THREADS)
+        except RuntimeError as e:
+            print(f"Could not set inter-op threads: {e}")
+    torch_threads_applied = True
+
+# --------------------- PyTorch (fp32 and int8) --------------------- #
+def _load_torch(name):
+    import whisper
+    _apply_torch_threads()
+    return whisper.load_model(name)
+
+def _load_int8(name):
+    import torch
+    import whisper
+    _apply_torch_threads()
+    model = whisper.load_model(name, device="cpu")
+    # Whisper's Linear subclass only adds an fp16 cast; plain nn.Linear is what quantize_dynamic swaps
+    for module in model.modules():
+        if isinstance(module, whisper.model.Linear):
+            module.__class__ = torch.nn.Linear
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+def _warm_up_torch(model):
+    """Run a one-token decode on silence so the first real transcription skips lazy initialisation."""
+    import whisper
+    mel = whisper.log_mel_spectrogram(np.zeros(16000, dtype=np.float32), model.dims.n_mels)
+    mel = whisper.pad_or_trim(mel, whisper.audio.N_FRAMES).to(model.device)
+    options = whisper.DecodingOptions(language="en", without_timestamps=True, sample_len=1, fp16=False)
+    whisper.decode(model, mel, options)
+
+def _torch_size_mb(model):
+    """Resident size of the weights, counting int8-packed linear layers at their packed size."""
+    total = sum(p.numel() * p.element_size() for p in model.parameters())
+    for module in model.modules():
+        if callable(getattr(module, "weight", None)):  # Quantized layers expose weight() as a method
+            weight, bias = module.weight(), module.bias()
+            total += weight.numel() * weight.element_size()
+            total += bias.numel() * bias.element_size() if bias is not None else 0
+    return total / (1024 * 1024)
+
+# --------------------- CTranslate2 --------------------- #
+class CTranslate2Model:
+    """Adapter giving faster-whisper's WhisperModel the openai-whisper transcribe() interface."""
+
+    # openai-whisper decode options that faster-whisper accepts under the same name
+    PASSTHROUGH_OPTIONS = ["language", "task", "initial_prompt", "word_timestamps", "beam_size",
+                           "best_of", "patience", "temperature", "condition_on_previous_text",
+                           "compression_ratio_threshold", "no_speech_threshold", "suppress_tokens"]
+
+    def __init__(self, name):
+        from faster_whisper import WhisperModel
+        self.name = name
+        self.model = WhisperModel(name, device="cpu", compute_type=CT2_COMPUTE_TYPE,
+                                  cpu_threads=INTRA_OP_THREADS, num_workers=max(1, INTER_OP_THREADS))
+        bytes_per_weight = {"int8": 1, "int8_float32": 1, "int16": 2, "float16": 2}.get(CT2_COMPUTE_TYPE, 4)
+        self.size_mb = MODEL_PARAMS_M.get(name.split(".")[0], 0) * 1e6 * bytes_per_weight / (1024 * 1024)
+
+    def transcribe(self, audio_data, **decode_options):
+        options = {key: value for key, value in decode_options.items() if key in self.PASSTHROUGH_OPTIONS}
+        segments, info = self.model.transcribe(audio_data, **options)
+        result_segments = []
+        for segment in segments:  # A generator: decoding happens while iterating
+            entry = {"id": segment.id, "start": segment.start, "end": segment.end, "text": segment.text,
+                     "avg_logprob": segment.avg_logprob, "no_speech_prob": segment.no_speech_prob}
+            if segment.words:
+                entry["words"] = [{"word": word.word, "start": word.start, "end": word.end,
+                                   "probability": word.probability} for word in segment.words]
+            result_segments.append(entry)
+        return {"text": "".join(segment["text"] for segment in result_segments),
+                "segments": result_segments, "language": info.language}
+
+# --------------------- Dispatch --------------------- #
+def load_model(name, backend=None):
+    """Load Whisper model `name` with the given (default: active) backend."""
+    backend = backend or WHISPER_BACKEND
+    if backend == "torch":
+        return _load_torch(name)
+    if backend == "int8":
+        return _load_int8(name)
+    if backend == "ctranslate2":
+        try:
+            return CTranslate2Model(name)
+        except ImportError as e:
+            raise RuntimeError(f"the ctranslate2 backend needs faster-whisper ({e}); "
+                               f"install it with 'pip install faster-whisper'") from e
+    raise ValueError(f"unknown backend '{backend}' (choose from {', '.join(BACKENDS)})")
+
+def warm_up(model):
+    """Run a tiny decode so the first real transcription doesn't pay for lazy initialisation."""
+    if isinstance(model, CTranslate2Model):
+        model.transcribe(np.zeros(16000, dtype=np.float32), language="en")
+    else:
+        _warm_up_torch(model)
+
+def model_size_mb(model):
+    if isinstance(model, CTranslate2Model):
+        return model.size_mb
+    return _torch_size_mb(model)
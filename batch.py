@@ -0,0 +1,174 @@
+"""Headless batch transcription of audio files across a pool of worker processes."""
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import backends
+import engine
+import metrics
+
+BATCH_FORMATS = ["json", "srt", "txt"]
+
+def format_timestamp(seconds):
+    """Format seconds as an SRT timestamp (HH:MM:SS,mmm)."""
+    milliseconds = int(round(seconds * 1000))
+    hours, milliseconds = divmod(milliseconds, 3600000)
+    minutes, milliseconds = divmod(milliseconds, 60000)
+    secs, milliseconds = divmod(milliseconds, 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d},{milliseconds:03d}"
+
+def write_outputs(result, output_dir, formats):
+    """Write a batch result as JSON/SRT/TXT next to each other in output_dir."""
+    base = os.path.join(output_dir, os.path.splitext(os.path.basename(result["path"]))[0])
+    if "json" in formats:
+        with open(base + ".json", "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+    if "txt" in formats:
+        with open(base + ".txt", "w", encoding="utf-8") as f:
+            f.write(result["text"] + "\n")
+    if "srt" in formats:
+        with open(base + ".srt", "w", encoding="utf-8") as f:
+            for i, segment in enumerate(result["segments"], start=1):
+                f.write(f"{i}\n{format_timestamp(segment['start'])} --> "
+                        f"{format_timestamp(segment['end'])}\n{segment['text'].strip()}\n\n")
+
+def _fill_transcript(result, transcript):
+    """Copy the parts of a Whisper result that are written out into a batch result."""
+    result["cached"] = transcript.get("cached", False)
+    result["text"] = transcript.get("text", "").strip()
+    result["language"] = transcript.get("language")
+    result["segments"] = [
+        {"start": segment["start"], "end": segment["end"], "text": segment["text"].strip()}
+        for segment in transcript.get("segments", [])
+    ]
+
+def batch_transcribe_file(path):
+    """Transcribe one file in a pool worker, returning the result or the error it hit."""
+    result = {"path": path, "text": "", "segments": [], "language": None, "error": None}
+    try:
+        start = time.perf_counter()
+        audio_data = engine.load_audio_file(path)
+        result["load_time"] = time.perf_counter() - start
+        result["duration"] = len(audio_data) / engine.RATE
+
+        start = time.perf_counter()
+        transcript = engine.transcribe_cached(audio_data)
+        result["decode_time"] = time.perf_counter() - start
+        result["rtf"] = result["decode_time"] / result["duration"] if result["duration"] else None
+        _fill_transcript(result, transcript)
+    except Exception as e:
+        result["error"] = f"{e.__class__.__name__}: {str(e)}"
+    return result
+
+def batch_transcribe_group(paths, batch_size):
+    """Transcribe several files in a pool worker with their 30 s windows batched together.
+
+    The group's decode time is shared between its files in proportion to their duration.
+    """
+    results = []
+    recordings = []
+    for path in paths:
+        result = {"path": path, "text": "", "segments": [], "language": None, "error": None}
+        try:
+            start = time.perf_counter()
+            recordings.append(engine.load_audio_file(path))
+            result["load_time"] = time.perf_counter() - start
+            result["duration"] = len(recordings[-1]) / engine.RATE
+        except Exception as e:
+            result["error"] = f"{e.__class__.__name__}: {str(e)}"
+        results.append(result)
+    loaded = [result for result in results if result["error"] is None]
+    if not loaded:
+        return results
+
+    try:
+        start = time.perf_counter()
+        transcripts = engine.transcribe_many_cached(recordings, batch_size=batch_size)
+        decode_time = time.perf_counter() - start
+    except Exception as e:
+        for result in loaded:
+            result["error"] = f"{e.__class__.__name__}: {str(e)}"
+        return results
+    total_duration = sum(result["duration"] for result in loaded) or 1.0
+    for result, transcript in zip(loaded, transcripts):
+        result["decode_time"] = decode_time * result["duration"] / total_duration
+        result["rtf"] = result["decode_time"] / result["duration"] if result["duration"] else None
+        _fill_transcript(result, transcript)
+    return results
+
+def run_batch(paths, output_dir=None, formats=BATCH_FORMATS, workers=1, model_name=None, batch_size=1):
+    """Transcribe files across a process pool; a failing file is reported, not fatal.
+
+    With batch_size > 1 each job takes that many files and decodes their 30 s windows in
+    batches of batch_size instead of running transcribe() file by file.
+    """
+    model_name = model_name or engine.WHISPER_MODEL
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(os.path.join(path, name) for name in sorted(os.listdir(path))
+                         if os.path.isfile(os.path.join(path, name)))
+        else:
+            files.append(path)
+    if not files:
+        print("No input files found.")
+        return 1
+
+    # Split the cores between workers unless a per-worker thread count was configured
+    threads = backends.INTRA_OP_THREADS or max(1, (os.cpu_count() or 1) // workers)
+    print(f"Transcribing {len(files)} files with {workers} workers "
+          f"({threads} threads each, model '{model_name}', {backends.WHISPER_BACKEND} backend"
+          f"{f', batches of {batch_size} windows' if batch_size > 1 else ''})")
+
+    failures = 0
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=engine.init_worker_process,
+                             initargs=(model_name, threads, backends.WHISPER_BACKEND,
+                                       backends.INTER_OP_THREADS)) as pool:
+        if batch_size > 1:
+            futures = {pool.submit(batch_transcribe_group, files[i:i + batch_size], batch_size):
+                       files[i:i + batch_size] for i in range(0, len(files), batch_size)}
+        else:
+            futures = {pool.submit(batch_transcribe_file, path): [path] for path in files}
+        done = 0
+        for future in as_completed(futures):
+            group = futures[future]
+            try:
+                results = future.result()
+            except Exception as e:
+                # The worker itself died (e.g. crashed while decoding)
+                results = [{"path": path, "error": f"{e.__class__.__name__}: {str(e)}"} for path in group]
+            if isinstance(results, dict):
+                results = [results]
+            done += len(group)
+            metrics.set_gauge("batch_pending_files", len(files) - done)
+            for result in results:
+                path = result["path"]
+                if not result["error"] and not result.get("duration"):
+                    result["error"] = "no audio (empty or zero-length file)"
+                if result["error"]:
+                    failures += 1
+                    metrics.increment("batch_failures")
+                    print(f"FAILED {path}: {result['error']}")
+                    continue
+                try:
+                    out_dir = output_dir or os.path.dirname(os.path.abspath(path))
+                    os.makedirs(out_dir, exist_ok=True)
+                    write_outputs(result, out_dir, formats)
+                    # Stage times measured in the worker process
+                    metrics.record_span("file_load", result["load_time"])
+                    metrics.record_span("file_transcribe", result["decode_time"])
+                    metrics.increment("cache_hits" if result["cached"] else "cache_misses")
+                    rtf = f" (RTF {result['rtf']:.2f})" if result["rtf"] is not None else ""
+                    print(f"OK     {path}: {result['duration']:.1f}s audio, load {result['load_time']:.2f}s, "
+                          f"decode {result['decode_time']:.2f}s{rtf}{' [cached]' if result['cached'] else ''}")
+                except Exception as e:
+                    # One unusable result (e.g. an unwritable output directory) doesn't end the run
+                    failures += 1
+                    metrics.increment("batch_failures")
+                    print(f"FAILED {path}: {e.__class__.__name__}: {str(e)}")
+
+    elapsed = time.perf_counter() - start
+    print(f"\nDone: {len(files) - failures} succeeded, {failures} failed in {elapsed:.1f}s")
+    return 1 if failures else 0
@@ -0,0 +1,845 @@
+"""Benchmarks for the capture-to-text hot paths, runnable without a microphone.
+
+Synthetic (or recorded) PCM is fed block by block through engine.capture_block(), the same
+call the audio callback makes, and then through the same steps a transcription job takes
+after Stop. Results are written as JSON so runs from different commits can be compared:
+
+    python bench.py run --models tiny,base --lengths 10,60,300 -o before.json
+    python bench.py compare before.json after.json
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+
+import adaptive
+import archive
+import backends
+import devices
+import engine
+import meeting
+import mel
+import store
+
+DEFAULT_MODELS = "tiny,base"
+DEFAULT_LENGTHS = "10,60,300"
+REGRESSION_THRESHOLD = 0.10  # Relative slowdown flagged by `compare`
+
+# --------------------- Measurement helpers --------------------- #
+def current_rss_mb():
+    """Resident set size of this process in MB."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError):
+        # Not Linux: fall back to the lifetime peak (KB on Linux, bytes on macOS)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+class PeakRSS:
+    """Context manager sampling RSS on a background thread and recording the peak."""
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.peak_mb = 0.0
+        self._stop = threading.Event()
+
+    def _sample(self):
+        while not self._stop.is_set():
+            self.peak_mb = max(self.peak_mb, current_rss_mb())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak_mb = current_rss_mb()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak_mb = max(self.peak_mb, current_rss_mb())
+
+def synthetic_speech(seconds, seed=0):
+    """Speech-like test signal: harmonic voiced bursts at syllable rate, pauses and low noise."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * engine.RATE)) / engine.RATE
+    f0 = 120 + 30 * np.sin(2 * np.pi * 0.5 * t)
+    phase = np.cumsum(2 * np.pi * f0 / engine.RATE)
+    voiced = sum(np.sin(k * phase) / k for k in range(1, 9))
+    envelope = np.clip(np.sin(2 * np.pi * 4 * t), 0, 1)
+    envelope *= (t % 6) < 4.5  # 1.5 s pause every 6 s
+    noise = rng.standard_normal(len(t))
+    return (0.15 * voiced * envelope + 0.003 * noise).astype(np.float32)
+
+def load_source(path, seconds):
+    """Audio of exactly `seconds`: a recording looped/trimmed to length, or synthetic speech."""
+    if path is None:
+        return synthetic_speech(seconds)
+    audio_data = engine.load_audio_file(path)
+    reps = int(np.ceil(seconds * engine.RATE / len(audio_data)))
+    return np.tile(audio_data, reps)[:int(seconds * engine.RATE)]
+
+def environment_info():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ""
+    info = {
+        "commit": commit or None,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    try:
+        import torch
+        info["torch"] = torch.__version__
+        info["torch_threads"] = torch.get_num_threads()
+    except ImportError:
+        pass
+    return info
+
+# --------------------- Benchmarks --------------------- #
+def bench_model_load(model_name):
+    """Cold load + warm-up time for one model, dropping any resident copy first."""
+    engine.loaded_models.pop(model_name, None)
+    with PeakRSS() as rss:
+        engine.get_model(model_name)
+    entry = engine.loaded_models[model_name]
+    return {
+        "model": model_name,
+        "backend": entry["backend"],
+        "load_seconds": entry["load_time"],
+        "warmup_seconds": entry["warmup_time"],
+        "weights_mb": entry["size_mb"],
+        "peak_rss_mb": rss.peak_mb,
+    }
+
+def wait_for_queue_space():
+    """Block until the capture queue has a free slot.
+
+    Benchmarks produce audio much faster than real time; without this the queue would fill
+    and drop blocks after CAPTURE_QUEUE_SECONDS of audio.
+    """
+    while len(engine.capture_queue) >= engine.capture_queue.slots:
+        time.sleep(engine.CONSUMER_POLL_SECONDS / 10)
+
+def bench_capture(audio_data, long_recording):
+    """Feed audio through capture_block() in CHUNK_SIZE blocks; returns the buffer and per-block timings."""
+    buffer = engine.start_capture(long_recording)
+    block_times = []
+    for i in range(0, len(audio_data), engine.CHUNK_SIZE):
+        block = audio_data[i:i + engine.CHUNK_SIZE].reshape(-1, 1)  # Callback blocks are (frames, channels)
+        wait_for_queue_space()
+        start = time.perf_counter()
+        engine.capture_block(block)
+        block_times.append(time.perf_counter() - start)
+    engine.finish_capture()
+    block_times = np.array(block_times) * 1e6
+    return buffer, {
+        "blocks": len(block_times),
+        "block_us_mean": float(block_times.mean()),
+        "block_us_p99": float(np.percentile(block_times, 99)),
+        "block_us_max": float(block_times.max()),
+    }
+
+def bench_case(model_name, seconds, source_path, repeat):
+    """Capture, assembly, VAD and decode timings for one model and recording length."""
+    audio_data = load_source(source_path, seconds)
+    long_recording = seconds > engine.MAX_RECORDING_SECONDS
+    result = {"model": model_name, "backend": backends.WHISPER_BACKEND, "seconds": seconds,
+              "long_recording": long_recording}
+    latencies = []
+    for _ in range(repeat):
+        # Capture is timed without the RSS sampler, whose thread would compete for the GIL
+        buffer, capture_stats = bench_capture(audio_data, long_recording)
+        with PeakRSS() as rss:
+            # Everything below mirrors what happens after Stop
+            stopped = time.perf_counter()
+            if long_recording:
+                assembly_seconds = 0.0  # Spooled audio is read window by window while decoding
+                vad_start = time.perf_counter()
+                engine.speech_segments(buffer.read(0, int(engine.LONG_WINDOW_SECONDS * engine.RATE)))
+                vad_seconds = time.perf_counter() - vad_start
+                engine.transcribe_long(buffer, model_name)
+                buffer.remove()
+            else:
+                start = time.perf_counter()
+                recorded, mel_stream = engine.take_recording()
+                np.max(np.abs(recorded))
+                assembly_seconds = time.perf_counter() - start
+                vad_start = time.perf_counter()
+                engine.speech_segments(recorded)
+                vad_seconds = time.perf_counter() - vad_start
+                engine.transcribe_audio(recorded, model_name, mel_stream)
+            latencies.append(time.perf_counter() - stopped)
+        result.update(capture_stats)
+        result["assembly_seconds"] = assembly_seconds
+        result["vad_seconds"] = vad_seconds
+        result["peak_rss_mb"] = max(result.get("peak_rss_mb", 0.0), rss.peak_mb)
+
+    result["latency_after_stop_seconds"] = float(np.median(latencies))
+    result["latency_after_stop_min"] = float(np.min(latencies))
+    result["rtf"] = result["latency_after_stop_seconds"] / seconds
+    return result
+
+def run_benchmarks(models, lengths, source_path=None, repeat=1, backend_names=None):
+    report = {"environment": environment_info(), "source": source_path or "synthetic",
+              "model_loads": [], "results": []}
+    report["environment"]["intra_op_threads"] = backends.INTRA_OP_THREADS
+    report["environment"]["inter_op_threads"] = backends.INTER_OP_THREADS
+    for backend in backend_names or [backends.WHISPER_BACKEND]:
+        engine.set_backend(backend)
+        for model_name in models:
+            print(f"Loading {model_name} ({backend})...", file=sys.stderr)
+            report["model_loads"].append(bench_model_load(model_name))
+            engine.set_active_model(model_name)
+            for seconds in lengths:
+                print(f"  {backend} / {model_name} / {seconds:g}s", file=sys.stderr)
+                report["results"].append(bench_case(model_name, seconds, source_path, repeat))
+            # Free this model before loading the next so peak RSS stays per-model
+            engine.loaded_models.pop(model_name, None)
+    return report
+
+# --------------------- Device-rate capture --------------------- #
+def bench_resample(rates, channels_list, seconds=60.0):
+    """CPU cost of native-rate capture: callback-side enqueue and converter-side resampling."""
+    results = []
+    speech = synthetic_speech(seconds)
+    for rate in rates:
+        # Resample the 16 kHz test signal up to the device rate by linear interpolation
+        t = np.arange(int(seconds * rate)) / rate
+        device_audio = np.interp(t, np.arange(len(speech)) / engine.RATE, speech).astype(np.float32)
+        for channels in channels_list:
+            blocks = np.repeat(device_audio[:, None], channels, axis=1)
+            block_size = engine.block_frames(rate)
+            engine.start_capture(False, rate, channels)
+            callback_times = []
+            cpu_start = time.process_time()
+            start = time.perf_counter()
+            for i in range(0, len(blocks), block_size):
+                block = blocks[i:i + block_size]
+                wait_for_queue_space()
+                block_start = time.perf_counter()
+                engine.capture_block(block)
+                callback_times.append(time.perf_counter() - block_start)
+            engine.finish_capture()
+            wall = time.perf_counter() - start
+            cpu = time.process_time() - cpu_start
+            callback_times = np.array(callback_times) * 1e6
+            results.append({
+                "rate": rate,
+                "channels": channels,
+                "audio_seconds": seconds,
+                "output_seconds": engine.capture_buffer.duration,
+                "callback_us_mean": float(callback_times.mean()),
+                "callback_us_p99": float(np.percentile(callback_times, 99)),
+                "cpu_seconds": cpu,
+                "cpu_percent_of_realtime": 100 * cpu / seconds,
+                "wall_seconds": wall,
+            })
+    return results
+
+def bench_live_capture(device, seconds, native):
+    """Record from a real device for `seconds`, counting callback overflows and CPU time."""
+    import sounddevice as sd
+    info = sd.query_devices(device=device, kind=None if device is not None else "input")
+    if native:
+        rate = int(info["default_samplerate"])
+        channels = max(1, min(info["max_input_channels"], engine.CAPTURE_MAX_CHANNELS))
+    else:
+        rate, channels = engine.RATE, engine.CHANNELS
+    def callback(indata, frames, time_info, status):
+        engine.capture_block(indata, status)
+
+    engine.start_capture(False, rate, channels)
+    cpu_start = time.process_time()
+    with sd.InputStream(samplerate=rate, channels=channels, callback=callback, device=device,
+                        dtype="float32", blocksize=engine.block_frames(rate), latency="high"):
+        time.sleep(seconds)
+    block_queue = engine.capture_queue
+    engine.finish_capture()
+    cpu = time.process_time() - cpu_start
+    overflows = block_queue.overflows
+    return {"device": info["name"], "mode": "native" if native else "forced_16k", "rate": rate,
+            "channels": channels, "seconds": seconds, "overflows": overflows,
+            "captured_seconds": engine.capture_buffer.duration,
+            "cpu_percent_of_realtime": 100 * cpu / seconds}
+
+def bench_devices(lookups=1000):
+    """Device lookup cost: a per-device query like the old startup listing, a registry
+    enumeration and rate probe, and the cached resolve() every Record press now makes."""
+    import sounddevice as sd
+    start = time.perf_counter()
+    for i, info in enumerate(sd.query_devices()):
+        sd.query_devices(device=i)
+    per_device_query = time.perf_counter() - start
+    registry = devices.DeviceRegistry(state_file=os.devnull)
+    start = time.perf_counter()
+    registry.refresh()
+    enumerate_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    registry.probe_rates()
+    probe_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(lookups):
+        registry.resolve()
+    return {"input_devices": len(registry.devices()), "per_device_query_ms": per_device_query * 1000,
+            "registry_enumerate_ms": enumerate_seconds * 1000, "rate_probe_ms": probe_seconds * 1000,
+            "cached_resolve_us": (time.perf_counter() - start) / lookups * 1e6}
+
+# --------------------- Push-to-talk --------------------- #
+def bench_push_to_talk(seconds=20.0, record_at=5.0, pause_at=8.0, resume_at=10.0, stop_at=14.0):
+    """Drive an armed capture through Record, Pause, Resume and Stop with numbered samples.
+
+    Checks that the recording holds exactly the pre-roll plus the blocks after each keypress,
+    and times the keypress handlers (which should only move the recording window).
+    """
+    total = int(seconds * engine.RATE)
+    expected = (np.arange(total) / 2 ** 24).astype(np.float32)
+    block = engine.CHUNK_SIZE
+    actions = {int(record_at * engine.RATE) // block: lambda: engine.start_segment(),
+               int(pause_at * engine.RATE) // block: engine.pause_segment,
+               int(resume_at * engine.RATE) // block: lambda: engine.start_segment(resume=True),
+               int(stop_at * engine.RATE) // block: engine.end_segment}
+    engine.arm_capture()
+    keypress_times = []
+    for index, i in enumerate(range(0, total, block)):
+        wait_for_queue_space()
+        if index in actions:
+            start = time.perf_counter()
+            actions[index]()
+            keypress_times.append(time.perf_counter() - start)
+        engine.capture_block(expected[i:i + block].reshape(-1, 1))
+    recorded = engine.capture_buffer.view().copy()
+    engine.disarm_capture()
+
+    preroll = len(engine.preroll_buffer.data)
+    starts = sorted(actions)
+    expected_recording = np.concatenate([expected[max(0, starts[0] * block - preroll):starts[1] * block],
+                                         expected[max(0, starts[2] * block - preroll):starts[3] * block]])
+    keypress_times = np.array(keypress_times[:3]) * 1e6  # end_segment also waits for the drain
+    return {
+        "seconds": seconds,
+        "preroll_seconds": preroll / engine.RATE,
+        "recorded_seconds": len(recorded) / engine.RATE,
+        "keypress_us_max": float(keypress_times.max()),
+        "samples_match": bool(np.array_equal(recorded, expected_recording)),
+    }
+
+# --------------------- Meeting capture --------------------- #
+# (rate, channels, tracks, clock error in ppm, stream start in s): a stereo interface with a
+# speaker per channel, and a USB microphone whose clock runs slow and that starts later
+MEETING_DEVICES = ((48000, 2, (0, 1), 150.0, 0.013), (44100, 1, (None,), -90.0, 0.270))
+MEETING_LATENCY_SECONDS = 0.005  # Callback latency after a block's last frame
+MEETING_JITTER_SECONDS = 0.002   # Mean extra scheduling delay
+MEETING_TOLERANCE_MS = 20.0      # Largest acceptable misalignment between tracks
+
+def _marker_onsets(track_audio, min_gap_seconds=1.0, threshold=0.15):
+    """Sample indices where a marker burst starts in a 16 kHz track."""
+    loud = np.flatnonzero(np.abs(track_audio) > threshold)
+    if len(loud) == 0:
+        return loud
+    return loud[np.concatenate(([True], np.diff(loud) > min_gap_seconds * engine.RATE))]
+
+def bench_meeting(seconds=120.0, marker_every=7.0, drop_at=40.0, drop_blocks=3, seed=0):
+    """Feed drifting devices through meeting.DeviceCapture and check they line up on one timeline.
+
+    Every track gets a 20 ms tone burst at the same meeting times. Each device's clock runs
+    off nominal by its ppm error, its callbacks arrive with latency and jitter, and the first
+    device drops a few blocks mid-meeting. Reports the largest marker misalignment using the
+    fitted clocks, and using nominal rates from the first callback for comparison.
+    """
+    import tempfile
+    rng = np.random.default_rng(seed)
+    marker_times = np.arange(3.0, seconds - 1.0, marker_every)
+    burst = 0.5 * np.sin(2 * np.pi * 1000 * np.arange(int(0.02 * 48000)) / 48000)
+    errors, nominal_errors, drifts, lengths_match = [], [], [], True
+    with tempfile.TemporaryDirectory() as directory:
+        devices = []
+        for d, (rate, channels, track_channels, ppm, origin) in enumerate(MEETING_DEVICES):
+            tracks = [meeting.Track(f"dev{d}-{i}", channel, os.path.join(directory, f"dev{d}_{i}"), rate)
+                      for i, channel in enumerate(track_channels)]
+            device = meeting.DeviceCapture(f"dev{d}", rate, channels, tracks)
+            device.start()
+            true_rate = rate * (1 + ppm * 1e-6)
+            frames = int((seconds - origin) * true_rate)
+            signal = np.zeros((frames, channels), dtype=np.float32)
+            for t in marker_times:
+                first = int(round((t - origin) * true_rate))
+                burst_at_rate = np.interp(np.arange(int(0.02 * rate)) / rate, np.arange(len(burst)) / 48000, burst)
+                signal[first:first + len(burst_at_rate)] = burst_at_rate[:, None]
+            block = engine.block_frames(rate)
+            drop_start = int((drop_at - origin) * true_rate) // block * block if d == 0 else -1
+            first_arrival = None
+            for start in range(0, frames, block):
+                chunk = signal[start:start + block]
+                arrival = (origin + (start + len(chunk)) / true_rate + MEETING_LATENCY_SECONDS
+                           + rng.exponential(MEETING_JITTER_SECONDS))
+                first_arrival = arrival if first_arrival is None else first_arrival
+                if drop_start <= start < drop_start + drop_blocks * block:
+                    device.queue.received += len(chunk)  # What push() does when the ring is full
+                    device.queue.dropped += 1
+                    continue
+                while len(device.queue) >= device.queue.slots:
+                    time.sleep(engine.CONSUMER_POLL_SECONDS / 10)
+                device.queue.push(chunk, arrival)
+            device.stop()
+            nominal_origin = first_arrival - block / rate
+            lengths_match &= all(abs(len(track.spool) - frames * engine.RATE / rate) < engine.RATE * 0.01
+                                 for track in tracks)
+            drifts.append(device.clock.drift_ppm() - ppm)
+            for track in tracks:
+                onsets = _marker_onsets(track.spool.view())
+                if len(onsets) != len(marker_times):
+                    errors.append(float("inf"))
+                    continue
+                track_seconds = onsets / engine.RATE
+                mapped = np.array([device.to_meeting_time(track, x, 0.0) for x in track_seconds])
+                nominal = nominal_origin + track_seconds - track.delay_seconds
+                errors.extend(np.abs(mapped - marker_times))
+                nominal_errors.extend(np.abs(nominal - marker_times))
+            devices.append(device)
+    return {"seconds": seconds, "devices": len(devices), "tracks": sum(len(device.tracks) for device in devices),
+            "drift_error_ppm_max": float(np.max(np.abs(drifts))),
+            "gap_seconds": devices[0].gap_frames / devices[0].input_rate,
+            "align_error_ms_max": float(np.max(errors)) * 1000,
+            "nominal_error_ms_max": float(np.max(nominal_errors)) * 1000,
+            "lengths_match": bool(lengths_match)}
+
+# --------------------- Adaptive decoding --------------------- #
+ADAPTIVE_PHASES = (("idle", 1.0, 0.9), ("loaded", 3.0, 0.45), ("idle again", 1.0, 0.9))  # (name, slowdown, CPU efficiency)
+
+def bench_adaptive(jobs_per_phase=40, target=2.0, model_name="small", base_rtf=0.06, seed=0):
+    """Run the adaptive controller against a simulated decoder through idle, loaded and idle phases.
+
+    A rung's simulated decode time is base_rtf x its cost x the phase's slowdown x noise, so
+    this checks the control loop itself (no model is loaded). Reports, per phase, how often
+    a dictated clip missed the latency target and which rungs were used.
+    """
+    rng = np.random.default_rng(seed)
+    controller = adaptive.AdaptiveController(target_seconds=target, max_model=model_name, log_path="")
+    controller.is_available = lambda model: True
+    results = []
+    for phase, slowdown, efficiency in ADAPTIVE_PHASES:
+        misses, latencies, rungs = 0, [], {}
+        for _ in range(jobs_per_phase):
+            duration = float(rng.uniform(3.0, 20.0))
+            rung, threads = controller.choose(duration, model_name)
+            decode = (base_rtf * rung.cost * slowdown * rng.lognormal(0.0, 0.15)
+                      * max(duration, adaptive.MIN_BILLED_SECONDS))
+            controller.record(rung, duration, decode, decode * threads * efficiency, threads)
+            misses += decode > target
+            latencies.append(decode)
+            rungs[rung.name] = rungs.get(rung.name, 0) + 1
+        results.append({"phase": phase, "jobs": jobs_per_phase, "target_seconds": target,
+                        "missed": misses, "latency_p90": float(np.percentile(latencies, 90)),
+                        "threads": controller.threads,
+                        "rungs": ",".join(f"{name}:{count}" for name, count in sorted(rungs.items()))})
+    results.append({"phase": "total", "decisions": len(controller.decisions)})
+    return results
+
+# --------------------- Transcript search --------------------- #
+SEARCH_VOCABULARY = ("meeting budget schedule client report deadline invoice project review design "
+                     "server release customer contract launch quarter update team hiring travel "
+                     "onboarding roadmap feedback migration database").split()
+
+def bench_search(recordings=5000, queries=200, seed=0):
+    """Fill a temporary transcript store with synthetic dictations and time searches."""
+    import tempfile
+    rng = np.random.default_rng(seed)
+    with tempfile.TemporaryDirectory() as directory:
+        connection = store.connect(os.path.join(directory, "transcripts.db"))
+        start = time.perf_counter()
+        for _ in range(recordings):
+            segments = []
+            t = 0.0
+            for _ in range(int(rng.integers(2, 8))):
+                words = [{"word": " " + str(rng.choice(SEARCH_VOCABULARY)), "start": t + 0.3 * i,
+                          "end": t + 0.3 * i + 0.25} for i in range(int(rng.integers(5, 15)))]
+                segments.append({"start": t, "end": words[-1]["end"], "words": words,
+                                 "text": "".join(word["word"] for word in words)})
+                t = words[-1]["end"] + 0.5
+            store.save({"text": " ".join(segment["text"] for segment in segments), "segments": segments},
+                       t, "bench", connection=connection)
+        insert_seconds = time.perf_counter() - start
+        terms = rng.choice(SEARCH_VOCABULARY, size=(queries, 2))
+        times = []
+        hits = 0
+        for first, second in terms:
+            start = time.perf_counter()
+            hits += len(store.search(f"{first} {second[:4]}", 20, connection=connection))
+            times.append(time.perf_counter() - start)
+        connection.close()
+        size_mb = os.path.getsize(os.path.join(directory, "transcripts.db")) / (1024 * 1024)
+    times = np.array(times) * 1000
+    return {"recordings": recordings, "queries": queries, "insert_ms_per_recording": insert_seconds * 1000 / recordings,
+            "search_ms_p50": float(np.percentile(times, 50)), "search_ms_p99": float(np.percentile(times, 99)),
+            "hits_per_query": hits / queries, "db_mb": size_mb}
+
+# --------------------- Audio archive --------------------- #
+def bench_archive(seconds=600.0, source_path=None, formats=None):
+    """Encode a recording in each archive format: compression against 16-bit WAV, CPU per hour
+    of audio, the cost of submit() on the transcription path, and a 10 s read from the middle."""
+    import tempfile
+    audio_data = load_source(source_path, seconds)
+    wav_bytes = 2 * len(audio_data)
+    if formats is None:
+        formats = ["dza"] + (["flac", "opus"] if archive._soundfile() is not None else [])
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for fmt in formats:
+            path = os.path.join(directory, "recording" + archive.EXTENSIONS[fmt])
+            cpu_start, wall_start = time.process_time(), time.perf_counter()
+            archive.encode(audio_data, path, fmt)
+            cpu_seconds, wall_seconds = time.process_time() - cpu_start, time.perf_counter() - wall_start
+            start = time.perf_counter()
+            decoded, _ = archive.read(path, seconds / 2, 10.0)
+            read_ms = (time.perf_counter() - start) * 1000
+            full, _ = archive.read(path)
+            expected = archive.to_int16(audio_data) / 32768.0
+            results.append({"format": fmt, "seconds": seconds, "ratio": wav_bytes / os.path.getsize(path),
+                            "mb_per_hour": os.path.getsize(path) / seconds * 3600 / (1024 * 1024),
+                            "cpu_seconds_per_hour": cpu_seconds / seconds * 3600,
+                            "encode_x_realtime": seconds / wall_seconds, "read_10s_ms": read_ms,
+                            "lossless": len(full) == len(expected) and bool(np.array_equal(full, expected)),
+                            "read_samples_match": len(decoded) == 10 * engine.RATE})
+        # What the transcription path pays: queueing only, the encode runs on the archiver thread
+        archiver = archive.Archiver(directory, "dza")
+        start = time.perf_counter()
+        archiver.submit(audio_data, "submitted")
+        submit_ms = (time.perf_counter() - start) * 1000
+        archiver.join()
+    for r in results:
+        r["submit_ms"] = submit_ms
+    return results
+
+# --------------------- Precomputed mel features --------------------- #
+MEL_TOLERANCE = 1e-3  # Largest acceptable difference from Whisper's normalised log-mel values
+
+def bench_mel(lengths, n_mels=80):
+    """Check capture-time log-mel features against Whisper's and time what is left after Stop.
+
+    Each recording goes through the capture path, so MelStream sees the same blocks as in
+    the app. The reference is whisper.audio.log_mel_spectrogram() when Whisper is installed,
+    otherwise the one-shot NumPy computation.
+    """
+    try:
+        from whisper.audio import log_mel_spectrogram
+
+        def reference(audio_data):
+            return log_mel_spectrogram(audio_data, n_mels, padding=mel.N_SAMPLES).numpy()
+        reference_name = "whisper"
+    except ImportError:
+        def reference(audio_data):
+            return mel.log_mel_spectrogram(audio_data, n_mels, padding=mel.N_SAMPLES)
+        reference_name = "numpy"
+
+    results = []
+    for seconds in lengths:
+        audio_data = synthetic_speech(seconds)
+        engine.start_capture(False)
+        engine.capture_mel = mel.MelStream(n_mels, engine.MAX_RECORDING_SECONDS)
+        cpu_start = time.process_time()
+        for i in range(0, len(audio_data), engine.CHUNK_SIZE):
+            wait_for_queue_space()
+            engine.capture_block(audio_data[i:i + engine.CHUNK_SIZE].reshape(-1, 1))
+        engine.finish_capture()
+        capture_cpu = time.process_time() - cpu_start
+        recorded = engine.capture_buffer.view()
+
+        start = time.perf_counter()
+        expected = reference(recorded)
+        reference_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        features = engine.capture_mel.features(recorded)
+        finish_seconds = time.perf_counter() - start
+
+        # The VAD path concatenates speech regions; frames at the joins are recomputed
+        regions = engine.speech_segments(recorded)
+        speech = np.concatenate([recorded[a:b] for a, b in regions]) if regions else recorded[:0]
+        speech_error = float(np.abs(engine.capture_mel.features(recorded, regions) - reference(speech)).max()) \
+            if regions else 0.0
+        results.append({
+            "seconds": seconds,
+            "reference": reference_name,
+            "frames": features.shape[1],
+            "max_abs_error": float(np.abs(features - expected).max()),
+            "vad_max_abs_error": speech_error,
+            "reference_ms": reference_seconds * 1000,
+            "after_stop_ms": finish_seconds * 1000,
+            "capture_cpu_percent_of_realtime": 100 * capture_cpu / seconds,
+        })
+    return results
+
+# --------------------- Capture queue stress --------------------- #
+class StallingBuffer:
+    """Wraps the capture buffer so the consumer thread periodically stalls while writing."""
+
+    def __init__(self, buffer, stall_seconds, stall_every, delay_seconds):
+        self.buffer = buffer
+        self.stall_seconds = stall_seconds
+        self.stall_every = stall_every
+        self.delay_seconds = delay_seconds
+        self.writes = 0
+
+    def write(self, samples):
+        self.writes += 1
+        time.sleep(self.delay_seconds)
+        if self.stall_every and self.writes % self.stall_every == 0:
+            time.sleep(self.stall_seconds)
+        return self.buffer.write(samples)
+
+    def __getattr__(self, name):
+        return getattr(self.buffer, name)
+
+def bench_stress(seconds, speed, stall_seconds, stall_every, delay_seconds):
+    """Push numbered blocks from a producer thread while the consumer stalls; check none are lost.
+
+    Blocks are paced at `speed` x real time like a callback. Every sample carries its own index,
+    so the captured audio must equal 0, 1, 2, ... exactly if nothing was dropped or reordered.
+    """
+    total = int(seconds * engine.RATE)
+    expected = (np.arange(total) / 2 ** 24).astype(np.float32)  # Exact in float32 below 2**24 samples
+    buffer = engine.start_capture(seconds > engine.MAX_RECORDING_SECONDS)
+    engine.capture_buffer = StallingBuffer(buffer, stall_seconds, stall_every, delay_seconds)
+    block_queue = engine.capture_queue
+    block_seconds = engine.CHUNK_SIZE / engine.RATE / speed
+    max_depth = 0
+    push_times = []
+
+    def producer():
+        nonlocal max_depth
+        next_time = time.perf_counter()
+        for i in range(0, total, engine.CHUNK_SIZE):
+            block = expected[i:i + engine.CHUNK_SIZE].reshape(-1, 1)
+            start = time.perf_counter()
+            engine.capture_block(block)
+            push_times.append(time.perf_counter() - start)
+            max_depth = max(max_depth, len(block_queue))
+            next_time += block_seconds
+            time.sleep(max(0.0, next_time - time.perf_counter()))
+
+    started = time.perf_counter()
+    thread = threading.Thread(target=producer)
+    thread.start()
+    thread.join()
+    engine.finish_capture()
+    engine.capture_buffer = buffer
+    captured = buffer.read(0, total)
+    if isinstance(buffer, engine.SpoolBuffer):
+        buffer.remove()
+    push_times = np.array(push_times) * 1e6
+    return {
+        "seconds": seconds,
+        "speed": speed,
+        "stall_seconds": stall_seconds,
+        "stall_every_blocks": stall_every,
+        "queue_capacity_seconds": engine.CAPTURE_QUEUE_SECONDS,
+        "blocks_pushed": int(block_queue.head),
+        "blocks_dropped": int(block_queue.dropped),
+        "max_queue_blocks": int(max_depth),
+        "push_us_p99": float(np.percentile(push_times, 99)),
+        "push_us_max": float(push_times.max()),
+        "samples_match": bool(len(captured) == total and np.array_equal(captured, expected)),
+        "wall_seconds": time.perf_counter() - started,
+    }
+
+# --------------------- Reporting --------------------- #
+def backend_of(entry):
+    """Backend of a report entry; reports from before backends were selectable ran on torch."""
+    return entry.get("backend", "torch")
+
+def print_report(report):
+    for load in report["model_loads"]:
+        print(f"load {backend_of(load):>11} {load['model']:>8}: {load['load_seconds']:.2f}s + "
+              f"warm-up {load['warmup_seconds']:.2f}s, {load['weights_mb']:.0f} MB weights, "
+              f"peak RSS {load['peak_rss_mb']:.0f} MB")
+    print(f"{'backend':>11} {'model':>8} {'audio s':>8} {'block us':>9} {'p99 us':>8} {'assemble':>9} "
+          f"{'vad s':>7} {'after stop':>11} {'RTF':>6} {'peak MB':>8}")
+    for r in report["results"]:
+        print(f"{backend_of(r):>11} {r['model']:>8} {r['seconds']:>8g} {r['block_us_mean']:>9.1f} "
+              f"{r['block_us_p99']:>8.1f} {r['assembly_seconds']:>9.4f} {r['vad_seconds']:>7.3f} "
+              f"{r['latency_after_stop_seconds']:>11.2f} {r['rtf']:>6.3f} {r['peak_rss_mb']:>8.0f}")
+
+    # Real-time factor side by side for each backend
+    backend_names = list(dict.fromkeys(backend_of(r) for r in report["results"]))
+    if len(backend_names) > 1:
+        rtf = {(backend_of(r), r["model"], r["seconds"]): r["rtf"] for r in report["results"]}
+        print(f"\n{'RTF':>8} {'audio s':>8} " + " ".join(f"{name:>11}" for name in backend_names))
+        for model_name, seconds in dict.fromkeys((r["model"], r["seconds"]) for r in report["results"]):
+            values = [rtf.get((name, model_name, seconds)) for name in backend_names]
+            print(f"{model_name:>8} {seconds:>8g} " + " ".join(
+                f"{value:>11.3f}" if value is not None else f"{'-':>11}" for value in values))
+
+COMPARED_METRICS = ["block_us_mean", "assembly_seconds", "vad_seconds",
+                    "latency_after_stop_seconds", "rtf", "peak_rss_mb"]
+
+def compare_reports(old, new, threshold=REGRESSION_THRESHOLD):
+    """Print metric changes between two reports; returns the number of regressions."""
+    old_results = {(backend_of(r), r["model"], r["seconds"]): r for r in old["results"]}
+    regressions = 0
+    print(f"{old['environment'].get('commit')} -> {new['environment'].get('commit')}")
+    for r in new["results"]:
+        before = old_results.get((backend_of(r), r["model"], r["seconds"]))
+        if before is None:
+            continue
+        for metric in COMPARED_METRICS:
+            if metric not in before or metric not in r or not before[metric]:
+                continue
+            change = (r[metric] - before[metric]) / before[metric]
+            flag = ""
+            if change > threshold:
+                flag = "  REGRESSION"
+                regressions += 1
+            print(f"{backend_of(r):>11} {r['model']:>8} {r['seconds']:>6g}s {metric:>28}: "
+                  f"{before[metric]:>10.4f} -> {r[metric]:>10.4f} ({change:+.1%}){flag}")
+    old_loads = {(backend_of(load), load["model"]): load for load in old["model_loads"]}
+    for load in new["model_loads"]:
+        old_load = old_loads.get((backend_of(load), load["model"]))
+        if old_load is not None and old_load["load_seconds"]:
+            change = (load["load_seconds"] - old_load["load_seconds"]) / old_load["load_seconds"]
+            print(f"{backend_of(load):>11} {load['model']:>8} {'load':>7} {'load_seconds':>28}: "
+                  f"{old_load['load_seconds']:>10.4f} -> {load['load_seconds']:>10.4f} ({change:+.1%})")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Capture-to-text benchmarks")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    run_parser = subparsers.add_parser("run", help="Run the benchmarks")
+    run_parser.add_argument("--models", default=DEFAULT_MODELS, help="Comma-separated model names")
+    run_parser.add_argument("--lengths", default=DEFAULT_LENGTHS,
+                            help="Comma-separated recording lengths in seconds")
+    run_parser.add_argument("--backends", default=backends.WHISPER_BACKEND,
+                            help=f"Comma-separated inference backends ({', '.join(backends.BACKENDS)})")
+    run_parser.add_argument("--threads", type=int, help="Intra-op threads per model")
+    run_parser.add_argument("--interop-threads", type=int, help="Inter-op threads per model")
+    run_parser.add_argument("--audio", help="Recording to use instead of synthetic speech (looped to length)")
+    run_parser.add_argument("--repeat", type=int, default=1, help="Runs per case; the median is reported")
+    run_parser.add_argument("-o", "--output", help="Write the JSON report here")
+    run_parser.add_argument("--json", action="store_true", help="Print the JSON report instead of a table")
+    resample_parser = subparsers.add_parser("resample", help="CPU cost of native-rate capture and resampling")
+    resample_parser.add_argument("--rates", default="16000,44100,48000",
+                                 help="Comma-separated device rates (16000 mono is the direct path)")
+    resample_parser.add_argument("--channels", default="1,2", help="Comma-separated channel counts")
+    resample_parser.add_argument("--seconds", type=float, default=60.0)
+    live_parser = subparsers.add_parser("live", help="Overflows and CPU on a real device: forced 16 kHz vs native")
+    live_parser.add_argument("--device", type=int, help="Input device ID (default: system default)")
+    live_parser.add_argument("--seconds", type=float, default=30.0, help="Recording time per mode")
+    devices_parser = subparsers.add_parser("devices", help="Device enumeration, rate probing and cached lookup cost")
+    adaptive_parser = subparsers.add_parser("adaptive", help="Adaptive decode controller against a simulated load")
+    adaptive_parser.add_argument("--target", type=float, default=2.0, help="Latency target in seconds")
+    adaptive_parser.add_argument("--jobs", type=int, default=40, help="Jobs per phase")
+    stress_parser = subparsers.add_parser("stress", help="Capture queue under a slow consumer: no dropped blocks")
+    stress_parser.add_argument("--seconds", type=float, default=120.0, help="Audio pushed through the queue")
+    stress_parser.add_argument("--speed", type=float, default=10.0, help="Push rate relative to real time")
+    stress_parser.add_argument("--stall", type=float, default=0.5, help="Consumer stall length in seconds")
+    stress_parser.add_argument("--stall-every", type=int, default=20, help="Stall after this many blocks")
+    stress_parser.add_argument("--delay", type=float, default=0.0, help="Extra consumer delay per block")
+    mel_parser = subparsers.add_parser("mel", help="Capture-time log-mel features vs Whisper's, and time after Stop")
+    mel_parser.add_argument("--lengths", default="10,60,300", help="Comma-separated recording lengths in seconds")
+    mel_parser.add_argument("--n-mels", type=int, default=80, help="Mel bins (128 for large-v3)")
+    ptt_parser = subparsers.add_parser("ptt", help="Armed capture: pre-roll and Record/Pause/Resume/Stop cursor")
+    ptt_parser.add_argument("--seconds", type=float, default=20.0, help="Audio pushed through the queue")
+    search_parser = subparsers.add_parser("search", help="Transcript store: insert cost and search latency")
+    search_parser.add_argument("--recordings", type=int, default=5000, help="Synthetic dictations stored")
+    search_parser.add_argument("--queries", type=int, default=200)
+    meeting_parser = subparsers.add_parser("meeting", help="Multi-device capture: drift fit and track alignment")
+    meeting_parser.add_argument("--seconds", type=float, default=120.0)
+    archive_parser = subparsers.add_parser("archive", help="Audio archive: compression ratio and CPU per hour")
+    archive_parser.add_argument("--seconds", type=float, default=600.0, help="Length of the test recording")
+    archive_parser.add_argument("--audio", help="Recording to use instead of synthetic speech (looped to length)")
+    archive_parser.add_argument("--formats", help=f"Comma-separated formats ({', '.join(archive.FORMATS)})")
+    for extra_parser in (resample_parser, live_parser, stress_parser, mel_parser, ptt_parser, search_parser,
+                         meeting_parser, devices_parser, adaptive_parser, archive_parser):
+        extra_parser.add_argument("--json", action="store_true", help="Print JSON instead of a table")
+    compare_parser = subparsers.add_parser("compare", help="Compare two JSON reports")
+    compare_parser.add_argument("old")
+    compare_parser.add_argument("new")
+    compare_parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD,
+                                help="Relative increase counted as a regression")
+    args = parser.parse_args(argv)
+
+    if args.command == "compare":
+        with open(args.old) as f:
+            old = json.load(f)
+        with open(args.new) as f:
+            new = json.load(f)
+        return 1 if compare_reports(old, new, args.threshold) else 0
+
+    if args.command in ("resample", "live", "stress", "mel", "ptt", "search", "meeting", "devices", "adaptive",
+                        "archive"):
+        if args.command == "archive":
+            formats = [fmt.strip() for fmt in args.formats.split(",") if fmt.strip()] if args.formats else None
+            results = bench_archive(args.seconds, args.audio, formats)
+        elif args.command == "adaptive":
+            results = bench_adaptive(args.jobs, args.target)
+        elif args.command == "devices":
+            results = [bench_devices()]
+        elif args.command == "meeting":
+            results = [bench_meeting(args.seconds)]
+        elif args.command == "search":
+            results = [bench_search(args.recordings, args.queries)]
+        elif args.command == "ptt":
+            results = [bench_push_to_talk(args.seconds)]
+        elif args.command == "mel":
+            results = bench_mel([float(length) for length in args.lengths.split(",") if length.strip()],
+                                args.n_mels)
+        elif args.command == "stress":
+            results = [bench_stress(args.seconds, args.speed, args.stall, args.stall_every, args.delay)]
+        elif args.command == "resample":
+            results = bench_resample([int(rate) for rate in args.rates.split(",") if rate.strip()],
+                                     [int(n) for n in args.channels.split(",") if n.strip()], args.seconds)
+        else:
+            results = [bench_live_capture(args.device, args.seconds, native) for native in (False, True)]
+        if args.json:
+            print(json.dumps({"environment": environment_info(), "results": results}, indent=2))
+        else:
+            for r in results:
+                print("  ".join(f"{key}={value:.3f}" if isinstance(value, float) else f"{key}={value}"
+                                for key, value in r.items()))
+        if args.command == "stress":
+            # Fail when anything was lost, so the harness can gate changes to the capture path
+            return 0 if results[0]["samples_match"] and not results[0]["blocks_dropped"] else 1
+        if args.command == "ptt":
+            return 0 if results[0]["samples_match"] else 1
+        if args.command == "archive":
+            # Opus is lossy; everything else must round-trip exactly
+            return 0 if all(r["read_samples_match"] and (r["lossless"] or r["format"] == "opus")
+                            for r in results) else 1
+        if args.command == "meeting":
+            return 0 if results[0]["lengths_match"] and results[0]["align_error_ms_max"] <= MEETING_TOLERANCE_MS else 1
+        if args.command == "mel":
+            return 0 if all(max(r["max_abs_error"], r["vad_max_abs_error"]) <= MEL_TOLERANCE
+                            for r in results) else 1
+        return 0
+
+    models = [name.strip() for name in args.models.split(",") if name.strip()]
+    lengths = [float(length) for length in args.lengths.split(",") if length.strip()]
+    backend_names = [name.strip() for name in args.backends.split(",") if name.strip()]
+    unknown = set(backend_names) - set(backends.BACKENDS)
+    if unknown:
+        parser.error(f"unknown backend(s): {', '.join(sorted(unknown))}")
+    backends.configure_threads(args.threads, args.interop_threads)
+    report = run_benchmarks(models, lengths, args.audio, max(1, args.repeat), backend_names)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,98 @@
+"""On-disk transcription cache keyed by a hash of the PCM, the model and the decode options.
+
+Each entry is one JSON file. Reading an entry refreshes its modification time, and the
+least recently used entries are deleted once the directory grows past RESULT_CACHE_MB.
+Writes go through a temp file and a rename, so several worker processes can share a cache.
+"""
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
+
+import metrics
+
+RESULT_CACHE_ENABLED = os.getenv("TRANSCRIBE_CACHE", "1") == "1"
+RESULT_CACHE_DIR = os.getenv("TRANSCRIBE_CACHE_DIR",
+                             os.path.join(os.path.expanduser("~"), ".cache", "transcribe", "results"))
+RESULT_CACHE_MB = float(os.getenv("TRANSCRIBE_CACHE_MB", "200"))  # Size cap before LRU eviction
+CACHE_FORMAT_VERSION = 1  # Bump when the stored result layout changes
+
+def cache_key(audio_data, model_name, options):
+    """Content hash of float32 PCM plus everything else that affects the transcript."""
+    audio_data = np.ascontiguousarray(audio_data, dtype=np.float32)
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(memoryview(audio_data).cast("B"))
+    digest.update(json.dumps({"model": model_name, "options": options, "version": CACHE_FORMAT_VERSION},
+                             sort_keys=True, default=str).encode())
+    return digest.hexdigest()
+
+def _entry_path(key):
+    return os.path.join(RESULT_CACHE_DIR, key + ".json")
+
+def get(key):
+    """Return the cached result for `key`, or None."""
+    path = _entry_path(key)
+    try:
+        with open(path) as f:
+            result = json.load(f)
+        os.utime(path)  # Mark as recently used
+    except (OSError, ValueError):
+        metrics.increment("cache_misses")
+        return None
+    metrics.increment("cache_hits")
+    return result
+
+def put(key, result):
+    """Store a result, then evict old entries if the cache is over its size cap."""
+    try:
+        os.makedirs(RESULT_CACHE_DIR, exist_ok=True)
+        with tempfile.NamedTemporaryFile("w", dir=RESULT_CACHE_DIR, suffix=".tmp", delete=False) as f:
+            try:
+                json.dump(result, f, default=float)
+            except (TypeError, ValueError):
+                f.close()
+                os.remove(f.name)
+                raise
+        os.replace(f.name, _entry_path(key))
+    except (OSError, TypeError, ValueError) as e:
+        print(f"Error writing transcription cache: {e}")
+        return
+    evict()
+
+def evict(max_mb=None):
+    """Delete least recently used entries until the cache fits in `max_mb`."""
+    max_bytes = (RESULT_CACHE_MB if max_mb is None else max_mb) * 1024 * 1024
+    if not os.path.isdir(RESULT_CACHE_DIR):
+        return
+    entries = []
+    for entry in os.scandir(RESULT_CACHE_DIR):
+        if entry.name.endswith(".json"):
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue  # Removed by another process meanwhile
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            metrics.increment("cache_evictions")
+        except OSError:
+            pass
+        total -= size
+    metrics.set_gauge("cache_mb", total / (1024 * 1024))
+
+def stats():
+    """Number of entries and total size (MB) of the cache directory."""
+    if not os.path.isdir(RESULT_CACHE_DIR):
+        return 0, 0.0
+    sizes = [entry.stat().st_size for entry in os.scandir(RESULT_CACHE_DIR) if entry.name.endswith(".json")]
+    return len(sizes), sum(sizes) / (1024 * 1024)
+
+def clear():
+    """Remove every cached result."""
+    evict(0)
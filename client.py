@@ -0,0 +1,148 @@
+"""Command-line client and load-test harness for the transcription server (server.py)."""
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+import numpy as np
+import aiohttp
+
+import engine
+
+DEFAULT_URL = "http://127.0.0.1:8765"
+
+async def transcribe_file(session, url, path):
+    """Upload one file and return (status, response JSON, latency in seconds)."""
+    with open(path, "rb") as f:
+        data = f.read()
+    start = time.perf_counter()
+    async with session.post(f"{url}/transcribe", data=data) as response:
+        body = await response.json()
+        return response.status, body, time.perf_counter() - start
+
+async def stream_file(url, path, speed=1.0, chunk_seconds=0.25, quiet=False):
+    """Stream a file over the WebSocket as float32 PCM, paced at `speed` x real time.
+
+    Returns the final message, with the client-side time from "end" to final text added.
+    """
+    audio_data = engine.load_audio_file(path)
+    chunk = int(chunk_seconds * engine.RATE)
+    ws_url = url.replace("http", "ws", 1) + "/stream?format=pcm_f32le"
+    async with aiohttp.ClientSession() as session:
+        async with session.ws_connect(ws_url, max_msg_size=0) as ws:
+
+            async def receive():
+                async for msg in ws:
+                    message = json.loads(msg.data)
+                    if message["type"] == "final":
+                        return message
+                    if not quiet:
+                        if message["type"] == "partial":
+                            print(f"[partial] {message['committed']} | {message['partial']}")
+                        else:
+                            print(f"[{message['type']}] {message.get('error', '')}")
+                return None
+
+            receiver = asyncio.ensure_future(receive())
+            for i in range(0, len(audio_data), chunk):
+                await ws.send_bytes(audio_data[i:i + chunk].astype("<f4").tobytes())
+                if speed > 0:
+                    await asyncio.sleep(chunk_seconds / speed)
+            ended = time.perf_counter()
+            await ws.send_str(json.dumps({"type": "end"}))
+            final = await receiver
+    if final is not None:
+        final["client_time_to_final"] = time.perf_counter() - ended
+    return final
+
+async def load_test(url, paths, concurrency, requests):
+    """Send `requests` uploads with at most `concurrency` in flight and summarise the results."""
+    latencies = []
+    audio_seconds = 0.0
+    statuses = {}
+    next_request = iter(range(requests))
+
+    async def user(session):
+        nonlocal audio_seconds
+        for i in next_request:
+            try:
+                status, body, latency = await transcribe_file(session, url, paths[i % len(paths)])
+            except aiohttp.ClientError:
+                status, body, latency = "connection_error", {}, None
+            statuses[status] = statuses.get(status, 0) + 1
+            if status == 200:
+                latencies.append(latency)
+                audio_seconds += body.get("duration", 0.0)
+            elif status == 503:
+                # Respect the server's backpressure before trying again
+                await asyncio.sleep(1.0)
+
+    start = time.perf_counter()
+    timeout = aiohttp.ClientTimeout(total=None)
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+        await asyncio.gather(*(user(session) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    summary = {
+        "concurrency": concurrency,
+        "requests": requests,
+        "status_counts": {str(status): count for status, count in statuses.items()},
+        "elapsed_seconds": elapsed,
+        "throughput_rps": len(latencies) / elapsed if elapsed else 0.0,
+        "audio_seconds_per_second": audio_seconds / elapsed if elapsed else 0.0,
+    }
+    if latencies:
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        summary.update({"latency_p50": float(p50), "latency_p95": float(p95), "latency_p99": float(p99),
+                        "latency_max": max(latencies)})
+    return summary
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Client for the transcription server")
+    parser.add_argument("--url", default=DEFAULT_URL, help="Server base URL")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    upload_parser = subparsers.add_parser("transcribe", help="Upload files and print transcripts")
+    upload_parser.add_argument("paths", nargs="+")
+
+    stream_parser = subparsers.add_parser("stream", help="Stream a file over WebSocket")
+    stream_parser.add_argument("path")
+    stream_parser.add_argument("--speed", type=float, default=1.0,
+                               help="Playback speed relative to real time (0 = as fast as possible)")
+
+    load_parser = subparsers.add_parser("loadtest", help="Measure throughput and latency")
+    load_parser.add_argument("paths", nargs="+")
+    load_parser.add_argument("-c", "--concurrency", type=int, default=4)
+    load_parser.add_argument("-n", "--requests", type=int, default=20)
+    load_parser.add_argument("--json", action="store_true", help="Print the summary as JSON only")
+    args = parser.parse_args(argv)
+
+    if args.command == "transcribe":
+        async def run():
+            async with aiohttp.ClientSession() as session:
+                for path in args.paths:
+                    status, body, latency = await transcribe_file(session, args.url, path)
+                    if status == 200:
+                        print(f"{path} ({latency:.2f}s): {body['text']}")
+                    else:
+                        print(f"{path}: HTTP {status} {body.get('error', '')}")
+        asyncio.run(run())
+    elif args.command == "stream":
+        final = asyncio.run(stream_file(args.url, args.path, args.speed))
+        if final is None:
+            print("Connection closed before the final transcript")
+            return 1
+        print(f"[final] {final['text']}")
+        print(f"Time to final text after end of audio: {final['client_time_to_final']:.2f}s")
+    else:
+        summary = asyncio.run(load_test(args.url, args.paths, args.concurrency, args.requests))
+        if args.json:
+            print(json.dumps(summary))
+        else:
+            for key, value in summary.items():
+                print(f"{key:>26}: {value:.3f}" if isinstance(value, float) else f"{key:>26}: {value}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,262 @@
+"""Input device registry: enumerate once, cache capabilities, follow hot-plug in the background.
+
+PortAudio builds its device list when it is initialised, and querying it is slow with many
+ALSA/PulseAudio endpoints, so the registry enumerates once (off the UI thread) and answers
+every later lookup from memory. Supported sample rates are probed in the background after
+each enumeration. A monitor thread re-enumerates when devices are plugged in or removed;
+PortAudio has to be restarted to notice, which would break an open stream, so that waits
+until no stream is running. The last device a recording started on is saved and preferred
+on the next run.
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from dataclasses import dataclass, replace
+
+import metrics
+
+DEVICE_MONITOR_SECONDS = float(os.getenv("TRANSCRIBE_DEVICE_MONITOR", "2"))  # Hot-plug check interval (0 = off)
+DEVICE_RESCAN_SECONDS = 30.0  # Device list check interval where hot-plug can't be detected cheaply
+DEVICE_STATE_FILE = os.getenv("TRANSCRIBE_DEVICE_STATE",
+                              os.path.join(os.path.expanduser("~"), ".local", "share", "transcribe", "device.json"))
+PREFERRED_DEVICE_NAME = "HD Pro Webcam C920"  # Used when nothing was selected or saved
+PROBE_RATES = (8000, 16000, 22050, 32000, 44100, 48000, 96000)
+
+@dataclass(frozen=True)
+class InputDevice:
+    """A PortAudio input device as it was enumerated; `index` is only valid until the next refresh."""
+    index: int
+    name: str
+    hostapi: str
+    channels: int
+    default_rate: int
+    is_default: bool = False
+    rates: tuple = None  # PROBE_RATES the device accepted, or None until probed
+
+    def supports_rate(self, rate):
+        """Whether `rate` works (assumed for the default rate and before probing)."""
+        return self.rates is None or int(rate) == self.default_rate or int(rate) in self.rates
+
+def _hardware_signature():
+    """Something that changes when sound hardware is added or removed, or None where unknown.
+
+    On Linux the ALSA device nodes are listed; elsewhere hot-plug is only seen by rescanning.
+    """
+    try:
+        return tuple(sorted(os.listdir("/dev/snd")))
+    except OSError:
+        return None
+
+def _listing_in_subprocess():
+    """Sorted input device names as a fresh PortAudio sees them, or None if that failed.
+
+    The listing runs in a child process, so this process's PortAudio (and any open stream) is
+    left alone; it only has to be restarted when the list actually changed.
+    """
+    code = ("import sounddevice as sd; print('\\n'.join(sorted(d['name'] for d in sd.query_devices() "
+            "if d['max_input_channels'] > 0)))")
+    try:
+        result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, timeout=15)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return tuple(result.stdout.splitlines()) if result.returncode == 0 else None
+
+def _restart_portaudio(sd):
+    """Make PortAudio enumerate devices again (its list is fixed at initialisation)."""
+    try:
+        sd._terminate()
+        sd._initialize()
+    except AttributeError:
+        pass  # Private API missing: keep the list PortAudio already has
+
+class DeviceRegistry:
+    """Cached input devices with background rate probing and hot-plug refresh."""
+
+    def __init__(self, state_file=DEVICE_STATE_FILE):
+        self.state_file = state_file
+        self.busy = lambda: False     # Set by the app: True while an input stream is open
+        self.on_change = None         # Called as on_change(added, removed) after a refresh that changed the list
+        self._devices = None          # Tuple of InputDevice, or None before the first enumeration
+        self.lock = threading.RLock()  # Hold while opening a stream so a refresh can't restart PortAudio under it
+        self._monitor = None
+        self._monitor_stop = threading.Event()
+        self._signature = None
+        self._stale = False           # Hardware changed while busy; refresh once the stream closes
+        self._last_good = None        # Cached contents of state_file
+
+    def devices(self):
+        """Every input device, enumerating on first use."""
+        if self._devices is None:
+            self.refresh()
+        return self._devices
+
+    def refresh(self, restart=False):
+        """Enumerate input devices (restarting PortAudio first when `restart`); returns them.
+
+        Calls on_change(added, removed) with device names when the list changed.
+        """
+        import sounddevice as sd  # Deferred: initialising PortAudio is slow with many endpoints
+        with self.lock, metrics.span("device_enumeration"):
+            if restart:
+                _restart_portaudio(sd)
+            hostapis = [api["name"] for api in sd.query_hostapis()]
+            try:
+                default_input = sd.default.device[0]
+            except (TypeError, IndexError):
+                default_input = None
+            if default_input is None or default_input < 0:
+                default_input = sd.query_hostapis(sd.default.hostapi)["default_input_device"]
+            old = self._devices or ()
+            known_rates = {(device.name, device.hostapi): device.rates for device in old}
+            devices = []
+            for index, info in enumerate(sd.query_devices()):
+                if info["max_input_channels"] < 1:
+                    continue
+                hostapi = hostapis[info["hostapi"]] if info["hostapi"] < len(hostapis) else str(info["hostapi"])
+                devices.append(InputDevice(index, info["name"], hostapi, int(info["max_input_channels"]),
+                                           int(info["default_samplerate"]), index == default_input,
+                                           known_rates.get((info["name"], hostapi))))
+            self._devices = tuple(devices)
+            self._signature = _hardware_signature()
+            self._stale = False
+        metrics.set_gauge("input_devices", len(devices))
+        if old:
+            old_names = {device.name for device in old}
+            new_names = {device.name for device in devices}
+            if old_names != new_names and self.on_change is not None:
+                self.on_change(sorted(new_names - old_names), sorted(old_names - new_names))
+        return self._devices
+
+    def probe_rates(self):
+        """Find which PROBE_RATES each device accepts (slow: run it off the UI thread).
+
+        Skipped while a stream is open, since a device in use may refuse every format.
+        """
+        import sounddevice as sd
+        for device in self.devices():
+            if device.rates is not None:
+                continue
+            if self.busy():
+                return
+            rates = []
+            with metrics.span("device_probe"):
+                for rate in PROBE_RATES:
+                    try:
+                        sd.check_input_settings(device=device.index, samplerate=rate, channels=1, dtype="float32")
+                        rates.append(rate)
+                    except Exception:
+                        pass
+            with self.lock:
+                # The list may have been refreshed meanwhile; update the device only if it is still there
+                self._devices = tuple(replace(d, rates=tuple(rates)) if d == device else d for d in self._devices)
+
+    def get(self, index):
+        return next((device for device in self.devices() if device.index == index), None)
+
+    def find(self, name, hostapi=None):
+        """The device with this exact name (and host API, if given), else the first whose name contains it."""
+        devices = self.devices()
+        for device in devices:
+            if device.name == name and (hostapi is None or device.hostapi == hostapi):
+                return device
+        lowered = name.lower()
+        return next((device for device in devices if lowered in device.name.lower()), None)
+
+    def resolve(self, selected=None):
+        """The device to record from: `selected` (a name or index), the last good device, the
+        preferred webcam, the system default, or the first input, whichever exists first."""
+        device = None
+        if isinstance(selected, int):
+            device = self.get(selected)
+        elif selected:
+            device = self.find(selected)
+        if device is None:
+            saved = self.last_good()
+            if saved:
+                device = self.find(saved["name"], saved.get("hostapi"))
+        devices = self.devices()
+        if device is None:
+            device = next((d for d in devices if PREFERRED_DEVICE_NAME in d.name), None)
+        if device is None:
+            device = next((d for d in devices if d.is_default), None)
+        if device is None and devices:
+            device = devices[0]
+        if device is None:
+            raise ValueError("No input devices found")
+        return device
+
+    def last_good(self):
+        """The saved {"name", "hostapi", "rate", "channels"} of the last device that recorded, or None."""
+        if self._last_good is None:
+            try:
+                with open(self.state_file) as f:
+                    self._last_good = json.load(f)
+            except (OSError, ValueError):
+                self._last_good = {}
+        return self._last_good or None
+
+    def remember(self, device, rate, channels):
+        """Save the device a recording just started on, so the next run prefers it."""
+        state = {"name": device.name, "hostapi": device.hostapi, "rate": int(rate), "channels": int(channels)}
+        if state == self.last_good():
+            return
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.state_file)), exist_ok=True)
+            with tempfile.NamedTemporaryFile("w", dir=os.path.dirname(os.path.abspath(self.state_file)),
+                                             suffix=".tmp", delete=False) as f:
+                json.dump(state, f)
+            os.replace(f.name, self.state_file)
+            self._last_good = state
+        except OSError as e:
+            print(f"Error saving the input device: {e}")
+
+    def start_monitor(self, interval=DEVICE_MONITOR_SECONDS):
+        """Watch for hot-plugged devices on a daemon thread."""
+        if interval <= 0 or self._monitor is not None:
+            return
+        self._monitor_stop.clear()
+        self._monitor = threading.Thread(target=self._monitor_loop, args=(interval,), daemon=True,
+                                         name="device-monitor")
+        self._monitor.start()
+
+    def stop_monitor(self):
+        if self._monitor is not None:
+            self._monitor_stop.set()
+            self._monitor.join()
+            self._monitor = None
+
+    def _monitor_loop(self, interval):
+        last_scan = time.monotonic()
+        while not self._monitor_stop.wait(interval):
+            signature = _hardware_signature()
+            if signature is None:
+                # No cheap hot-plug signal on this platform: now and then, compare the device list
+                # a child process sees with ours, and restart PortAudio only if they differ
+                changed = False
+                if time.monotonic() - last_scan >= DEVICE_RESCAN_SECONDS:
+                    last_scan = time.monotonic()
+                    listing = _listing_in_subprocess()
+                    known = tuple(sorted(device.name for device in self._devices or ()))
+                    changed = listing is not None and listing != known
+            else:
+                changed = signature != self._signature
+            if changed or self._stale:
+                with self.lock:
+                    if self.busy():
+                        self._stale = True  # Refresh once the stream closes
+                    else:
+                        try:
+                            self.refresh(restart=True)
+                        except Exception as e:
+                            print(f"Error refreshing input devices: {e}")
+                        last_scan = time.monotonic()
+            try:
+                self.probe_rates()  # Devices not probed yet, e.g. ones that were busy last time
+            except Exception as e:
+                print(f"Error probing input devices: {e}")
+
+registry = DeviceRegistry()
@@ -0,0 +1,1333 @@
+"""Audio capture buffer, Whisper model cache and transcription pipeline, independent of the GUI."""
+import threading
+import json
+import os
+import shutil
+import sys
+import time
+import wave
+from contextlib import contextmanager
+from datetime import datetime
+import numpy as np
+from dotenv import load_dotenv
+
+import backends
+import cache
+import metrics
+from mel import MelStream
+from resample import Resampler
+
+# Load environment variables from a .env file next to this script, if there is one
+load_dotenv(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".env"))
+
+# Audio configuration: Adjusted for Whisper's optimal performance
+RATE = 16000          # Changed from 48000 to 16000 for Whisper
+CHANNELS = 1
+CHUNK_SIZE = 4096     # Increased from 1024 to 4096 to reduce overflow warnings
+DEVICE_TIMEOUT = 1.0   # Device timeout in seconds
+MAX_RECORDING_SECONDS = 300  # Capture buffer capacity
+# Open the device at its own rate and channel count and convert to 16 kHz mono off the audio
+# thread, instead of making the host audio layer resample inside the callback
+NATIVE_RATE_CAPTURE = os.getenv("TRANSCRIBE_NATIVE_RATE", "1") == "1"
+CAPTURE_MAX_CHANNELS = 2     # Devices with more inputs are opened with only the first two
+
+class AudioBuffer:
+    """Preallocated float32 sample buffer written from the audio callback.
+
+    In linear mode writes stop once the buffer is full; in circular mode the oldest
+    samples are overwritten. Each write is one (or, when wrapping, two) slice copies
+    into the backing array, so the audio thread never allocates.
+    """
+
+    def __init__(self, capacity, circular=False):
+        self.capacity = int(capacity)
+        self.circular = circular
+        self.data = np.empty(self.capacity, dtype=np.float32)
+        self.data.fill(0.0)  # Touch every page now rather than in the audio callback
+        self.write_pos = 0   # Next index to write
+        self.length = 0      # Number of valid samples
+
+    def __len__(self):
+        return self.length
+
+    @property
+    def is_full(self):
+        return self.length >= self.capacity
+
+    @property
+    def duration(self):
+        return self.length / RATE
+
+    def clear(self):
+        self.write_pos = 0
+        self.length = 0
+
+    def write(self, samples):
+        """Copy samples into the buffer and return how many were stored."""
+        n = len(samples)
+        if not self.circular:
+            n = min(n, self.capacity - self.write_pos)
+            self.data[self.write_pos:self.write_pos + n] = samples[:n]
+            self.write_pos += n
+            self.length = self.write_pos
+            return n
+
+        if n >= self.capacity:
+            # Only the newest `capacity` samples survive
+            self.data[:] = samples[n - self.capacity:]
+            self.write_pos = 0
+            self.length = self.capacity
+            return n
+        first = min(n, self.capacity - self.write_pos)
+        self.data[self.write_pos:self.write_pos + first] = samples[:first]
+        if first < n:
+            self.data[:n - first] = samples[first:]
+        self.write_pos = (self.write_pos + n) % self.capacity
+        self.length = min(self.length + n, self.capacity)
+        return n
+
+    def views(self):
+        """Return the valid samples, oldest first, as one or two zero-copy views."""
+        start = (self.write_pos - self.length) % self.capacity if self.circular else 0
+        end = start + self.length
+        if end <= self.capacity:
+            return [self.data[start:end]]
+        return [self.data[start:], self.data[:end - self.capacity]]
+
+    def view(self):
+        """Return all valid samples in order; zero-copy unless a circular buffer has wrapped."""
+        parts = self.views()
+        return parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+    def read(self, start, end=None):
+        """Return samples [start, end) in recording order."""
+        return self.view()[start:end]
+
+    def peak(self):
+        return float(np.max(np.abs(self.view()))) if self.length else 0.0
+
+# Capture buffer for the current recording, preallocated for the maximum recording length
+audio_buffer = AudioBuffer(RATE * MAX_RECORDING_SECONDS)
+
+# Unbounded recordings are spooled to disk instead of held in audio_buffer
+LONG_RECORDING_ENABLED = os.getenv("TRANSCRIBE_LONG_RECORDING", "0") == "1"
+SPOOL_DIR = os.getenv("TRANSCRIBE_SPOOL_DIR",
+                      os.path.join(os.path.expanduser("~"), ".cache", "transcribe", "spool"))
+SPOOL_SEGMENT_SECONDS = 60     # Length of each memory-mapped segment file
+LONG_WINDOW_SECONDS = 30.0     # Window size when transcribing a spooled recording
+
+class SpoolBuffer:
+    """Unbounded capture buffer spooled to memory-mapped float32 segment files.
+
+    Only the segment being written is mapped, so memory stays flat however long the
+    recording runs. The next segment file is created ahead of time on a helper thread, so
+    the audio callback only ever does slice copies. A meta.json records the layout; after a
+    crash the segments can be read back with mode="r" (see recover_spool()).
+    """
+
+    def __init__(self, directory=None, segment_seconds=SPOOL_SEGMENT_SECONDS, mode="w"):
+        self.directory = directory or os.path.join(
+            SPOOL_DIR, datetime.now().strftime("recording_%Y%m%d_%H%M%S"))
+        self.mode = mode
+        self.segment = None       # Segment currently being written (write mode only)
+        self.next_segment = None  # Pre-created segment the writer switches to when full
+        if mode == "r":
+            self._open_existing()
+            return
+
+        os.makedirs(self.directory, exist_ok=True)
+        self.segment_samples = int(segment_seconds * RATE)
+        self.segment_index = 0
+        self.length = 0
+        self.segment = self._create_segment(0)
+        self._write_meta(complete=False)
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._retired = []        # Filled segments waiting to be flushed and unmapped
+        self._closed = False
+        self._helper = threading.Thread(target=self._helper_loop, daemon=True)
+        self._helper.start()
+        self._wakeup.set()
+
+    def __len__(self):
+        return self.length
+
+    is_full = False
+
+    @property
+    def duration(self):
+        return self.length / RATE
+
+    def _segment_path(self, index):
+        return os.path.join(self.directory, f"segment_{index:05d}.f32")
+
+    def _create_segment(self, index):
+        return np.memmap(self._segment_path(index), dtype=np.float32, mode="w+",
+                         shape=(self.segment_samples,))
+
+    def _write_meta(self, complete):
+        meta = {"rate": RATE, "segment_samples": self.segment_samples,
+                "length": self.length, "complete": complete}
+        tmp_path = os.path.join(self.directory, "meta.json.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, os.path.join(self.directory, "meta.json"))
+
+    def _open_existing(self):
+        with open(os.path.join(self.directory, "meta.json")) as f:
+            meta = json.load(f)
+        self.segment_samples = meta["segment_samples"]
+        count = len([name for name in os.listdir(self.directory) if name.endswith(".f32")])
+        self.segment_index = count
+        if meta["complete"]:
+            self.length = meta["length"]
+            return
+        # Interrupted recording: segment files are zero-filled past the last write, and the
+        # pre-created next segment may be entirely empty
+        self.length = 0
+        for index in reversed(range(count)):
+            nonzero = np.flatnonzero(np.memmap(self._segment_path(index), dtype=np.float32, mode="r"))
+            if len(nonzero):
+                self.length = index * self.segment_samples + int(nonzero[-1]) + 1
+                break
+
+    def _helper_loop(self):
+        while True:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            while self._retired:
+                segment = self._retired.pop(0)
+                segment.flush()
+                del segment
+            with self._lock:
+                if self._closed:
+                    return
+                if self.next_segment is None:
+                    self.next_segment = self._create_segment(self.segment_index + 1)
+            self._write_meta(complete=False)
+
+    def _switch_segment(self):
+        with self._lock:
+            if self.next_segment is None:
+                # The helper fell behind; create the file here rather than drop audio
+                self.next_segment = self._create_segment(self.segment_index + 1)
+            self._retired.append(self.segment)
+            self.segment, self.next_segment = self.next_segment, None
+            self.segment_index += 1
+        self._wakeup.set()
+
+    def write(self, samples):
+        """Copy samples into the current segment, moving to the next one when it fills."""
+        n = len(samples)
+        written = 0
+        while written < n:
+            offset = self.length - self.segment_index * self.segment_samples
+            count = min(n - written, self.segment_samples - offset)
+            self.segment[offset:offset + count] = samples[written:written + count]
+            written += count
+            self.length += count
+            if offset + count == self.segment_samples:
+                self._switch_segment()
+        return n
+
+    def read(self, start, end=None):
+        """Return a copy of samples [start, end), reading across segment files as needed."""
+        end = self.length if end is None else min(end, self.length)
+        out = np.empty(max(end - start, 0), dtype=np.float32)
+        pos = start
+        while pos < end:
+            index = pos // self.segment_samples
+            offset = pos - index * self.segment_samples
+            count = min(end - pos, self.segment_samples - offset)
+            if self.segment is not None and index == self.segment_index:
+                source = self.segment
+            else:
+                source = np.memmap(self._segment_path(index), dtype=np.float32, mode="r",
+                                   shape=(self.segment_samples,))
+            out[pos - start:pos - start + count] = source[offset:offset + count]
+            pos += count
+        return out
+
+    def view(self):
+        """Read the whole recording into memory; prefer read() for long recordings."""
+        return self.read(0)
+
+    def iter_segments(self):
+        """Yield the recording one segment-sized array at a time."""
+        for start in range(0, self.length, self.segment_samples):
+            yield self.read(start, start + self.segment_samples)
+
+    def peak(self):
+        return max((float(np.max(np.abs(chunk))) for chunk in self.iter_segments()), default=0.0)
+
+    def close(self):
+        """Finish writing: flush and unmap everything and mark the spool complete."""
+        if self.mode != "w" or self._closed:
+            return
+        with self._lock:
+            self._closed = True
+            segment, self.segment = self.segment, None
+            unused, self.next_segment = self.next_segment, None
+        self._wakeup.set()
+        self._helper.join()
+        segment.flush()
+        del segment
+        if unused is not None:
+            del unused
+            os.unlink(self._segment_path(self.segment_index + 1))
+        self._write_meta(complete=True)
+
+    def remove(self):
+        """Delete the spool directory."""
+        self.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+def find_unfinished_spools():
+    """Spool directories left behind by recordings that never finished."""
+    if not os.path.isdir(SPOOL_DIR):
+        return []
+    unfinished = []
+    for name in sorted(os.listdir(SPOOL_DIR)):
+        meta_path = os.path.join(SPOOL_DIR, name, "meta.json")
+        try:
+            with open(meta_path) as f:
+                if not json.load(f)["complete"]:
+                    unfinished.append(os.path.join(SPOOL_DIR, name))
+        except (OSError, ValueError, KeyError):
+            continue
+    return unfinished
+
+def recover_spool(directory, wav_path=None):
+    """Write a spooled recording to a 16-bit WAV one segment at a time; returns the WAV path."""
+    spool = SpoolBuffer(directory, mode="r")
+    wav_path = wav_path or directory.rstrip(os.sep) + ".wav"
+    with wave.open(wav_path, 'wb') as wf:
+        wf.setnchannels(CHANNELS)
+        wf.setsampwidth(2)
+        wf.setframerate(RATE)
+        for chunk in spool.iter_segments():
+            wf.writeframes((np.clip(chunk, -1.0, 1.0) * 32767).astype(np.int16).tobytes())
+    print(f"Recovered {spool.duration:.1f}s of audio from {directory} to {wav_path}")
+    return wav_path
+
+class BlockQueue:
+    """Lock-free single-producer/single-consumer ring of audio blocks.
+
+    The producer (the audio callback) copies each block into a preallocated slot and then
+    publishes it by advancing `head`; the consumer reads slots up to `head` and frees them by
+    advancing `tail`. Each index is written by one side only and int assignment is atomic in
+    CPython, so pushing never takes a lock or allocates.
+    """
+
+    def __init__(self, slots, slot_frames, channels):
+        self.slots = int(slots)
+        self.slot_frames = int(slot_frames)
+        self.data = np.zeros((self.slots, self.slot_frames, channels), dtype=np.float32)
+        self.frames = np.zeros(self.slots, dtype=np.int64)
+        self.positions = np.zeros(self.slots, dtype=np.int64)  # Input frame index of each slot's first frame
+        self.arrivals = np.zeros(self.slots)                     # Callback time of each slot's block
+        self.received = 0    # Frames offered to push(), dropped ones included (producer only)
+        self.head = 0        # Blocks published (producer only)
+        self.tail = 0        # Blocks consumed (consumer only)
+        self.dropped = 0     # Blocks refused because the ring was full (producer only)
+        self.overflows = 0   # Callback input overflows/underflows reported by PortAudio (producer only)
+        self.underflows = 0
+
+    def __len__(self):
+        return self.head - self.tail
+
+    def push(self, block, arrival=0.0):
+        """Copy a (frames, channels) block into the ring; returns False and counts a drop if it is full.
+
+        `arrival` is the block's capture time, kept with it for consumers that track the device clock.
+        """
+        n = len(block)
+        position = self.received
+        self.received += n
+        needed = -(-n // self.slot_frames)  # Oversized blocks are split across slots
+        if self.head - self.tail + needed > self.slots:
+            self.dropped += 1
+            return False
+        for start in range(0, n, self.slot_frames):
+            slot = self.head % self.slots
+            count = min(self.slot_frames, n - start)
+            self.data[slot, :count] = block[start:start + count]
+            self.frames[slot] = count
+            self.positions[slot] = position + start
+            self.arrivals[slot] = arrival
+            self.head += 1  # Publish only after the slot is filled
+        return True
+
+    def peek(self):
+        """The oldest block as a view into its slot (valid until release()), or None if empty."""
+        if self.tail == self.head:
+            return None
+        slot = self.tail % self.slots
+        return self.data[slot, :self.frames[slot]]
+
+    def peek_position(self):
+        """(input frame index, arrival time) of the block returned by peek()."""
+        slot = self.tail % self.slots
+        return int(self.positions[slot]), float(self.arrivals[slot])
+
+    def release(self):
+        """Free the slot returned by peek()."""
+        self.tail += 1
+
+# Where the consumer thread writes: audio_buffer, or a SpoolBuffer for unbounded recordings
+capture_buffer = audio_buffer
+
+# The audio callback only pushes into capture_queue; capture_consumer() owns everything after that
+CAPTURE_QUEUE_SECONDS = 10.0   # Audio the queue holds while the consumer is stalled
+CONSUMER_POLL_SECONDS = 0.01   # Consumer sleep when the queue is empty
+capture_queue = None
+capture_thread = None
+capture_stop = threading.Event()
+
+# Armed (push-to-talk) capture: the stream and consumer stay up between recordings. Blocks
+# outside the recording window go to a small circular pre-roll buffer, which is prepended
+# when a recording starts or resumes, so the audio just before the keypress is kept.
+PREROLL_SECONDS = float(os.getenv("TRANSCRIBE_PREROLL", "0.5"))
+preroll_buffer = AudioBuffer(max(1, int(RATE * PREROLL_SECONDS)), circular=True)
+armed = False
+capture_windows = ()  # (first block, end block or None) ranges of capture_queue that belong to the recording
+
+# Whisper's log-mel features are computed by the consumer while recording, so they are ready at Stop
+MEL_PRECOMPUTE_ENABLED = os.getenv("TRANSCRIBE_PRECOMPUTE_MEL", "1") == "1"
+capture_mel = None  # MelStream for the current in-memory recording, or None
+
+def block_frames(input_rate):
+    """Callback block size at `input_rate`: CHUNK_SIZE at 16 kHz, the same duration elsewhere."""
+    return int(CHUNK_SIZE * int(input_rate) / RATE)
+
+def start_capture(long_recording=False, input_rate=RATE, input_channels=CHANNELS, on_full=None):
+    """Select and reset the capture buffer for a new recording and start its consumer thread.
+
+    `input_rate` and `input_channels` describe the blocks that capture_block() will receive;
+    anything but RATE mono is downmixed and resampled by the consumer. `on_full()` is called
+    from the consumer thread once a bounded buffer is full.
+    """
+    global capture_buffer, capture_queue, capture_thread, capture_mel
+    _stop_consumer()  # From a previous recording that was never finished
+    if long_recording:
+        capture_buffer = SpoolBuffer()
+        capture_mel = None  # Spooled recordings are transcribed window by window instead
+        print(f"Spooling recording to {capture_buffer.directory}")
+    else:
+        audio_buffer.clear()
+        capture_buffer = audio_buffer
+        capture_mel = _capture_mel_stream()
+    resampler = None
+    if int(input_rate) != RATE or input_channels != CHANNELS:
+        resampler = Resampler(input_rate, RATE)
+        print(f"Capturing at {int(input_rate)} Hz x {input_channels} channels, "
+              f"converting to {RATE} Hz mono")
+    frames = block_frames(input_rate)
+    slots = int(np.ceil(CAPTURE_QUEUE_SECONDS * int(input_rate) / frames))
+    capture_queue = BlockQueue(slots, frames, input_channels)
+    capture_stop.clear()
+    capture_thread = threading.Thread(target=capture_consumer, args=(capture_queue, resampler, on_full),
+                                      daemon=True)
+    capture_thread.start()
+    return capture_buffer
+
+def _capture_mel_stream():
+    """A reset MelStream sized for the active model, or None when the backend can't use one."""
+    if not MEL_PRECOMPUTE_ENABLED or backends.WHISPER_BACKEND == "ctranslate2":
+        return None
+    entry = loaded_models.get(WHISPER_MODEL)
+    dims = getattr(entry["model"], "dims", None) if entry else None
+    n_mels = dims.n_mels if dims is not None else (128 if "large-v3" in WHISPER_MODEL else 80)
+    if capture_mel is not None and capture_mel.n_mels == n_mels:
+        capture_mel.reset()
+        return capture_mel
+    return MelStream(n_mels, capacity_seconds=MAX_RECORDING_SECONDS)
+
+def capture_block(indata, status=None):
+    """Queue one (frames, channels) block from the audio callback; returns False if it was dropped.
+
+    Safe to call on the real-time audio thread: no locks, no allocation, no I/O.
+    """
+    if status:
+        if status.input_overflow:
+            capture_queue.overflows += 1
+        if status.input_underflow:
+            capture_queue.underflows += 1
+    return capture_queue.push(indata)
+
+def _publish_queue_counters(block_queue, published):
+    """Move the producer-side tallies into metrics (the audio thread can't take the metrics lock)."""
+    for name, value in (("callback_blocks", block_queue.head), ("dropped_blocks", block_queue.dropped),
+                        ("input_overflows", block_queue.overflows),
+                        ("input_underflows", block_queue.underflows)):
+        if value != published.get(name, 0):
+            metrics.increment(name, value - published.get(name, 0))
+            published[name] = value
+
+def _in_windows(index, windows):
+    return any(index >= start and (end is None or index < end) for start, end in windows)
+
+def _prepend_preroll():
+    """Move the pre-roll audio to the start of the recording (or of the resumed part)."""
+    samples = preroll_buffer.view()
+    stored = capture_buffer.write(samples)
+    if capture_mel is not None and stored:
+        capture_mel.process(samples[:stored])
+    metrics.set_gauge("preroll_seconds", stored / RATE)
+    preroll_buffer.clear()
+
+def capture_consumer(block_queue, resampler, on_full):
+    """Move queued blocks into the capture buffer until capture_stop is set and the queue is empty.
+
+    While armed, only blocks inside capture_windows are recorded; the rest feed the pre-roll.
+    """
+    published = {}
+    full_reported = False
+    while True:
+        stopping = capture_stop.is_set()  # Checked before peeking so the last blocks are drained
+        block = block_queue.peek()
+        if block is None:
+            _publish_queue_counters(block_queue, published)
+            if stopping:
+                break
+            time.sleep(CONSUMER_POLL_SECONDS)
+            continue
+        metrics.set_gauge("capture_queue_blocks", len(block_queue))
+        windows = capture_windows  # Read once: the UI thread replaces the tuple as a whole
+        recording = not armed or _in_windows(block_queue.tail, windows)
+        with metrics.span("capture"):
+            samples = resampler.process(block) if resampler is not None else block[:, 0]
+            if not recording:
+                preroll_buffer.write(samples)
+                block_queue.release()
+                continue
+            if armed and any(block_queue.tail == start for start, _ in windows):
+                _prepend_preroll()
+            stored = capture_buffer.write(samples)
+        if capture_mel is not None and stored:
+            with metrics.span("mel"):
+                capture_mel.process(samples[:stored])
+        block_queue.release()  # Last: `samples` may be a view into the slot
+        metrics.set_gauge("capture_seconds", capture_buffer.duration)
+        if capture_buffer.is_full and not full_reported:
+            full_reported = True
+            if on_full is not None:
+                on_full()
+        elif not capture_buffer.is_full:
+            full_reported = False  # A new armed recording started with an empty buffer
+
+def _stop_consumer():
+    """Let the consumer drain the queue, then stop it."""
+    global capture_thread
+    if capture_thread is not None:
+        capture_stop.set()
+        if capture_thread is not threading.current_thread():
+            capture_thread.join()
+        capture_thread = None
+
+def finish_capture():
+    """Drain the capture queue and flush the capture buffer once recording has stopped."""
+    _stop_consumer()
+    if isinstance(capture_buffer, SpoolBuffer):
+        capture_buffer.close()
+
+def take_recording():
+    """Hand over the finished recording so the next one can start right away.
+
+    Returns (audio, mel_stream): a private copy of the in-memory samples (or the closed
+    SpoolBuffer) and the MelStream that saw them. The next recording gets fresh ones.
+    """
+    global capture_mel
+    mel_stream, capture_mel = capture_mel, None
+    if isinstance(capture_buffer, SpoolBuffer):
+        return capture_buffer, None
+    with metrics.span("assembly"):
+        return capture_buffer.view().copy(), mel_stream
+
+def arm_capture(input_rate=RATE, input_channels=CHANNELS, on_full=None):
+    """Start the queue and consumer for an always-open stream; blocks go to the pre-roll until
+    start_segment() opens a recording window."""
+    global armed, capture_windows
+    disarm_capture()
+    capture_windows = ()
+    preroll_buffer.clear()
+    armed = True
+    start_capture(False, input_rate, input_channels, on_full)
+
+def start_segment(long_recording=False, resume=False):
+    """Start recording (or resume a paused recording) from the next queued block.
+
+    Only moves the window over the block stream, so it returns in microseconds; the pre-roll
+    is prepended by the consumer when it reaches the window.
+    """
+    global capture_buffer, capture_mel, capture_windows
+    if not resume:
+        if long_recording:
+            capture_buffer = SpoolBuffer()
+            capture_mel = None
+            print(f"Spooling recording to {capture_buffer.directory}")
+        else:
+            audio_buffer.clear()
+            capture_buffer = audio_buffer
+            capture_mel = _capture_mel_stream()
+    # A resumed window is added to the paused ones, which the consumer may not have reached yet
+    capture_windows = (capture_windows if resume else ()) + ((capture_queue.head, None),)
+    return capture_buffer
+
+def pause_segment():
+    """Close the recording window at the last queued block; later blocks feed the pre-roll."""
+    global capture_windows
+    if capture_windows and capture_windows[-1][1] is None:
+        capture_windows = capture_windows[:-1] + ((capture_windows[-1][0], capture_queue.head),)
+
+def end_segment():
+    """Close the recording window and wait until the consumer has stored every block in it."""
+    pause_segment()
+    if capture_windows:
+        while capture_queue.tail < capture_windows[-1][1] and capture_thread is not None:
+            time.sleep(CONSUMER_POLL_SECONDS / 10)
+    if isinstance(capture_buffer, SpoolBuffer):
+        capture_buffer.close()
+
+def disarm_capture():
+    """Stop the always-open capture started by arm_capture()."""
+    global armed, capture_windows
+    if armed:
+        _stop_consumer()
+        armed = False
+        capture_windows = ()
+
+# Optional side output: when set, every recording is also saved as a 16-bit WAV in this directory
+WAV_EXPORT_DIR = os.getenv("TRANSCRIBE_WAV_DIR")
+
+# Streaming transcription: decode rolling windows while recording so only the tail is left after Stop
+STREAMING_ENABLED = os.getenv("TRANSCRIBE_STREAMING", "0") == "1"
+STREAM_WINDOW_SECONDS = 20.0   # Longest window decoded in one pass
+STREAM_MIN_SECONDS = 5.0       # Uncommitted audio needed before a window is decoded
+STREAM_OVERLAP_SECONDS = 2.0   # Segments ending this close to the live edge stay uncommitted
+STREAM_PROMPT_CHARS = 200      # Committed text passed as context to the next window
+
+# Voice-activity detection: only speech regions are sent to Whisper
+VAD_ENABLED = os.getenv("TRANSCRIBE_VAD", "1") == "1"
+VAD_FRAME_MS = 30               # Analysis frame length
+VAD_ENERGY_MARGIN_DB = 12.0     # Speech must be this far above the estimated noise floor
+VAD_MIN_THRESHOLD_DB = -55.0    # Clamp for the energy threshold (dBFS)...
+VAD_MAX_THRESHOLD_DB = -35.0    # ...so continuous speech or a dead mic don't skew it
+VAD_FRICATIVE_ZCR = 0.25        # Quieter frames with this many zero crossings still count as speech
+VAD_MIN_SPEECH_MS = 90          # Shorter bursts (clicks, bumps) are ignored
+VAD_PAD_MS = 200                # Audio kept before each speech onset
+VAD_HANGOVER_MS = 400           # Audio kept after speech ends, bridging short pauses
+VAD_AUTO_STOP_SECONDS = float(os.getenv("TRANSCRIBE_AUTO_STOP", "0"))  # Stop after this much silence (0 = off)
+
+# Whisper model configuration
+WHISPER_MODEL = os.getenv("WHISPER_MODEL", "base")  # Model warmed at startup and used for transcription
+MODEL_SIZES = ["tiny", "base", "small", "medium", "large"]
+MODEL_MEMORY_BUDGET_MB = float(os.getenv("WHISPER_MODEL_BUDGET_MB", "2048"))  # Idle models are evicted above this
+
+# Process-wide cache of resident Whisper models, keyed by model name
+loaded_models = {}   # name -> {"model", "size_mb", "last_used", "load_time", "warmup_time", "backend"}
+model_loading = {}   # name -> threading.Event, set once an in-progress load finishes
+model_lock = threading.Lock()
+
+# Encoder time spent by the current thread's transcription, so decode time can be split out
+_encoder_time = threading.local()
+
+def _instrument_encoder(model):
+    """Record every encoder forward pass as an "encode" span via forward hooks."""
+    def before(module, inputs):
+        _encoder_time.start = time.perf_counter()
+
+    def after(module, inputs, output):
+        elapsed = time.perf_counter() - _encoder_time.start
+        _encoder_time.total = getattr(_encoder_time, "total", 0.0) + elapsed
+        metrics.record_span("encode", elapsed)
+
+    encoder = getattr(model, "encoder", None)
+    if encoder is None or not hasattr(encoder, "register_forward_hook"):
+        return  # Not a PyTorch model: only whole-transcription timings are recorded
+    encoder.register_forward_pre_hook(before)
+    encoder.register_forward_hook(after)
+
+def _evict_idle_models(keep):
+    """Drop least recently used models (other than `keep` and the active one) until under budget."""
+    total_mb = sum(entry["size_mb"] for entry in loaded_models.values())
+    for name, entry in sorted(loaded_models.items(), key=lambda item: item[1]["last_used"]):
+        if total_mb <= MODEL_MEMORY_BUDGET_MB:
+            break
+        if name in (keep, WHISPER_MODEL):
+            continue
+        del loaded_models[name]
+        total_mb -= entry["size_mb"]
+        print(f"Evicted Whisper model '{name}' ({entry['size_mb']:.0f} MB) to stay under "
+              f"{MODEL_MEMORY_BUDGET_MB:.0f} MB budget")
+
+def get_model(name=None):
+    """Return a resident Whisper model, loading and warming it on first use."""
+    name = name or WHISPER_MODEL
+    while True:
+        with model_lock:
+            entry = loaded_models.get(name)
+            if entry is not None:
+                entry["last_used"] = time.monotonic()
+                return entry["model"]
+            event = model_loading.get(name)
+            is_loader = event is None
+            if is_loader:
+                event = model_loading[name] = threading.Event()
+        if is_loader:
+            break
+        # Another thread is already loading this model; wait and check the cache again
+        event.wait()
+
+    try:
+        print(f"Loading Whisper model '{name}' ({backends.WHISPER_BACKEND} backend)...")
+        start = time.perf_counter()
+        model = backends.load_model(name)  # Deferred import: pulls in torch, which takes seconds
+        load_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        backends.warm_up(model)
+        warmup_time = time.perf_counter() - start
+        metrics.record_span("model_load", load_time)
+        metrics.record_span("model_warmup", warmup_time)
+        _instrument_encoder(model)  # After warm-up, so only real transcriptions are counted
+
+        size_mb = backends.model_size_mb(model)
+        print(f"Whisper model '{name}' ready: load {load_time:.2f}s, "
+              f"warm-up {warmup_time:.2f}s, {size_mb:.0f} MB")
+        with model_lock:
+            loaded_models[name] = {
+                "model": model,
+                "size_mb": size_mb,
+                "last_used": time.monotonic(),
+                "load_time": load_time,
+                "warmup_time": warmup_time,
+                "backend": backends.WHISPER_BACKEND,
+            }
+            _evict_idle_models(keep=name)
+            metrics.set_gauge("resident_models", len(loaded_models))
+        return model
+    finally:
+        with model_lock:
+            model_loading.pop(name, None)
+        event.set()
+
+def preload_model(name=None, on_done=None):
+    """Load and warm a Whisper model on a background thread.
+
+    `on_done(name, entry, error)` is called from that thread once the load finishes.
+    """
+    name = name or WHISPER_MODEL
+
+    def worker():
+        try:
+            get_model(name)
+            entry, error = loaded_models.get(name), None
+        except Exception as e:
+            print(f"Error loading Whisper model '{name}': {e}")
+            entry, error = None, e
+        if on_done is not None:
+            on_done(name, entry, error)
+
+    threading.Thread(target=worker, daemon=True).start()
+
+def set_active_model(name):
+    """Make `name` the model used for transcription."""
+    global WHISPER_MODEL
+    WHISPER_MODEL = name
+
+def set_backend(name):
+    """Switch the inference backend; resident models from the old backend are dropped."""
+    backends.set_backend(name)
+    with model_lock:
+        loaded_models.clear()
+
+def init_worker_process(model_name, threads, backend=None, interop_threads=None):
+    """Process-pool initializer: pin the worker's thread counts and keep one model resident."""
+    if backend is not None:
+        backends.set_backend(backend)
+    backends.configure_threads(threads, interop_threads)
+    set_active_model(model_name)
+    get_model(model_name)
+
+def save_wav(audio_data, path):
+    """Write float32 audio in [-1, 1] to a 16-bit mono WAV file."""
+    audio_data_int16 = (np.clip(audio_data, -1.0, 1.0) * 32767).astype(np.int16)
+    with wave.open(path, 'wb') as wf:
+        wf.setnchannels(CHANNELS)
+        wf.setsampwidth(2)
+        wf.setframerate(RATE)
+        wf.writeframes(audio_data_int16.tobytes())
+
+def export_wav(audio_data):
+    """Save a copy of the recording to WAV_EXPORT_DIR, if WAV export is enabled."""
+    if not WAV_EXPORT_DIR:
+        return None
+    try:
+        os.makedirs(WAV_EXPORT_DIR, exist_ok=True)
+        path = os.path.join(WAV_EXPORT_DIR, datetime.now().strftime("recording_%Y%m%d_%H%M%S.wav"))
+        save_wav(audio_data, path)
+        print(f"Audio saved to: {path}")
+        return path
+    except Exception as e:
+        print(f"Error exporting WAV: {str(e)}")
+        return None
+
+def export_recording(buffer):
+    """Save a copy of a capture buffer to WAV_EXPORT_DIR, if WAV export is enabled."""
+    if not WAV_EXPORT_DIR:
+        return None
+    if not isinstance(buffer, SpoolBuffer):
+        return export_wav(buffer.view())
+    try:
+        os.makedirs(WAV_EXPORT_DIR, exist_ok=True)
+        path = os.path.join(WAV_EXPORT_DIR, os.path.basename(buffer.directory) + ".wav")
+        return recover_spool(buffer.directory, path)
+    except Exception as e:
+        print(f"Error exporting WAV: {str(e)}")
+        return None
+
+def load_audio_file(path):
+    """Load an audio file as float32 16 kHz mono, reading 16 kHz PCM WAVs without ffmpeg."""
+    if path.lower().endswith(".wav"):
+        with wave.open(path, 'rb') as wf:
+            if wf.getframerate() == RATE and wf.getsampwidth() == 2:
+                frames = np.frombuffer(wf.readframes(wf.getnframes()), dtype=np.int16)
+                frames = frames.reshape(-1, wf.getnchannels()).mean(axis=1)
+                return (frames / 32768.0).astype(np.float32)
+    # Anything else is decoded and resampled by Whisper (via ffmpeg)
+    import whisper
+    return whisper.load_audio(path)
+
+_precomputed_features = threading.local()  # (audio array, features) for this thread's decode
+_mel_hook_lock = threading.Lock()
+
+def _install_mel_hook():
+    """Wrap whisper.transcribe's log_mel_spectrogram (once) so a thread can supply its own features."""
+    module = sys.modules["whisper.transcribe"]  # The package attribute of that name is the function
+    with _mel_hook_lock:
+        if getattr(module.log_mel_spectrogram, "precomputed_hook", False):
+            return
+        original = module.log_mel_spectrogram
+
+        def log_mel_spectrogram(audio, *args, **kwargs):
+            pending = getattr(_precomputed_features, "value", None)
+            if pending is not None and audio is pending[0]:
+                return pending[1]
+            return original(audio, *args, **kwargs)
+        log_mel_spectrogram.precomputed_hook = True
+        module.log_mel_spectrogram = log_mel_spectrogram
+
+@contextmanager
+def _precomputed_mel(audio_data, mel):
+    """Have whisper.transcribe() use `mel` as the features of `audio_data` instead of computing them.
+
+    Only this thread's calls for this exact array are redirected, so decodes running in other
+    threads meanwhile get their own spectrogram and aren't held up.
+    """
+    import torch
+    _install_mel_hook()
+    _precomputed_features.value = (audio_data, torch.from_numpy(mel))
+    try:
+        yield
+    finally:
+        _precomputed_features.value = None
+
+def transcribe_array(audio_data, model_name=None, mel=None, **decode_options):
+    """Transcribe a float32 16 kHz mono buffer directly, without a temp file or ffmpeg decode.
+
+    `mel` optionally gives the (n_mels, frames) log-mel spectrogram of the audio plus 30 s of
+    padding, as computed by MelStream.features(), so Whisper skips its own STFT.
+    """
+    audio_data = np.ascontiguousarray(audio_data, dtype=np.float32).reshape(-1)
+    model = get_model(model_name)
+    _encoder_time.total = 0.0
+    start = time.perf_counter()
+    dims = getattr(model, "dims", None)
+    if mel is not None and dims is not None and dims.n_mels == mel.shape[0]:
+        with _precomputed_mel(audio_data, mel):
+            result = model.transcribe(audio_data, **decode_options)
+    else:
+        result = model.transcribe(audio_data, **decode_options)
+    # Everything but the encoder passes is decoding (mel computation, token search)
+    metrics.record_span("decode", time.perf_counter() - start - _encoder_time.total)
+    metrics.increment("audio_seconds_transcribed", len(audio_data) / RATE)
+    return result
+
+def vad_frame_features(audio_data, frame_len):
+    """Per-frame energy (dBFS) and zero-crossing rate over non-overlapping frames."""
+    n_frames = len(audio_data) // frame_len
+    frames = audio_data[:n_frames * frame_len].reshape(n_frames, frame_len)
+    energy_db = 10 * np.log10(np.einsum("ij,ij->i", frames, frames) / frame_len + 1e-10)
+    signs = np.signbit(frames)
+    zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / (frame_len - 1)
+    return energy_db, zcr
+
+def _mask_runs(mask):
+    """Start and (exclusive) end indices of each run of True values."""
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], mask.astype(np.int8), [0]))))
+    return edges[0::2], edges[1::2]
+
+def _dilate(mask, before, after):
+    """Extend every True run by `before` frames backwards and `after` frames forwards."""
+    counts = np.convolve(mask.astype(np.int32), np.ones(before + after + 1, dtype=np.int32))
+    return counts[before:before + len(mask)] > 0
+
+def speech_segments(audio_data, noise_floor_db=None):
+    """Find speech regions as (start, end) sample indices using frame energy and zero crossings."""
+    frame_len = int(RATE * VAD_FRAME_MS / 1000)
+    energy_db, zcr = vad_frame_features(audio_data, frame_len)
+    n_frames = len(energy_db)
+    if n_frames == 0:
+        return []
+
+    if noise_floor_db is None:
+        noise_floor_db = np.percentile(energy_db, 10)
+    threshold = np.clip(noise_floor_db + VAD_ENERGY_MARGIN_DB, VAD_MIN_THRESHOLD_DB, VAD_MAX_THRESHOLD_DB)
+    speech = (energy_db > threshold) | (
+        (energy_db > threshold - VAD_ENERGY_MARGIN_DB / 2) & (zcr > VAD_FRICATIVE_ZCR))
+
+    # Drop bursts too short to be speech
+    starts, ends = _mask_runs(speech)
+    short = (ends - starts) < max(1, VAD_MIN_SPEECH_MS // VAD_FRAME_MS)
+    if short.any():
+        delta = np.zeros(n_frames + 1, dtype=np.int32)
+        np.add.at(delta, starts[short], 1)
+        np.add.at(delta, ends[short], -1)
+        speech &= np.cumsum(delta[:-1]) == 0
+
+    # Hangover smoothing: pad onsets and hold speech through short pauses
+    speech = _dilate(speech, VAD_PAD_MS // VAD_FRAME_MS, VAD_HANGOVER_MS // VAD_FRAME_MS)
+
+    starts, ends = _mask_runs(speech)
+    return [(int(start) * frame_len, len(audio_data) if end == n_frames else int(end) * frame_len)
+            for start, end in zip(starts, ends)]
+
+def _stream_features(mel_stream, audio_data, regions=None):
+    """Finish the precomputed features for the audio about to be transcribed, if there are any."""
+    if mel_stream is None or mel_stream.samples_seen != len(audio_data):
+        return None
+    with metrics.span("mel_finish"):
+        return mel_stream.features(audio_data, regions)
+
+def transcribe_speech(audio_data, model_name=None, mel_stream=None, **decode_options):
+    """Transcribe only the speech regions found by VAD, with timestamps on the original timeline.
+
+    `mel_stream` is the MelStream that saw `audio_data` while it was recorded, if any.
+    """
+    audio_data = np.ascontiguousarray(audio_data, dtype=np.float32).reshape(-1)
+    with metrics.span("vad"):
+        regions = speech_segments(audio_data)
+    if not regions:
+        print("VAD: no speech found")
+        return {"text": "", "segments": [], "language": None}
+
+    speech_samples = sum(end - start for start, end in regions)
+    print(f"VAD: {len(regions)} speech regions, {speech_samples / RATE:.1f}s of "
+          f"{len(audio_data) / RATE:.1f}s sent to the model")
+    if speech_samples == len(audio_data):
+        return transcribe_array(audio_data, model_name, _stream_features(mel_stream, audio_data),
+                                **decode_options)
+
+    speech = np.concatenate([audio_data[start:end] for start, end in regions])
+    result = transcribe_array(speech, model_name, _stream_features(mel_stream, audio_data, regions),
+                              **decode_options)
+
+    # Map times in the concatenated speech back to the recording
+    region_starts = np.array([start for start, _ in regions]) / RATE
+    speech_starts = np.concatenate(([0], np.cumsum([end - start for start, end in regions])[:-1])) / RATE
+
+    def to_original(t, is_end=False):
+        # An end time exactly on a region boundary belongs to the earlier region
+        i = max(int(np.searchsorted(speech_starts, t, side="left" if is_end else "right")) - 1, 0)
+        return float(region_starts[i] + t - speech_starts[i])
+
+    for segment in result.get("segments", []):
+        segment["start"] = to_original(segment["start"])
+        segment["end"] = to_original(segment["end"], is_end=True)
+        for word in segment.get("words", []):
+            word["start"] = to_original(word["start"])
+            word["end"] = to_original(word["end"], is_end=True)
+    return result
+
+def transcribe_audio(audio_data, model_name=None, mel_stream=None, **decode_options):
+    """Transcribe a recording, skipping silence with VAD when it is enabled."""
+    if VAD_ENABLED:
+        return transcribe_speech(audio_data, model_name, mel_stream, **decode_options)
+    return transcribe_array(audio_data, model_name, _stream_features(mel_stream, audio_data),
+                            **decode_options)
+
+def _result_cache_key(audio_data, model_name, decode_options):
+    return cache.cache_key(audio_data, model_name or WHISPER_MODEL,
+                           dict(decode_options, vad=VAD_ENABLED, backend=backends.WHISPER_BACKEND))
+
+def transcribe_cached(audio_data, model_name=None, mel_stream=None, **decode_options):
+    """transcribe_audio() through the on-disk result cache; hits are marked with "cached": True."""
+    if not cache.RESULT_CACHE_ENABLED:
+        return transcribe_audio(audio_data, model_name, mel_stream, **decode_options)
+    with metrics.span("cache_lookup"):
+        key = _result_cache_key(audio_data, model_name, decode_options)
+        result = cache.get(key)
+    if result is not None:
+        print("Transcription cache hit")
+        result["cached"] = True
+        return result
+    result = transcribe_audio(audio_data, model_name, mel_stream, **decode_options)
+    cache.put(key, result)
+    return result
+
+# Per-word start/end times (Whisper's cross-attention alignment), stored with the transcript
+WORD_TIMESTAMPS = os.getenv("TRANSCRIBE_WORD_TIMESTAMPS", "0") == "1"
+
+# Batched decoding: independent <=30 s windows are decoded together in one encoder/decoder pass
+BATCH_SIZE = int(os.getenv("WHISPER_BATCH_SIZE", "8"))  # Windows per forward pass
+BATCH_WINDOW_SECONDS = 30.0        # Whisper's input length
+BATCH_NO_SPEECH_THRESHOLD = 0.6    # Same silence test as whisper.transcribe():
+BATCH_LOGPROB_THRESHOLD = -1.0     # high no-speech probability and low confidence
+
+def _quietest_cut(audio_data, lo, hi):
+    """Sample index of the lowest-energy frame in [lo, hi), for cutting inside continuous speech."""
+    frame_len = int(RATE * VAD_FRAME_MS / 1000)
+    energy_db, _ = vad_frame_features(audio_data[lo:hi], frame_len)
+    if len(energy_db) == 0:
+        return hi
+    return lo + int(np.argmin(energy_db)) * frame_len
+
+def split_at_silence(audio_data, max_seconds=BATCH_WINDOW_SECONDS):
+    """Split a recording into windows of at most `max_seconds`, cutting in pauses between speech.
+
+    Returns (start, end) sample spans; stretches without speech between windows are skipped.
+    """
+    max_len = int(max_seconds * RATE)
+    regions = speech_segments(audio_data) if VAD_ENABLED else [(0, len(audio_data))]
+    spans = []
+
+    def add(start, end):
+        # Extend the previous window over the pause if the result still fits
+        if spans and end - spans[-1][0] <= max_len:
+            spans[-1] = (spans[-1][0], end)
+        else:
+            spans.append((start, end))
+
+    for start, end in regions:
+        # Speech longer than a window is cut at the quietest frame in the window's last third
+        while end - start > max_len:
+            cut = _quietest_cut(audio_data, start + max_len * 2 // 3, start + max_len)
+            add(start, cut)
+            start = cut
+        add(start, end)
+    return spans
+
+def _segments_from_tokens(tokenizer, tokens, offset, duration):
+    """Turn a decoded token sequence with timestamp tokens into segments on the recording's timeline."""
+    segments = []
+    start = None
+    last_time = 0.0
+    text_tokens = []
+    for token in tokens:
+        if token < tokenizer.timestamp_begin:
+            text_tokens.append(token)
+            continue
+        time_s = last_time = (token - tokenizer.timestamp_begin) * 0.02  # Timestamp tokens are 20 ms apart
+        if start is not None and text_tokens:
+            segments.append({"start": offset + start, "end": offset + time_s,
+                             "text": tokenizer.decode(text_tokens)})
+            text_tokens = []
+            start = None
+        else:
+            start = time_s
+    if text_tokens:
+        # No closing timestamp: the text runs to the end of the window
+        segments.append({"start": offset + (last_time if start is None else start), "end": offset + duration,
+                         "text": tokenizer.decode(text_tokens)})
+    return segments
+
+def _decode_windows(model, windows, language=None):
+    """Decode several <=30 s windows in one batched encoder/decoder pass."""
+    import torch
+    import whisper
+    mel = torch.stack([whisper.log_mel_spectrogram(whisper.pad_or_trim(window), model.dims.n_mels)
+                       for window in windows]).to(model.device)
+    options = whisper.DecodingOptions(language=language, without_timestamps=False, fp16=False)
+    return whisper.decode(model, mel, options)
+
+def transcribe_many(recordings, model_name=None, batch_size=None, language=None):
+    """Transcribe several recordings by batching their 30 s windows through the model together.
+
+    Each recording is split at silence; windows from all recordings fill the batches, and the
+    results are reassembled per recording in order. Windows are decoded independently (no
+    previous-text prompt), which is what makes them batchable. Backends without batched
+    decoding fall back to transcribing the recordings one by one.
+    """
+    batch_size = max(1, batch_size or BATCH_SIZE)
+    model = get_model(model_name)
+    recordings = [np.ascontiguousarray(audio_data, dtype=np.float32).reshape(-1) for audio_data in recordings]
+    if not hasattr(model, "dims"):
+        return [transcribe_audio(audio_data, model_name, language=language) for audio_data in recordings]
+
+    import whisper
+    tokenizer = whisper.tokenizer.get_tokenizer(model.is_multilingual, num_languages=model.num_languages)
+    windows = [(index, start, audio_data[start:end])
+               for index, audio_data in enumerate(recordings)
+               for start, end in split_at_silence(audio_data)]
+    results = [{"text": "", "segments": [], "language": None} for _ in recordings]
+    for first in range(0, len(windows), batch_size):
+        batch = windows[first:first + batch_size]
+        with metrics.span("batch_decode"):
+            decoded = _decode_windows(model, [window for _, _, window in batch], language)
+        metrics.increment("batched_windows", len(batch))
+        for (index, start, window), item in zip(batch, decoded):
+            if item.no_speech_prob > BATCH_NO_SPEECH_THRESHOLD and item.avg_logprob < BATCH_LOGPROB_THRESHOLD:
+                continue  # Silence the model would only hallucinate on
+            result = results[index]
+            result["language"] = result["language"] or item.language
+            result["segments"].extend(_segments_from_tokens(tokenizer, item.tokens, start / RATE,
+                                                            len(window) / RATE))
+    for result in results:
+        for i, segment in enumerate(result["segments"]):
+            segment["id"] = i
+        result["text"] = "".join(segment["text"] for segment in result["segments"])
+    metrics.increment("audio_seconds_transcribed", sum(len(audio_data) for audio_data in recordings) / RATE)
+    return results
+
+def transcribe_many_cached(recordings, model_name=None, batch_size=None):
+    """transcribe_many() through the result cache: only recordings without a cached result are decoded."""
+    results = [None] * len(recordings)
+    keys = [None] * len(recordings)
+    if cache.RESULT_CACHE_ENABLED:
+        for i, audio_data in enumerate(recordings):
+            keys[i] = _result_cache_key(audio_data, model_name, {"batched": True})
+            results[i] = cache.get(keys[i])
+            if results[i] is not None:
+                results[i]["cached"] = True
+    missing = [i for i, result in enumerate(results) if result is None]
+    if missing:
+        decoded = transcribe_many([recordings[i] for i in missing], model_name, batch_size)
+        for i, result in zip(missing, decoded):
+            results[i] = result
+            if keys[i] is not None:
+                cache.put(keys[i], result)
+    return results
+
+# Live silence detection state for auto-stop
+vad_noise_floor_db = 0.0
+vad_heard_speech = False
+
+def reset_silence_monitor():
+    global vad_noise_floor_db, vad_heard_speech
+    vad_noise_floor_db = 0.0
+    vad_heard_speech = False
+
+def silence_after_speech():
+    """True once the last VAD_AUTO_STOP_SECONDS of the live buffer are silent after speech."""
+    global vad_noise_floor_db, vad_heard_speech
+    tail_samples = int(VAD_AUTO_STOP_SECONDS * RATE)
+    available = len(capture_buffer)
+    if VAD_AUTO_STOP_SECONDS <= 0 or available < tail_samples:
+        return False
+    tail = capture_buffer.read(available - tail_samples, available)
+    energy_db, _ = vad_frame_features(tail, int(RATE * VAD_FRAME_MS / 1000))
+    # The quietest stretch heard so far is the best noise floor estimate
+    vad_noise_floor_db = min(vad_noise_floor_db, float(np.percentile(energy_db, 10)))
+    if speech_segments(tail, vad_noise_floor_db):
+        vad_heard_speech = True
+        return False
+    return vad_heard_speech
+
+streaming_session = None  # StreamingSession of the recording in progress, if any
+
+def join_text(committed, new):
+    """Append newly decoded text to committed text with a single separating space."""
+    new = new.strip()
+    if not new:
+        return committed
+    return f"{committed} {new}" if committed else new
+
+class StreamingSession:
+    """Streaming transcription of one recording: a worker decodes rolling windows while it fills.
+
+    The session keeps its own committed state, and once the recording stops it decodes from
+    the audio handed over by end_streaming(). Finishing it can therefore overlap with the
+    next recording, which gets a fresh capture buffer and session.
+    """
+
+    def __init__(self, buffer, on_update):
+        self.buffer = buffer            # The live capture buffer, then the finished recording
+        self.on_update = on_update
+        self.committed_text = ""        # Text that will no longer change
+        self.committed_sample = 0       # Buffer index up to which audio has been committed
+        self.segments = []              # Committed segments on the recording's timeline
+        self.stalled_at = None          # Buffer length at a decode that committed nothing
+        self.stop_event = threading.Event()
+        self.lock = threading.Lock()    # Held while reading the buffer, so end_streaming() can swap it
+        self.thread = threading.Thread(target=self._worker, daemon=True)
+        self.thread.start()
+
+    def _prompt(self):
+        """Tail of the committed text, used as decoding context for the next window."""
+        return self.committed_text[-STREAM_PROMPT_CHARS:] or None
+
+    def step(self):
+        """Decode the next window of the buffer and commit its stable text.
+
+        Returns the uncommitted (still changing) text of the window.
+        """
+        start = self.committed_sample
+        with self.lock:
+            end = min(len(self.buffer), start + int(STREAM_WINDOW_SECONDS * RATE))
+            window = self.buffer.read(start, end)
+        stable_segments = []
+        stable_text, stable_samples, partial_text = split_stream_window(
+            window, self._prompt(), stable_segments=stable_segments,
+            **({"word_timestamps": True} if WORD_TIMESTAMPS else {}))
+        self.segments.extend(_shift_segments(stable_segments, start / RATE))
+        self.committed_text = join_text(self.committed_text, stable_text)
+        self.committed_sample = start + stable_samples
+        # Decoding the same audio again would give the same answer: wait for more first
+        self.stalled_at = end if stable_samples == 0 else None
+        return partial_text
+
+    def _worker(self):
+        """Transcribe rolling windows of the live buffer until the session is stopped."""
+        shown = None
+        while not self.stop_event.is_set():
+            available = len(self.buffer)
+            backlog = available - self.committed_sample
+            metrics.set_gauge("stream_backlog_seconds", backlog / RATE)
+            waiting = self.stalled_at is not None and available - self.stalled_at < STREAM_MIN_SECONDS * RATE
+            if backlog < STREAM_MIN_SECONDS * RATE or waiting:
+                self.stop_event.wait(0.5)
+                continue
+            try:
+                with metrics.span("stream_window"):
+                    partial = self.step()
+            except Exception as e:
+                print(f"Error during streaming transcription: {str(e)}")
+                self.stop_event.wait(1.0)
+                continue
+            if not self.stop_event.is_set() and (self.committed_text, partial) != shown:
+                shown = (self.committed_text, partial)
+                self.on_update(*shown)
+
+    def stop(self, audio):
+        """Stop decoding the live buffer and continue from `audio`, the finished recording."""
+        self.stop_event.set()
+        with self.lock:
+            self.buffer = audio
+
+    def finish(self):
+        """Wait for the worker, decode the remaining tail and return {"text", "segments"}."""
+        self.thread.join()
+        tail = self.buffer.read(self.committed_sample) if isinstance(self.buffer, SpoolBuffer) \
+            else self.buffer[self.committed_sample:]
+        print(f"Finishing streaming transcription: {len(tail) / RATE:.1f}s of "
+              f"{len(self.buffer) / RATE:.1f}s left to decode")
+        if len(tail) > 0 and np.max(np.abs(tail)) >= 0.01:
+            result = transcribe_audio(tail, initial_prompt=self._prompt(),
+                                      **({"word_timestamps": True} if WORD_TIMESTAMPS else {}))
+            self.committed_text = join_text(self.committed_text, result.get("text", ""))
+            self.segments.extend(_shift_segments(result.get("segments", []), self.committed_sample / RATE))
+        return {"text": self.committed_text, "segments": self.segments}
+
+def start_streaming(on_update):
+    """Begin a streaming session for the recording that is about to start.
+
+    `on_update(committed_text, partial_text)` is called from the worker after each window.
+    """
+    global streaming_session
+    streaming_session = StreamingSession(capture_buffer, on_update)
+    return streaming_session
+
+def is_streaming():
+    return streaming_session is not None
+
+def end_streaming(audio):
+    """Detach the current session from the capture buffer once the recording has stopped.
+
+    `audio` is the finished recording from take_recording(); the returned session decodes
+    its tail with finish(), typically from a transcription job.
+    """
+    global streaming_session
+    session, streaming_session = streaming_session, None
+    if session is not None:
+        session.stop(audio)
+    return session
+
+def split_stream_window(window, prompt=None, model_name=None, window_samples=None, stable_segments=None,
+                        **decode_options):
+    """Transcribe one streaming window and split off the text that won't change with more audio.
+
+    Returns (stable_text, stable_samples, partial_text), where stable_samples is how far into
+    the window the stable text reaches (0 if nothing can be committed yet). The stable
+    segments themselves are appended to `stable_segments` if a list is given.
+    """
+    window_samples = window_samples or int(STREAM_WINDOW_SECONDS * RATE)
+    window_seconds = len(window) / RATE
+    window_is_full = len(window) >= window_samples
+
+    result = transcribe_audio(window, model_name, initial_prompt=prompt, **decode_options)
+    segments = result.get("segments", [])
+
+    # Segments that end well before the live edge won't change when more audio arrives
+    stable = 0
+    while stable < len(segments) and segments[stable]["end"] <= window_seconds - STREAM_OVERLAP_SECONDS:
+        stable += 1
+    if stable == 0 and window_is_full:
+        # Nothing ended early enough, but the window can't grow; commit all but the last segment
+        stable = max(len(segments) - 1, 1) if segments else 0
+
+    stable_text = ""
+    for segment in segments[:stable]:
+        stable_text = join_text(stable_text, segment["text"])
+    stable_samples = int(segments[stable - 1]["end"] * RATE) if stable else 0
+    if window_is_full and stable_samples <= 0:
+        # A full window that committed no audio (e.g. silence): skip it, keeping the overlap
+        stable_samples = len(window) - int(STREAM_OVERLAP_SECONDS * RATE)
+
+    partial_text = " ".join(segment["text"].strip() for segment in segments[stable:])
+    if stable_segments is not None:
+        stable_segments.extend(segments[:stable])
+    return stable_text, stable_samples, partial_text
+
+def _shift_segments(segments, offset):
+    """Move segment (and word) times `offset` seconds later, in place."""
+    for segment in segments:
+        segment["start"] += offset
+        segment["end"] += offset
+        for word in segment.get("words", []):
+            word["start"] += offset
+            word["end"] += offset
+    return segments
+
+def transcribe_long(buffer, model_name=None, on_progress=None, segments=None, **decode_options):
+    """Transcribe a (spooled) recording window by window, carrying text over as context.
+
+    Only one window is in memory at a time. `on_progress(fraction)` is called after each window.
+    If `segments` is a list, the segments are appended to it on the recording's timeline.
+    """
+    window_samples = int(LONG_WINDOW_SECONDS * RATE)
+    total = len(buffer)
+    text = ""
+    start = 0
+    while start < total:
+        window = buffer.read(start, start + window_samples)
+        prompt = text[-STREAM_PROMPT_CHARS:] or None
+        window_segments = []
+        if start + len(window) >= total:
+            # Last window: everything left is final
+            result = transcribe_audio(window, model_name, initial_prompt=prompt, **decode_options)
+            text = join_text(text, result.get("text", ""))
+            window_segments = result.get("segments", [])
+            window_start, start = start, total
+        else:
+            stable_text, stable_samples, _ = split_stream_window(
+                window, prompt, model_name, window_samples=window_samples, stable_segments=window_segments,
+                **decode_options)
+            text = join_text(text, stable_text)
+            window_start = start
+            start += stable_samples
+        if segments is not None:
+            segments.extend(_shift_segments(window_segments, window_start / RATE))
+        if on_progress is not None:
+            on_progress(start / total)
+    return text
@@ -0,0 +1,321 @@
+"""Transcription job queue: each finished recording becomes a job decoded in the background.
+
+A RecordingJob owns its audio (a private copy, or the recording's own SpoolBuffer), so a new
+recording can start while earlier ones are still being transcribed. JobQueue runs jobs on
+a fixed number of worker threads, most urgent first, and hands back a Future per job.
+Pending jobs can be cancelled outright; running jobs stop at their next checkpoint.
+"""
+import heapq
+import itertools
+import os
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+
+import numpy as np
+
+import adaptive
+import archive
+import engine
+import metrics
+import store
+
+JOB_WORKERS = int(os.getenv("TRANSCRIBE_JOB_WORKERS", "1"))    # Jobs decoded at the same time
+JOB_MAX_PENDING = int(os.getenv("TRANSCRIBE_JOB_QUEUE", "16"))  # Waiting jobs before submit() refuses
+PRIORITY_INTERACTIVE = 0  # Dictated clips: someone is waiting for the text
+PRIORITY_BACKGROUND = 10  # Long spooled recordings
+
+_job_ids = itertools.count(1)
+
+class JobCancelled(Exception):
+    """Raised inside a running job once it has been cancelled."""
+
+class JobQueueFull(Exception):
+    """submit() was called with JOB_MAX_PENDING jobs already waiting."""
+
+@dataclass(frozen=True)
+class RecordingJob:
+    """One recording to transcribe. Lower priority values run first; ties run in submit order."""
+    audio: object              # float32 16 kHz samples, or a closed SpoolBuffer
+    mel_stream: object = None  # MelStream computed while recording, if any
+    streaming: object = None   # StreamingSession that decoded most of it while recording, if any
+    model_name: str = None
+    priority: int = PRIORITY_INTERACTIVE
+    job_id: int = field(default_factory=lambda: next(_job_ids))
+    created: float = field(default_factory=time.monotonic)
+
+    @property
+    def is_spooled(self):
+        return isinstance(self.audio, engine.SpoolBuffer)
+
+    @property
+    def duration(self):
+        return len(self.audio) / engine.RATE
+
+def job_from_capture(model_name=None, priority=None):
+    """Turn the recording that just stopped into a job; spooled recordings run in the background.
+
+    A streaming session is detached from the capture buffer and finished by the job, so only
+    its tail is left to decode.
+    """
+    audio, mel_stream = engine.take_recording()
+    streaming = engine.end_streaming(audio) if engine.is_streaming() else None
+    if priority is None:
+        spooled = isinstance(audio, engine.SpoolBuffer) and streaming is None
+        priority = PRIORITY_BACKGROUND if spooled else PRIORITY_INTERACTIVE
+    return RecordingJob(audio, mel_stream, streaming, model_name or engine.WHISPER_MODEL, priority)
+
+def save_transcript(result, duration, model_name, audio_path):
+    """Add a transcript to the local store; returns its recording id (None if not stored)."""
+    if not store.TRANSCRIPT_STORE_ENABLED or not result.get("text", "").strip():
+        return None
+    try:
+        return store.save(result, duration, model_name, audio_path)
+    except Exception as e:
+        print(f"Error saving transcript: {e}")
+        return None
+
+def archive_recording(audio, recording_id=None):
+    """Queue a finished recording for the audio archive, linked to its transcript once encoded.
+
+    A SpoolBuffer is handed over to the archiver, which removes it afterwards; with archiving
+    off it is removed right away.
+    """
+    if not archive.archiver.enabled:
+        if isinstance(audio, engine.SpoolBuffer):
+            audio.remove()
+        return
+
+    def link(path):
+        try:
+            store.set_audio_path(recording_id, path)
+        except Exception as e:
+            print(f"Error linking {path} to its transcript: {e}")
+    archive.archiver.submit(audio, on_done=link if recording_id is not None else None)
+
+def transcribe_job(job, is_cancelled=lambda: False, on_progress=None):
+    """Transcribe a job; returns {"job_id", "text", "status", "duration", "elapsed", "recording_id"}.
+
+    `status` is a short message for the status bar when the recording couldn't be
+    transcribed normally, else None. Transcripts are saved to the transcript store, and
+    `recording_id` is their id there. JobCancelled is raised at the next checkpoint after
+    `is_cancelled()` turns true.
+    """
+    start = time.perf_counter()
+    decode_options = {"word_timestamps": True} if engine.WORD_TIMESTAMPS else {}
+    model_name, rung, threads, previous_threads = job.model_name, None, None, None
+    if adaptive.controller.enabled and len(job.audio) and job.streaming is None:
+        rung, threads = adaptive.controller.choose(job.duration, job.model_name, background=job.is_spooled)
+        model_name = rung.model
+        decode_options.update(rung.decode_options())
+        if JOB_WORKERS == 1:
+            previous_threads = adaptive.apply_threads(threads)
+        else:
+            threads = None  # The thread count is process-wide: concurrent jobs would fight over it
+    try:
+        return _decode_job(job, model_name, decode_options, rung, threads, start, is_cancelled, on_progress)
+    finally:
+        adaptive.apply_threads(previous_threads)  # Streaming decodes and other jobs get the old count
+
+def _decode_job(job, model_name, decode_options, rung, threads, start, is_cancelled, on_progress):
+    """The rest of transcribe_job(), once the model and decode settings are chosen."""
+    def checkpoint(fraction=None):
+        if is_cancelled():
+            raise JobCancelled(f"job {job.job_id} cancelled")
+        if fraction is not None and on_progress is not None:
+            on_progress(fraction)
+
+    def done(text, status=None, recording_id=None):
+        return {"job_id": job.job_id, "text": text, "status": status, "duration": job.duration,
+                "elapsed": time.perf_counter() - start, "recording_id": recording_id}
+
+    if len(job.audio) == 0:
+        if job.streaming is not None:
+            job.streaming.finish()  # Let its worker exit
+        return done("No audio recorded.", "No audio recorded.")
+
+    if job.streaming is not None:
+        # Most of the audio was transcribed while recording; only the tail is left
+        audio_path = engine.export_recording(job.audio) if job.is_spooled else engine.export_wav(job.audio)
+        try:
+            checkpoint()
+            result = job.streaming.finish()
+        except BaseException:
+            _discard(job)
+            raise
+        recording_id = save_transcript(result, job.duration, model_name, audio_path)
+        archive_recording(job.audio, recording_id)
+        if result["text"]:
+            return done(result["text"], recording_id=recording_id)
+        if (job.audio.peak() if job.is_spooled else np.max(np.abs(job.audio))) < 0.01:
+            return done("Audio level too low - please check microphone", "Audio level too low")
+        return done("No speech detected in the audio.")
+
+    if job.is_spooled:
+        # Spooled recordings are transcribed window by window straight from disk
+        print(f"Job {job.job_id}: {job.duration:.1f}s of spooled audio from {job.audio.directory}...")
+        segments = []
+        try:
+            audio_path = engine.export_recording(job.audio)
+            decode_start, cpu_start = time.perf_counter(), time.process_time()
+            text = engine.transcribe_long(job.audio, model_name, on_progress=checkpoint,
+                                          segments=segments, **decode_options)
+            if rung is not None:
+                adaptive.controller.record(rung, job.duration, time.perf_counter() - decode_start,
+                                           time.process_time() - cpu_start, threads)
+        except BaseException:
+            job.audio.remove()  # Cancelled or failed, the spool isn't needed any more
+            raise
+        recording_id = save_transcript({"text": text, "segments": segments}, job.duration, model_name,
+                                       audio_path)
+        archive_recording(job.audio, recording_id)  # Removes the spool once it is archived
+        return done(text or "No speech detected in the audio.", recording_id=recording_id)
+
+    audio_max = np.max(np.abs(job.audio))
+    print(f"Job {job.job_id}: {job.duration:.1f}s of audio ({len(job.audio)} samples), "
+          f"maximum level {audio_max}")
+    if audio_max < 0.01:
+        archive_recording(job.audio)
+        return done("Audio level too low - please check microphone", "Audio level too low")
+    audio_path = engine.export_wav(job.audio)
+    checkpoint()
+    decode_start, cpu_start = time.perf_counter(), time.process_time()
+    result = engine.transcribe_cached(job.audio, model_name, mel_stream=job.mel_stream, **decode_options)
+    if rung is not None and not result.get("cached"):
+        adaptive.controller.record(rung, job.duration, time.perf_counter() - decode_start,
+                                   time.process_time() - cpu_start, threads)
+    checkpoint()
+    recording_id = save_transcript(result, job.duration, model_name, audio_path)
+    archive_recording(job.audio, recording_id)
+    return done(result.get("text", "").strip() or "No speech detected in the audio.", recording_id=recording_id)
+
+def _discard(job):
+    """Clean up after a job that was cancelled before it ran."""
+    if job.is_spooled:
+        job.audio.remove()
+
+class JobQueue:
+    """Bounded priority executor for RecordingJobs, backed by `workers` daemon threads."""
+
+    def __init__(self, workers=JOB_WORKERS, max_pending=JOB_MAX_PENDING):
+        self.max_pending = max_pending
+        self._heap = []        # (priority, job_id, job, future, on_progress)
+        self._futures = {}     # job_id -> Future, for every job not yet finished
+        self._cancelled = set()
+        self._running = 0
+        self._condition = threading.Condition()
+        self._shutdown = False
+        self._threads = [threading.Thread(target=self._worker, daemon=True, name=f"job-worker-{i}")
+                         for i in range(max(1, workers))]
+        for thread in self._threads:
+            thread.start()
+
+    def __len__(self):
+        """Jobs waiting or running."""
+        with self._condition:
+            return len(self._futures)
+
+    def submit(self, job, on_progress=None):
+        """Queue a job and return the Future that will hold transcribe_job()'s result.
+
+        `on_progress(fraction)` is called from the worker thread for spooled recordings.
+        """
+        with self._condition:
+            if self._shutdown:
+                raise RuntimeError("job queue is shut down")
+            if len(self._heap) >= self.max_pending:
+                metrics.increment("jobs_rejected")
+                raise JobQueueFull(f"{len(self._heap)} transcriptions are already waiting")
+            future = Future()
+            future.job = job
+            heapq.heappush(self._heap, (job.priority, job.job_id, job, future, on_progress))
+            self._futures[job.job_id] = future
+            future.add_done_callback(lambda _: self._forget(job.job_id))
+            self._publish()
+            self._condition.notify()
+        return future
+
+    def cancel(self, job_id):
+        """Cancel a job: pending jobs are dropped, running ones stop at their next checkpoint.
+
+        Returns False if the job already finished (or never existed).
+        """
+        with self._condition:
+            future = self._futures.get(job_id)
+            if future is None:
+                return False
+            self._cancelled.add(job_id)
+            # Workers pop and start jobs under the same lock, so a pending job can't start meanwhile
+            pending = future.cancel()
+            if pending:
+                # Drop it from the heap so it no longer counts against max_pending
+                self._heap = [entry for entry in self._heap if entry[1] != job_id]
+                heapq.heapify(self._heap)
+                self._publish()
+        if pending:
+            _discard(future.job)
+        else:  # Already running: the worker raises JobCancelled
+            print(f"Cancelling job {job_id} at its next checkpoint")
+        metrics.increment("jobs_cancelled")
+        return True
+
+    def cancel_all(self):
+        with self._condition:
+            job_ids = list(self._futures)
+        return sum(self.cancel(job_id) for job_id in job_ids)
+
+    def jobs(self):
+        """Unfinished jobs, oldest first."""
+        with self._condition:
+            return sorted((future.job for future in self._futures.values()), key=lambda job: job.job_id)
+
+    def shutdown(self, cancel_pending=True):
+        """Stop the workers after the running jobs, optionally cancelling the waiting ones."""
+        with self._condition:
+            self._shutdown = True
+            pending = [entry[3] for entry in self._heap] if cancel_pending else []
+            self._condition.notify_all()
+        for future in pending:
+            if future.cancel():
+                _discard(future.job)
+
+    def _forget(self, job_id):
+        with self._condition:
+            self._futures.pop(job_id, None)
+            self._cancelled.discard(job_id)
+            self._publish()
+
+    def _publish(self):
+        metrics.set_gauge("jobs_pending", len(self._heap))
+        metrics.set_gauge("jobs_running", self._running)
+
+    def _worker(self):
+        while True:
+            with self._condition:
+                while not self._heap and not self._shutdown:
+                    self._condition.wait()
+                if not self._heap:
+                    return
+                _, _, job, future, on_progress = heapq.heappop(self._heap)
+                if not future.set_running_or_notify_cancel():
+                    self._publish()
+                    _discard(job)
+                    continue  # Cancelled while waiting
+                self._running += 1
+                self._publish()
+            metrics.record_span("job_wait", time.monotonic() - job.created)
+            try:
+                with metrics.span("job"):
+                    result = transcribe_job(job, lambda: job.job_id in self._cancelled, on_progress)
+            except Exception as e:
+                if not isinstance(e, JobCancelled):  # Cancellations were counted by cancel()
+                    metrics.increment("jobs_failed")
+                future.set_exception(e)
+            else:
+                metrics.increment("jobs_completed")
+                future.set_result(result)
+            finally:
+                with self._condition:
+                    self._running -= 1
+                    self._publish()
@@ -0,0 +1,395 @@
+"""Meeting capture: several microphones, or the channels of one interface, recorded at once.
+
+Every source becomes its own track, a SpoolBuffer written by the consumer thread of the
+device it comes from; each device has its own stream, lock-free queue and consumer, so the
+audio callbacks share nothing. The devices' sample clocks drift apart, so each device's
+real rate and start time are fitted from its blocks' arrival times, and segment times are
+mapped through that fit onto one meeting timeline. After the meeting the tracks are
+transcribed in parallel worker processes and merged by time into a speaker-tagged transcript.
+"""
+import difflib
+import os
+import re
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+
+import numpy as np
+
+import archive
+import backends
+import devices
+import engine
+import metrics
+from resample import Resampler
+
+CLOCK_FIT_MIN_SECONDS = 2.0  # Audio needed before a device's fitted rate replaces its nominal rate
+CROSSTALK_OVERLAP = 0.5      # Segments on different tracks overlapping this much of the shorter one...
+CROSSTALK_SIMILARITY = 0.6   # ...with text this similar are one voice picked up by two microphones
+
+@dataclass
+class Source:
+    """One device to record: all its inputs mixed into one track, or the listed channels as tracks."""
+    device: object           # Device index or part of its name
+    channels: tuple = None   # 1-based input channels, each its own track; None mixes them down
+    labels: tuple = None     # Speaker label per track
+
+def parse_source(spec):
+    """Parse a "DEVICE[:CH[,CH...]][=LABEL[,LABEL...]]" command-line source, e.g. "2:1,2=Ann,Bob"."""
+    device_part, _, labels = spec.partition("=")
+    device, _, channels = device_part.partition(":")
+    device = int(device) if device.strip().isdigit() else device.strip()
+    channels = tuple(int(channel) for channel in channels.split(",")) if channels else None
+    labels = tuple(label.strip() for label in labels.split(",")) if labels else None
+    if channels and any(channel < 1 for channel in channels):
+        raise ValueError(f"channels are numbered from 1: {spec}")
+    if labels and len(labels) != len(channels or (None,)):
+        raise ValueError(f"{len(labels)} labels for {len(channels or (None,))} tracks: {spec}")
+    return Source(device, channels, labels)
+
+class DeviceClock:
+    """Running least-squares fit of a device's block times against its frame count.
+
+    The slope is the device's real sample period on the monotonic clock, so rate() differs
+    from the nominal rate by the device's drift, and origin() is when frame 0 was captured.
+    Callback scheduling jitter averages out; a constant callback latency shifts the origin.
+    """
+
+    def __init__(self, nominal_rate):
+        self.nominal_rate = float(nominal_rate)
+        self.count = 0
+        self.first_frame = None
+        self.last_frame = None
+        self.mean_frame = 0.0
+        self.mean_time = 0.0
+        self.frame_var = 0.0   # Sum of squared frame deviations
+        self.covariance = 0.0  # Sum of frame * time deviations
+
+    def add(self, frame, seconds):
+        """Record that input frame `frame` had been captured at monotonic time `seconds`."""
+        if self.first_frame is None:
+            self.first_frame = frame
+        self.last_frame = frame
+        self.count += 1
+        delta = frame - self.mean_frame
+        self.mean_frame += delta / self.count
+        self.mean_time += (seconds - self.mean_time) / self.count
+        self.frame_var += delta * (frame - self.mean_frame)
+        self.covariance += delta * (seconds - self.mean_time)
+
+    def rate(self):
+        """Frames per second of monotonic time (the nominal rate until enough audio has arrived)."""
+        if self.count < 2 or self.last_frame - self.first_frame < CLOCK_FIT_MIN_SECONDS * self.nominal_rate:
+            return self.nominal_rate
+        return self.frame_var / self.covariance
+
+    def origin(self):
+        """Monotonic time at which frame 0 was captured."""
+        return self.mean_time - self.mean_frame / self.rate()
+
+    def drift_ppm(self):
+        return (self.rate() / self.nominal_rate - 1.0) * 1e6
+
+class Track:
+    """One speaker's audio: a mono 16 kHz spool fed from one channel (or the mixdown) of a device."""
+
+    def __init__(self, label, channel, directory, input_rate):
+        self.label = label
+        self.channel = channel  # 0-based input channel, or None for the mixdown
+        self.spool = engine.SpoolBuffer(directory)
+        self.resampler = Resampler(input_rate, engine.RATE)
+
+    @property
+    def delay_seconds(self):
+        """How far the 16 kHz track lags its input (the resampler's filter delay)."""
+        return 0.0 if self.resampler.passthrough else self.resampler.delay_seconds
+
+    def process(self, block):
+        samples = self.resampler.process(block if self.channel is None else block[:, self.channel])
+        self.spool.write(samples)
+
+class DeviceCapture:
+    """A meeting device: its block queue, consumer thread, clock fit and tracks.
+
+    callback() is the stream's audio callback; it only stamps and queues blocks. The consumer
+    splits each block into its tracks and fills in silence for blocks the queue dropped, so
+    every track stays sample-aligned with its device's clock.
+    """
+
+    def __init__(self, name, input_rate, input_channels, tracks):
+        self.name = name
+        self.input_rate = int(input_rate)
+        self.input_channels = int(input_channels)
+        self.tracks = tracks
+        self.clock = DeviceClock(input_rate)
+        frames = engine.block_frames(input_rate)
+        slots = int(np.ceil(engine.CAPTURE_QUEUE_SECONDS * self.input_rate / frames))
+        self.queue = engine.BlockQueue(slots, frames, input_channels)
+        self.stream = None
+        self.gap_frames = 0  # Input frames replaced with silence after drops
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._consume, daemon=True, name=f"meeting-{name}")
+
+    def callback(self, indata, frames, time_info, status):
+        if status:
+            if status.input_overflow:
+                self.queue.overflows += 1
+            if status.input_underflow:
+                self.queue.underflows += 1
+        self.queue.push(indata, time.monotonic())
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        """Drain the queue, stop the consumer and close the tracks."""
+        self.stop_event.set()
+        self.thread.join()
+        for track in self.tracks:
+            track.spool.close()
+
+    def _write(self, block):
+        for track in self.tracks:
+            track.process(block)
+
+    def _consume(self):
+        expected = 0  # Next input frame the tracks are waiting for
+        while True:
+            stopping = self.stop_event.is_set()  # Checked before peeking so the last blocks are drained
+            block = self.queue.peek()
+            if block is None:
+                if stopping:
+                    break
+                time.sleep(engine.CONSUMER_POLL_SECONDS)
+                continue
+            position, arrival = self.queue.peek_position()
+            with metrics.span("meeting_capture"):
+                if position > expected:
+                    # The queue was full for a while: keep the tracks on the device clock with silence
+                    gap = position - expected
+                    self.gap_frames += gap
+                    metrics.increment("meeting_gap_frames", gap)
+                    self._write(np.zeros((gap, self.input_channels), dtype=np.float32))
+                # The callback runs once the block's last frame has been captured
+                self.clock.add(position + len(block), arrival)
+                self._write(block)
+                expected = position + len(block)
+            self.queue.release()  # Last: `block` is a view into the slot
+
+    def to_meeting_time(self, track, seconds, meeting_start):
+        """Meeting-timeline seconds of `seconds` into one of this device's tracks."""
+        frame = (seconds - track.delay_seconds) * self.input_rate
+        return self.clock.origin() + frame / self.clock.rate() - meeting_start
+
+def find_device(device):
+    """The registry's input device for an index or a case-insensitive part of a device name."""
+    found = devices.registry.get(device) if isinstance(device, int) else devices.registry.find(device)
+    if found is None:
+        raise ValueError(f"device {device} has no inputs" if isinstance(device, int)
+                         else f"no input device matches '{device}'")
+    return found
+
+def _spool_name(stamp, index, label):
+    return f"meeting_{stamp}_{index}_{re.sub(r'[^A-Za-z0-9_-]+', '_', label)}"
+
+class MeetingRecorder:
+    """Records every source at once, one stream per device, until stop()."""
+
+    def __init__(self, sources):
+        self.sources = sources
+        self.devices = []
+        self.started = None
+        self.stopped = None
+
+    @property
+    def tracks(self):
+        return [(device, track) for device in self.devices for track in device.tracks]
+
+    def start(self):
+        """Open a stream per device and start them together; on failure nothing is left behind."""
+        try:
+            self._open_devices()
+        except Exception:
+            for device in self.devices:
+                if device.stream is not None:
+                    device.stream.close()
+                for track in device.tracks:
+                    track.spool.remove()
+            self.devices = []
+            raise
+        for device in self.devices:
+            device.start()
+        self.started = time.monotonic()
+        for device in self.devices:
+            device.stream.start()
+
+    def _open_devices(self):
+        import sounddevice as sd
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        index = 0
+        for source in self.sources:
+            info = find_device(source.device)
+            rate = info.default_rate
+            if source.channels:
+                if max(source.channels) > info.channels:
+                    raise ValueError(f"{info.name} has {info.channels} inputs, not {max(source.channels)}")
+                input_channels = max(source.channels)
+                channels = [channel - 1 for channel in source.channels]
+            else:
+                input_channels = max(1, min(info.channels, engine.CAPTURE_MAX_CHANNELS))
+                channels = [None]
+            labels = source.labels or [info.name if channel is None else f"{info.name} ch{channel + 1}"
+                                       for channel in channels]
+            device = DeviceCapture(info.name, rate, input_channels, [])
+            self.devices.append(device)
+            for channel, label in zip(channels, labels):
+                directory = os.path.join(engine.SPOOL_DIR, _spool_name(stamp, index, label))
+                device.tracks.append(Track(label, channel, directory, rate))
+                index += 1
+            device.stream = sd.InputStream(samplerate=rate, channels=input_channels, device=info.index,
+                                           dtype="float32", blocksize=engine.block_frames(rate),
+                                           latency="high", callback=device.callback)
+            print(f"Meeting source: {info.name} at {rate} Hz -> {', '.join(labels)}")
+
+    def stop(self):
+        for device in self.devices:
+            if device.stream is not None:
+                device.stream.stop()
+                device.stream.close()
+        self.stopped = time.monotonic()
+        for device in self.devices:
+            device.stop()
+            print(f"{device.name}: {device.clock.rate():.2f} Hz measured "
+                  f"({device.clock.drift_ppm():+.0f} ppm), {device.queue.dropped} blocks dropped")
+
+def transcribe_track(directory, model_name=None, word_timestamps=False):
+    """Pool worker: transcribe one track's spool; returns its segments on the track's own timeline."""
+    segments = []
+    decode_options = {"word_timestamps": True} if word_timestamps else {}
+    engine.transcribe_long(engine.SpoolBuffer(directory, mode="r"), model_name, segments=segments,
+                           **decode_options)
+    return [{"start": segment["start"], "end": segment["end"], "text": segment["text"].strip(),
+             **({"words": segment["words"]} if segment.get("words") else {})} for segment in segments]
+
+def _overlap(a, b):
+    """Overlap of two segments as a fraction of the shorter one."""
+    shared = min(a["end"], b["end"]) - max(a["start"], b["start"])
+    return max(0.0, shared) / max(min(a["end"] - a["start"], b["end"] - b["start"]), 1e-3)
+
+def merge_segments(segments):
+    """Sort tagged segments by start and drop crosstalk: a voice a second microphone also heard.
+
+    Of two overlapping segments on different tracks with nearly the same text, the one with
+    the lower `level` (its track's RMS over the segment) is dropped.
+    """
+    merged = []
+    for segment in sorted(segments, key=lambda segment: segment["start"]):
+        duplicate = None
+        for kept in reversed(merged):
+            if kept["end"] < segment["start"] - 30.0:
+                break  # Segments are at most a window long, so nothing earlier can overlap
+            if (kept["speaker"] != segment["speaker"] and _overlap(kept, segment) >= CROSSTALK_OVERLAP
+                    and difflib.SequenceMatcher(None, kept["text"].lower(), segment["text"].lower()).ratio()
+                    >= CROSSTALK_SIMILARITY):
+                duplicate = kept
+                break
+        if duplicate is None:
+            merged.append(segment)
+            continue
+        metrics.increment("meeting_crosstalk_dropped")
+        if segment["level"] > duplicate["level"]:
+            merged[next(i for i, kept in enumerate(merged) if kept is duplicate)] = segment
+    return sorted(merged, key=lambda segment: segment["start"])
+
+def format_clock(seconds):
+    minutes, secs = divmod(int(max(seconds, 0.0)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}"
+
+def transcribe_meeting(recorder, workers=None, model_name=None):
+    """Transcribe every track of a stopped recorder in parallel and merge them into one transcript.
+
+    Returns {"text", "segments", "tracks", "duration"}; segments carry a `speaker` label and
+    times on the meeting timeline (seconds since the streams started).
+    """
+    model_name = model_name or engine.WHISPER_MODEL
+    tracks = recorder.tracks
+    workers = workers or max(1, min(len(tracks), os.cpu_count() or 1))
+    threads = backends.INTRA_OP_THREADS or max(1, (os.cpu_count() or 1) // workers)
+    print(f"Transcribing {len(tracks)} tracks with {workers} workers ({threads} threads each)")
+    segments = []
+    track_info = []
+    with metrics.span("meeting_transcribe"), \
+            ProcessPoolExecutor(max_workers=workers, initializer=engine.init_worker_process,
+                                initargs=(model_name, threads, backends.WHISPER_BACKEND,
+                                          backends.INTER_OP_THREADS)) as pool:
+        futures = [pool.submit(transcribe_track, track.spool.directory, model_name, engine.WORD_TIMESTAMPS)
+                   for _, track in tracks]
+        for (device, track), future in zip(tracks, futures):
+            info = {"speaker": track.label, "device": device.name, "channel": track.channel,
+                    "duration": track.spool.duration, "drift_ppm": device.clock.drift_ppm(),
+                    "gap_seconds": device.gap_frames / device.input_rate, "error": None}
+            track_info.append(info)
+            try:
+                track_segments = future.result()
+            except Exception as e:
+                info["error"] = f"{e.__class__.__name__}: {str(e)}"
+                print(f"Error transcribing {track.label}: {info['error']}")
+                continue
+            for segment in track_segments:
+                audio_data = track.spool.read(int(segment["start"] * engine.RATE), int(segment["end"] * engine.RATE))
+                segment["level"] = float(np.sqrt(np.mean(audio_data ** 2))) if len(audio_data) else 0.0
+                segment["speaker"] = track.label
+                segment["start"] = device.to_meeting_time(track, segment["start"], recorder.started)
+                segment["end"] = device.to_meeting_time(track, segment["end"], recorder.started)
+                for word in segment.get("words", ()):
+                    word["start"] = device.to_meeting_time(track, word["start"], recorder.started)
+                    word["end"] = device.to_meeting_time(track, word["end"], recorder.started)
+                segments.append(segment)
+    merged = merge_segments(segments)
+    text = "\n".join(f"[{format_clock(segment['start'])}] {segment['speaker']}: {segment['text']}"
+                     for segment in merged)
+    return {"text": text, "segments": merged, "tracks": track_info,
+            "duration": (recorder.stopped or time.monotonic()) - recorder.started}
+
+def tagged_segments(result):
+    """The merged segments with the speaker at the start of their text, for SRT files and search."""
+    return [{**segment, "text": f"{segment['speaker']}: {segment['text']}"} for segment in result["segments"]]
+
+def finish_meeting(recorder, result, model_name=None):
+    """Save a transcribed meeting to the transcript store and WAV export, then archive (or
+    delete) its spools.
+
+    Spools of tracks that failed to transcribe are kept for `transcribe.py recover`.
+    """
+    import jobs
+    for (_, track), info in zip(recorder.tracks, result["tracks"]):
+        if info["error"]:
+            print(f"Keeping {track.spool.directory} for recovery")
+            continue
+        engine.export_recording(track.spool)
+        jobs.archive_recording(track.spool)
+    stored = {"text": result["text"], "segments": tagged_segments(result)}
+    return jobs.save_transcript(stored, result["duration"], model_name or engine.WHISPER_MODEL, None)
+
+def record_meeting(sources, seconds=None, workers=None, model_name=None):
+    """Record the sources until Enter (or `seconds`), then print the merged transcript; returns the result."""
+    recorder = MeetingRecorder(sources)
+    recorder.start()
+    try:
+        if seconds:
+            print(f"Recording for {seconds:.0f}s (Ctrl+C to stop early)...")
+            time.sleep(seconds)
+        else:
+            input("Recording... press Enter to stop.\n")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        recorder.stop()
+    result = transcribe_meeting(recorder, workers, model_name)
+    result["recording_id"] = finish_meeting(recorder, result, model_name)
+    print(result["text"] or "No speech detected.")
+    archive.archiver.join()  # Don't exit while tracks are still being archived
+    return result
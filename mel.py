@@ -0,0 +1,170 @@
+"""Incremental log-mel spectrogram matching Whisper's front end, computed while recording.
+
+Whisper's log_mel_spectrogram() runs a centred 400-point STFT (hop 160, periodic Hann
+window, reflect padding) over the whole clip, projects the power spectrum onto a mel
+filter bank and normalises the log10 values against the clip's maximum. Everything but
+that final normalisation is local to each 25 ms frame, so MelStream computes the frames
+as blocks arrive and only the normalisation (and a few frames at the edges) is left for
+when the recording stops.
+"""
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+SAMPLE_RATE = 16000
+N_FFT = 400
+HOP_LENGTH = 160
+N_SAMPLES = 30 * SAMPLE_RATE  # Padding whisper.transcribe() appends before computing features
+LOG_FLOOR = -10.0             # log10 of the power clamp, i.e. the value of an all-zero frame
+RECOMPUTE_CHUNK_FRAMES = 1024 # Frames gathered at once when computing frames out of order
+
+# Periodic Hann window, as torch.hann_window(N_FFT) returns
+WINDOW = (0.5 - 0.5 * np.cos(2 * np.pi * np.arange(N_FFT) / N_FFT)).astype(np.float32)
+
+_filter_cache = {}
+
+def _hz_to_mel(hz):
+    """Slaney mel scale: linear below 1 kHz, logarithmic above."""
+    hz = np.asarray(hz, dtype=np.float64)
+    linear = hz / (200.0 / 3)
+    log_region = 15.0 + np.log(np.maximum(hz, 1e-10) / 1000.0) / (np.log(6.4) / 27.0)
+    return np.where(hz >= 1000.0, log_region, linear)
+
+def _mel_to_hz(mel):
+    mel = np.asarray(mel, dtype=np.float64)
+    linear = mel * (200.0 / 3)
+    log_region = 1000.0 * np.exp((np.log(6.4) / 27.0) * (mel - 15.0))
+    return np.where(mel >= 15.0, log_region, linear)
+
+def design_mel_filters(n_mels=80, sample_rate=SAMPLE_RATE, n_fft=N_FFT):
+    """Slaney-normalised triangular mel filters, as librosa.filters.mel() builds Whisper's bank."""
+    fft_freqs = np.linspace(0, sample_rate / 2, 1 + n_fft // 2)
+    mel_freqs = _mel_to_hz(np.linspace(_hz_to_mel(0.0), _hz_to_mel(sample_rate / 2), n_mels + 2))
+    widths = np.diff(mel_freqs)
+    ramps = mel_freqs[:, None] - fft_freqs[None, :]
+    lower = -ramps[:-2] / widths[:-1, None]
+    upper = ramps[2:] / widths[1:, None]
+    weights = np.maximum(0, np.minimum(lower, upper))
+    weights *= (2.0 / (mel_freqs[2:] - mel_freqs[:-2]))[:, None]
+    return weights.astype(np.float32)
+
+def mel_filters(n_mels=80):
+    """Whisper's own filter bank when the package is installed, otherwise the same design."""
+    if n_mels not in _filter_cache:
+        try:
+            from whisper.audio import mel_filters as whisper_mel_filters
+            filters = whisper_mel_filters("cpu", n_mels).numpy()
+        except ImportError:
+            filters = design_mel_filters(n_mels)
+        _filter_cache[n_mels] = np.ascontiguousarray(filters, dtype=np.float32)
+    return _filter_cache[n_mels]
+
+def log_mel_frames(windows, filters):
+    """log10 mel power of (frames, N_FFT) sample windows; returns (frames, n_mels) float32."""
+    spectrum = np.fft.rfft(windows * WINDOW, axis=1)
+    power = (spectrum.real ** 2 + spectrum.imag ** 2).astype(np.float32)
+    return np.log10(np.maximum(power @ filters.T, 1e-10))
+
+def normalize(log_spec):
+    """Whisper's dynamic-range clamp and scaling; (frames, n_mels) in, (n_mels, frames) out."""
+    log_spec = np.maximum(log_spec, log_spec.max() - 8.0)
+    return np.ascontiguousarray(((log_spec + 4.0) / 4.0).T, dtype=np.float32)
+
+def _gather_windows(signal, padded_length, centers):
+    """Sample windows centred on `centers`, with Whisper's reflect padding at both ends.
+
+    `signal` is followed by zeros up to `padded_length` before the end is reflected.
+    """
+    index = centers[:, None] + np.arange(-(N_FFT // 2), N_FFT // 2)
+    index = np.abs(index)  # Reflect at the start
+    index = np.where(index >= padded_length, 2 * (padded_length - 1) - index, index)
+    inside = index < len(signal)
+    return np.where(inside, signal[np.minimum(index, len(signal) - 1)], 0.0).astype(np.float32)
+
+class MelStream:
+    """Log-mel frames of a recording, updated block by block as the audio arrives.
+
+    process() takes 16 kHz mono blocks and computes every frame whose samples have all
+    arrived. features() then returns the normalised log-mel spectrogram Whisper would
+    compute for the recording (or for a concatenation of regions of it), reusing the
+    stored frames and computing only those that straddle a region boundary or the end.
+    """
+
+    def __init__(self, n_mels=80, capacity_seconds=60):
+        self.n_mels = n_mels
+        self.filters = mel_filters(n_mels)
+        self.log_spec = np.empty((int(capacity_seconds * SAMPLE_RATE) // HOP_LENGTH + 1, n_mels),
+                                 dtype=np.float32)
+        self.reset()
+
+    def __len__(self):
+        return self.count
+
+    def reset(self):
+        self.count = 0          # Frames computed so far
+        self.samples_seen = 0   # Samples received so far
+        self.pending = np.zeros(0, dtype=np.float32)  # Reflect-padded samples not yet fully framed
+        self.primed = False     # Whether the start padding has been prepended
+
+    def process(self, block):
+        """Add a block of samples and compute the frames it completes; returns how many."""
+        block = np.asarray(block, dtype=np.float32).reshape(-1)
+        self.samples_seen += len(block)
+        self.pending = np.concatenate([self.pending, block])
+        if not self.primed:
+            if len(self.pending) <= N_FFT // 2:
+                return 0  # The start padding reflects the first N_FFT // 2 samples
+            self.pending = np.concatenate([self.pending[N_FFT // 2:0:-1], self.pending])
+            self.primed = True
+        if len(self.pending) < N_FFT:
+            return 0
+
+        n = (len(self.pending) - N_FFT) // HOP_LENGTH + 1
+        if self.count + n > len(self.log_spec):
+            grown = np.empty((max(2 * len(self.log_spec), self.count + n), self.n_mels), dtype=np.float32)
+            grown[:self.count] = self.log_spec[:self.count]
+            self.log_spec = grown
+        windows = sliding_window_view(self.pending, N_FFT)[::HOP_LENGTH][:n]
+        self.log_spec[self.count:self.count + n] = log_mel_frames(windows, self.filters)
+        self.count += n
+        self.pending = self.pending[n * HOP_LENGTH:]
+        return n
+
+    def features(self, audio_data, regions=None, padding=N_SAMPLES):
+        """Normalised (n_mels, frames) log-mel of audio_data[start:end] for each region, concatenated.
+
+        `audio_data` must be the samples passed to process(). With the default padding
+        the result equals whisper.audio.log_mel_spectrogram(audio, n_mels, padding=N_SAMPLES),
+        which is what whisper.transcribe() computes for the same audio.
+        """
+        audio_data = np.asarray(audio_data, dtype=np.float32).reshape(-1)
+        if regions is None:
+            regions = [(0, len(audio_data))]
+        starts = np.array([start for start, _ in regions], dtype=np.int64)
+        lengths = np.array([end - start for start, end in regions], dtype=np.int64)
+        offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+        signal = audio_data if len(regions) == 1 and regions[0] == (0, len(audio_data)) else \
+            np.concatenate([audio_data[start:end] for start, end in regions])
+        padded_length = len(signal) + padding
+        total = padded_length // HOP_LENGTH  # Whisper drops the STFT's last frame
+
+        centers = np.arange(total, dtype=np.int64) * HOP_LENGTH
+        low, high = centers - N_FFT // 2, centers + N_FFT // 2
+        region = np.clip(np.searchsorted(offsets, low, side="right") - 1, 0, len(regions) - 1)
+        source = starts[region] + centers - offsets[region]  # Centre in the original recording
+        stored = ((low >= 0) & (high <= offsets[region] + lengths[region]) & (source % HOP_LENGTH == 0)
+                  & (source // HOP_LENGTH < self.count) & (source + N_FFT // 2 <= self.samples_seen))
+        silent = low >= len(signal)  # Windows entirely in the zero padding
+
+        log_spec = np.empty((total, self.n_mels), dtype=np.float32)
+        log_spec[stored] = self.log_spec[source[stored] // HOP_LENGTH]
+        log_spec[silent] = LOG_FLOOR
+        missing = np.flatnonzero(~stored & ~silent)
+        for i in range(0, len(missing), RECOMPUTE_CHUNK_FRAMES):
+            frames = missing[i:i + RECOMPUTE_CHUNK_FRAMES]
+            windows = _gather_windows(signal, padded_length, centers[frames])
+            log_spec[frames] = log_mel_frames(windows, self.filters)
+        return normalize(log_spec)
+
+def log_mel_spectrogram(audio_data, n_mels=80, padding=0):
+    """One-shot equivalent of whisper.audio.log_mel_spectrogram() for a float32 array."""
+    return MelStream(n_mels, capacity_seconds=0).features(audio_data, padding=padding)
@@ -0,0 +1,123 @@
+"""Pipeline instrumentation: timed spans per stage, event counters and queue-depth gauges.
+
+Everything is process-wide and thread-safe. The collected data can be dumped as JSON or in
+the Prometheus text format (see write_dump()) and is shown in the GUI's stats panel.
+"""
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+RECENT_SAMPLES = 256  # Span durations kept per stage for percentiles
+METRICS_FILE = os.getenv("TRANSCRIBE_METRICS_FILE")  # Dump written at exit (.prom for Prometheus format)
+
+_lock = threading.Lock()
+spans = {}     # stage -> {"count", "total", "min", "max", "last", "recent"}
+counters = {}  # name -> int
+gauges = {}    # name -> float
+
+def record_span(name, seconds):
+    """Record one timed occurrence of a pipeline stage."""
+    with _lock:
+        stats = spans.get(name)
+        if stats is None:
+            stats = spans[name] = {"count": 0, "total": 0.0, "min": seconds, "max": seconds,
+                                   "last": seconds, "recent": deque(maxlen=RECENT_SAMPLES)}
+        stats["count"] += 1
+        stats["total"] += seconds
+        stats["min"] = min(stats["min"], seconds)
+        stats["max"] = max(stats["max"], seconds)
+        stats["last"] = seconds
+        stats["recent"].append(seconds)
+
+@contextmanager
+def span(name):
+    """Time the enclosed block as one occurrence of stage `name`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(name, time.perf_counter() - start)
+
+def increment(name, amount=1):
+    with _lock:
+        counters[name] = counters.get(name, 0) + amount
+
+def set_gauge(name, value):
+    gauges[name] = value
+
+def reset():
+    with _lock:
+        spans.clear()
+        counters.clear()
+        gauges.clear()
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def snapshot():
+    """Current metrics as plain data."""
+    with _lock:
+        stage_stats = {}
+        for name, stats in spans.items():
+            recent = list(stats["recent"])
+            stage_stats[name] = {
+                "count": stats["count"],
+                "total_seconds": stats["total"],
+                "mean_seconds": stats["total"] / stats["count"],
+                "min_seconds": stats["min"],
+                "max_seconds": stats["max"],
+                "last_seconds": stats["last"],
+                "p50_seconds": _percentile(recent, 0.50),
+                "p95_seconds": _percentile(recent, 0.95),
+            }
+        return {"spans": stage_stats, "counters": dict(counters), "gauges": dict(gauges)}
+
+def to_json():
+    return json.dumps(snapshot(), indent=2)
+
+def to_prometheus(prefix="transcribe"):
+    """Metrics in the Prometheus text exposition format."""
+    data = snapshot()
+    lines = [f"# TYPE {prefix}_stage_seconds summary"]
+    for name, stats in sorted(data["spans"].items()):
+        lines.append(f'{prefix}_stage_seconds{{stage="{name}",quantile="0.5"}} {stats["p50_seconds"]:.6f}')
+        lines.append(f'{prefix}_stage_seconds{{stage="{name}",quantile="0.95"}} {stats["p95_seconds"]:.6f}')
+        lines.append(f'{prefix}_stage_seconds_sum{{stage="{name}"}} {stats["total_seconds"]:.6f}')
+        lines.append(f'{prefix}_stage_seconds_count{{stage="{name}"}} {stats["count"]}')
+    for name, value in sorted(data["counters"].items()):
+        lines.append(f"# TYPE {prefix}_{name}_total counter")
+        lines.append(f"{prefix}_{name}_total {value}")
+    for name, value in sorted(data["gauges"].items()):
+        lines.append(f"# TYPE {prefix}_{name} gauge")
+        lines.append(f"{prefix}_{name} {value}")
+    return "\n".join(lines) + "\n"
+
+def write_dump(path=None):
+    """Write the metrics to `path` (default TRANSCRIBE_METRICS_FILE); .prom selects Prometheus format."""
+    path = path or METRICS_FILE
+    if not path:
+        return None
+    with open(path, "w") as f:
+        f.write(to_prometheus() if path.endswith(".prom") else to_json())
+    print(f"Metrics written to {path}")
+    return path
+
+def format_table():
+    """Human-readable summary for the stats panel."""
+    data = snapshot()
+    lines = [f"{'stage':<14}{'count':>7}{'last ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'total s':>10}"]
+    for name, stats in sorted(data["spans"].items()):
+        lines.append(f"{name:<14}{stats['count']:>7}{stats['last_seconds'] * 1000:>10.3f}"
+                     f"{stats['p50_seconds'] * 1000:>10.3f}{stats['p95_seconds'] * 1000:>10.3f}"
+                     f"{stats['total_seconds']:>10.2f}")
+    if data["counters"]:
+        lines.append("")
+        lines.extend(f"{name:<24}{value:>8g}" for name, value in sorted(data["counters"].items()))
+    if data["gauges"]:
+        lines.append("")
+        lines.extend(f"{name:<24}{value:>8.2f}" for name, value in sorted(data["gauges"].items()))
+    return "\n".join(lines)
@@ -0,0 +1,79 @@
+"""Block-wise polyphase resampling and downmixing of device-rate audio to 16 kHz mono."""
+from math import gcd
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+RESAMPLE_ZERO_CROSSINGS = 16  # Sinc lobes kept on each side of the filter centre
+RESAMPLE_ROLLOFF = 0.92       # Cutoff as a fraction of the output Nyquist frequency
+RESAMPLE_KAISER_BETA = 8.6    # Stopband attenuation of roughly 90 dB
+
+def design_filter_bank(up, down):
+    """Windowed-sinc low-pass filter split into `up` phases of equal length.
+
+    Returns an (up, taps) array whose rows are reversed, ready to be applied to windows
+    of input samples in chronological order.
+    """
+    ratio = max(up, down)
+    length = 2 * RESAMPLE_ZERO_CROSSINGS * ratio + 1
+    cutoff = RESAMPLE_ROLLOFF / (2 * ratio)  # Cycles per sample at the upsampled rate
+    n = np.arange(length) - (length - 1) / 2
+    h = 2 * cutoff * np.sinc(2 * cutoff * n) * np.kaiser(length, RESAMPLE_KAISER_BETA)
+    h *= up  # Compensate for the zeros inserted by upsampling
+    taps = -(-length // up)
+    h = np.concatenate([h, np.zeros(taps * up - length)])
+    # Phase p uses h[p], h[p + up], h[p + 2 * up], ... applied to x[base], x[base - 1], ...
+    return np.ascontiguousarray(h.reshape(taps, up).T[:, ::-1], dtype=np.float32)
+
+class Resampler:
+    """Stateful rational resampler: feed device blocks of any size, get 16 kHz mono out.
+
+    Multi-channel blocks are downmixed by averaging. Filter history carries over between
+    blocks, so the output is identical to resampling the whole recording at once.
+    """
+
+    def __init__(self, input_rate, output_rate=16000):
+        divisor = gcd(int(input_rate), int(output_rate))
+        self.input_rate = int(input_rate)
+        self.output_rate = int(output_rate)
+        self.up = int(output_rate) // divisor
+        self.down = int(input_rate) // divisor
+        self.passthrough = self.up == self.down
+        self.bank = design_filter_bank(self.up, self.down)
+        self.taps = self.bank.shape[1]
+        self.history = np.zeros(self.taps - 1, dtype=np.float32)
+        self.inputs_seen = 0   # Input samples consumed so far
+        self.outputs_made = 0  # Output samples produced so far
+
+    @property
+    def delay_seconds(self):
+        """Group delay of the filter (the output lags the input by this much)."""
+        return RESAMPLE_ZERO_CROSSINGS * max(self.up, self.down) / (self.up * self.input_rate)
+
+    def process(self, block):
+        """Resample one (frames,) or (frames, channels) block; returns float32 mono."""
+        block = np.asarray(block, dtype=np.float32)
+        if block.ndim == 2:
+            block = block[:, 0] if block.shape[1] == 1 else block.mean(axis=1, dtype=np.float32)
+        if self.passthrough:
+            return block.copy()
+
+        samples = np.concatenate([self.history, block])
+        first_input = self.inputs_seen - (self.taps - 1)  # Input index of samples[0]
+        self.inputs_seen += len(block)
+        # Every output whose newest input sample has arrived can be computed now
+        end = (self.inputs_seen * self.up + self.down - 1) // self.down
+        positions = np.arange(self.outputs_made, end, dtype=np.int64) * self.down
+        self.outputs_made = end
+        self.history = samples[len(samples) - (self.taps - 1):]
+        if len(positions) == 0:
+            return np.zeros(0, dtype=np.float32)
+
+        newest = positions // self.up - first_input
+        windows = sliding_window_view(samples, self.taps)[newest - (self.taps - 1)]
+        return np.einsum("ij,ij->i", windows, self.bank[positions % self.up])
+
+    def reset(self):
+        self.history.fill(0.0)
+        self.inputs_seen = 0
+        self.outputs_made = 0
@@ -0,0 +1,346 @@
+"""HTTP/WebSocket transcription server that keeps models resident in a bounded worker pool."""
+import asyncio
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from aiohttp import web, WSMsgType
+
+import backends
+import engine
+import metrics
+
+UPLOAD_FORMATS = ["file", "pcm_f32le", "pcm_s16le"]
+STREAM_FORMATS = ["pcm_f32le", "pcm_s16le"]
+
+# Set up by run_server()
+job_pool = None     # ProcessPoolExecutor, one resident model per worker
+job_slots = None    # asyncio.Semaphore bounding running + queued jobs
+pool_workers = 0
+batch_size = 1      # Uploads decoded together in one job (1 = no batching)
+batch_wait = 0.05   # Seconds the batcher waits for more uploads after the first
+upload_queue = None # asyncio.Queue of (data, fmt, future) feeding upload_batcher()
+upload_queue_limit = 0  # Queued uploads beyond this get 503
+jobs_in_flight = 0  # Jobs holding a slot (running or waiting for a worker)
+
+def pcm_to_float(data, fmt):
+    """Convert raw little-endian 16 kHz mono PCM bytes to float32 samples."""
+    if fmt == "pcm_s16le":
+        return np.frombuffer(data, dtype="<i2").astype(np.float32) / 32768.0
+    return np.frombuffer(data, dtype="<f4").astype(np.float32, copy=False)
+
+def transcript_summary(result):
+    """The parts of a Whisper result that are sent to clients."""
+    return {
+        "text": result.get("text", "").strip(),
+        "language": result.get("language"),
+        "segments": [
+            {"start": segment["start"], "end": segment["end"], "text": segment["text"].strip()}
+            for segment in result.get("segments", [])
+        ],
+    }
+
+# --------------------- Worker-side jobs --------------------- #
+def decode_upload(data, fmt):
+    """Decode an uploaded body to float32 16 kHz mono samples."""
+    if fmt == "file":
+        # Container formats are decoded from a temp file (WAV directly, anything else via ffmpeg)
+        with tempfile.NamedTemporaryFile(suffix=".wav" if data[:4] == b"RIFF" else "", delete=False) as f:
+            f.write(data)
+        try:
+            return engine.load_audio_file(f.name)
+        finally:
+            os.unlink(f.name)
+    return pcm_to_float(data, fmt)
+
+def transcribe_upload_job(data, fmt):
+    """Decode an uploaded body and transcribe it (runs in a pool worker)."""
+    start = time.perf_counter()
+    audio_data = decode_upload(data, fmt)
+    transcript = engine.transcribe_cached(audio_data)
+    result = transcript_summary(transcript)
+    result["cached"] = transcript.get("cached", False)
+    result["duration"] = len(audio_data) / engine.RATE
+    result["decode_time"] = time.perf_counter() - start
+    return result
+
+def transcribe_upload_batch_job(uploads, window_batch_size):
+    """Transcribe several uploads with their windows batched together (runs in a pool worker).
+
+    Returns one result per upload, or {"error": ...} for uploads that could not be decoded.
+    """
+    start = time.perf_counter()
+    results = [None] * len(uploads)
+    recordings = []
+    for i, (data, fmt) in enumerate(uploads):
+        try:
+            recordings.append((i, decode_upload(data, fmt)))
+        except Exception as e:
+            results[i] = {"error": f"{e.__class__.__name__}: {str(e)}"}
+    transcripts = engine.transcribe_many_cached([audio_data for _, audio_data in recordings],
+                                                batch_size=window_batch_size) if recordings else []
+    decode_time = time.perf_counter() - start
+    for (i, audio_data), transcript in zip(recordings, transcripts):
+        results[i] = transcript_summary(transcript)
+        results[i]["cached"] = transcript.get("cached", False)
+        results[i]["duration"] = len(audio_data) / engine.RATE
+        results[i]["decode_time"] = decode_time
+        results[i]["batched_with"] = len(uploads)
+    return results
+
+def transcribe_tail_job(audio_data, prompt):
+    """Transcribe the last, uncommitted part of a stream (runs in a pool worker)."""
+    return engine.transcribe_audio(audio_data, initial_prompt=prompt).get("text", "").strip()
+
+def stream_window_job(window, prompt):
+    """Decode one streaming window (runs in a pool worker)."""
+    return engine.split_stream_window(window, prompt)
+
+def worker_ready():
+    """No-op job used to start every worker (and load its model) before serving."""
+    return os.getpid()
+
+# --------------------- Handlers --------------------- #
+async def run_job(fn, *args):
+    """Run a job on the pool, holding one of the bounded job slots while it runs."""
+    global jobs_in_flight
+    async with job_slots:
+        jobs_in_flight += 1
+        metrics.set_gauge("jobs_in_flight", jobs_in_flight)
+        try:
+            with metrics.span(fn.__name__):
+                return await asyncio.get_running_loop().run_in_executor(job_pool, fn, *args)
+        finally:
+            jobs_in_flight -= 1
+            metrics.set_gauge("jobs_in_flight", jobs_in_flight)
+
+def busy_response():
+    metrics.increment("rejected_busy")
+    return web.json_response({"error": "server busy, retry later"}, status=503,
+                             headers={"Retry-After": "1"})
+
+async def run_upload_batch(items):
+    """Run one batch job for queued uploads and hand each waiting request its result."""
+    try:
+        results = await run_job(transcribe_upload_batch_job, [(data, fmt) for data, fmt, _ in items],
+                                max(batch_size, engine.BATCH_SIZE))
+    except Exception as e:
+        results = [{"error": f"{e.__class__.__name__}: {str(e)}"}] * len(items)
+    metrics.increment("upload_batches")
+    metrics.increment("uploads_batched", len(items))
+    for (_, _, future), result in zip(items, results):
+        if not future.done():
+            future.set_result(result)
+
+async def upload_batcher():
+    """Group uploads that arrive within batch_wait of each other into one batch job."""
+    loop = asyncio.get_running_loop()
+    while True:
+        items = [await upload_queue.get()]
+        deadline = loop.time() + batch_wait
+        while len(items) < batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                items.append(await asyncio.wait_for(upload_queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        # Wait for a free job slot here, so uploads keep accumulating into the next batch meanwhile
+        await job_slots.acquire()
+        job_slots.release()
+        asyncio.ensure_future(run_upload_batch(items))
+
+async def handle_health(request):
+    return web.json_response({
+        "model": engine.WHISPER_MODEL,
+        "backend": backends.WHISPER_BACKEND,
+        "workers": pool_workers,
+        "busy": job_slots.locked(),
+    })
+
+async def handle_metrics(request):
+    """Server-side job timings and queue depth in the Prometheus text format (?format=json for JSON)."""
+    if request.query.get("format") == "json":
+        return web.json_response(metrics.snapshot())
+    return web.Response(text=metrics.to_prometheus(), content_type="text/plain")
+
+async def handle_transcribe(request):
+    """POST an audio file (or raw PCM with ?format=pcm_f32le|pcm_s16le) and get the transcript."""
+    fmt = request.query.get("format", "file")
+    if fmt not in UPLOAD_FORMATS:
+        return web.json_response({"error": f"format must be one of {UPLOAD_FORMATS}"}, status=400)
+    # Backpressure: refuse new work instead of letting the queue grow without bound
+    if batch_size > 1:
+        busy = upload_queue.qsize() >= upload_queue_limit
+    else:
+        busy = job_slots.locked()
+    if busy:
+        return busy_response()
+
+    data = await request.read()
+    if not data:
+        return web.json_response({"error": "empty request body"}, status=400)
+    start = time.perf_counter()
+    try:
+        if batch_size > 1:
+            future = asyncio.get_running_loop().create_future()
+            await upload_queue.put((data, fmt, future))
+            result = await future
+            if "error" in result:
+                raise ValueError(result["error"])
+        else:
+            result = await run_job(transcribe_upload_job, data, fmt)
+    except Exception as e:
+        return web.json_response({"error": f"{e.__class__.__name__}: {str(e)}"}, status=422)
+    result["total_time"] = time.perf_counter() - start
+    # Cache lookups happen in the workers; count them here so /metrics shows them
+    metrics.increment("cache_hits" if result["cached"] else "cache_misses")
+    return web.json_response(result)
+
+async def handle_stream(request):
+    """WebSocket: binary frames carry PCM, {"type": "end"} finishes.
+
+    The server replies with {"type": "partial", "committed", "partial"} messages while audio
+    arrives and one {"type": "final", "text"} message after "end".
+    """
+    fmt = request.query.get("format", "pcm_f32le")
+    ws = web.WebSocketResponse(max_msg_size=16 * 1024 * 1024)
+    await ws.prepare(request)
+    if fmt not in STREAM_FORMATS:
+        await ws.send_json({"type": "error", "error": f"format must be one of {STREAM_FORMATS}"})
+        await ws.close()
+        return ws
+
+    window_samples = int(engine.STREAM_WINDOW_SECONDS * engine.RATE)
+    min_samples = int(engine.STREAM_MIN_SECONDS * engine.RATE)
+    pending = np.zeros(0, dtype=np.float32)  # Audio after the committed point
+    chunks = []                              # Received since `pending` was last assembled
+    committed_text = ""
+    window_task = None
+    ending = False
+
+    def take_pending():
+        nonlocal pending, chunks
+        if chunks:
+            pending = np.concatenate([pending] + chunks)
+            chunks = []
+        return pending
+
+    def start_window():
+        """Decode the next window if enough audio is waiting.
+
+        Partial decodes are skipped, not queued, while the pool is saturated.
+        """
+        nonlocal window_task
+        if window_task is not None or job_slots.locked():
+            return
+        audio_data = take_pending()
+        if len(audio_data) >= min_samples:
+            window_task = asyncio.ensure_future(decode_window(
+                audio_data[:window_samples].copy(), committed_text[-engine.STREAM_PROMPT_CHARS:] or None))
+
+    async def decode_window(window, prompt):
+        """Decode one window and send its result as soon as it is ready, even if the client is quiet."""
+        nonlocal pending, committed_text, window_task
+        try:
+            stable_text, stable_samples, partial_text = await run_job(stream_window_job, window, prompt)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            await ws.send_json({"type": "error", "error": f"{e.__class__.__name__}: {str(e)}"})
+        else:
+            committed_text = engine.join_text(committed_text, stable_text)
+            pending = take_pending()[stable_samples:]
+            await ws.send_json({"type": "partial", "committed": committed_text, "partial": partial_text})
+        finally:
+            window_task = None
+        if not ending:
+            start_window()  # Audio that arrived during the decode
+
+    async for msg in ws:
+        if msg.type == WSMsgType.BINARY:
+            chunks.append(pcm_to_float(msg.data, fmt))
+        elif msg.type == WSMsgType.TEXT:
+            try:
+                if json.loads(msg.data).get("type") == "end":
+                    break
+            except ValueError:
+                await ws.send_json({"type": "error", "error": "invalid control message"})
+        else:
+            break
+        start_window()
+
+    ending = True
+    if ws.closed:
+        if window_task is not None:
+            window_task.cancel()
+        return ws
+
+    stopped = time.perf_counter()
+    if window_task is not None:
+        await asyncio.wait([window_task])  # Its result is sent by decode_window()
+    tail = take_pending()
+    if len(tail) > 0:
+        try:
+            tail_text = await run_job(transcribe_tail_job, tail,
+                                      committed_text[-engine.STREAM_PROMPT_CHARS:] or None)
+            committed_text = engine.join_text(committed_text, tail_text)
+        except Exception as e:
+            await ws.send_json({"type": "error", "error": f"{e.__class__.__name__}: {str(e)}"})
+    await ws.send_json({"type": "final", "text": committed_text,
+                        "time_to_final": time.perf_counter() - stopped})
+    await ws.close()
+    return ws
+
+def run_server(host="127.0.0.1", port=8765, workers=1, queue_size=4, model_name=None, upload_batch_size=1):
+    """Serve transcription over HTTP and WebSocket until interrupted.
+
+    With upload_batch_size > 1, uploads arriving together are transcribed in one batched job.
+    """
+    global job_pool, pool_workers, batch_size
+    model_name = model_name or engine.WHISPER_MODEL
+    engine.set_active_model(model_name)
+    # Split the cores between workers unless a per-worker thread count was configured
+    threads = backends.INTRA_OP_THREADS or max(1, (os.cpu_count() or 1) // workers)
+    pool_workers = workers
+    batch_size = max(1, upload_batch_size)
+    job_pool = ProcessPoolExecutor(max_workers=workers, initializer=engine.init_worker_process,
+                                   initargs=(model_name, threads, backends.WHISPER_BACKEND,
+                                             backends.INTER_OP_THREADS))
+    # Start every worker (each loads its model in the initializer) before accepting requests
+    pids = {future.result() for future in [job_pool.submit(worker_ready) for _ in range(workers)]}
+    print(f"{len(pids)} workers ready")
+
+    async def on_startup(app):
+        global job_slots, upload_queue, upload_queue_limit
+        # Jobs beyond the running ones wait here; once it is full, new requests get 503
+        job_slots = asyncio.Semaphore(workers + queue_size)
+        if batch_size > 1:
+            upload_queue = asyncio.Queue()
+            upload_queue_limit = batch_size * (workers + queue_size)
+            app["upload_batcher"] = asyncio.ensure_future(upload_batcher())
+
+    async def on_cleanup(app):
+        if "upload_batcher" in app:
+            app["upload_batcher"].cancel()
+
+    app = web.Application(client_max_size=256 * 1024 * 1024)
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    app.add_routes([
+        web.get("/health", handle_health),
+        web.get("/metrics", handle_metrics),
+        web.post("/transcribe", handle_transcribe),
+        web.get("/stream", handle_stream),
+    ])
+    print(f"Serving model '{model_name}' on http://{host}:{port} with {workers} workers "
+          f"({threads} threads each, {backends.WHISPER_BACKEND} backend), queue {queue_size}"
+          + (f", batching up to {batch_size} uploads" if batch_size > 1 else ""))
+    try:
+        web.run_app(app, host=host, port=port, print=None)
+    finally:
+        job_pool.shutdown(cancel_futures=True)
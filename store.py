@@ -0,0 +1,214 @@
+"""Local transcript store: every transcription with its segments, word timings and audio link.
+
+Transcripts live in one SQLite database with an FTS5 index over the segment text, so a
+search over years of dictation is a single indexed query. Each hit carries the segment's
+time range (and, when word timestamps were recorded, the matching word's start), so the
+audio can be played from the right offset without transcribing anything again.
+
+Word timings are stored per segment as a packed float32 (start, end) array next to the
+words joined by WORD_SEPARATOR, which keeps them compact and quick to unpack.
+"""
+import os
+import re
+import sqlite3
+import time
+import wave
+
+import numpy as np
+
+import metrics
+
+TRANSCRIPT_STORE_ENABLED = os.getenv("TRANSCRIBE_STORE", "1") == "1"
+TRANSCRIPT_DB = os.getenv("TRANSCRIBE_STORE_PATH",
+                          os.path.join(os.path.expanduser("~"), ".local", "share", "transcribe", "transcripts.db"))
+WORD_SEPARATOR = "\x1f"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS recordings (
+    id INTEGER PRIMARY KEY,
+    created REAL NOT NULL,
+    duration REAL,
+    model TEXT,
+    language TEXT,
+    audio_path TEXT,
+    text TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS segments (
+    id INTEGER PRIMARY KEY,
+    recording_id INTEGER NOT NULL REFERENCES recordings(id) ON DELETE CASCADE,
+    start_seconds REAL NOT NULL,
+    end_seconds REAL NOT NULL,
+    text TEXT NOT NULL,
+    words TEXT,
+    word_times BLOB
+);
+CREATE INDEX IF NOT EXISTS segments_by_recording ON segments(recording_id, start_seconds);
+CREATE VIRTUAL TABLE IF NOT EXISTS segments_fts USING fts5(
+    text, content='segments', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS segments_insert AFTER INSERT ON segments BEGIN
+    INSERT INTO segments_fts(rowid, text) VALUES (new.id, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS segments_delete AFTER DELETE ON segments BEGIN
+    INSERT INTO segments_fts(segments_fts, rowid, text) VALUES ('delete', old.id, old.text);
+END;
+"""
+
+def connect(path=None):
+    """Open (creating if needed) the transcript database."""
+    path = path or TRANSCRIPT_DB
+    if path != ":memory:":
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    connection = sqlite3.connect(path, timeout=10)
+    connection.row_factory = sqlite3.Row
+    connection.execute("PRAGMA journal_mode=WAL")  # Searches don't block a concurrent save
+    connection.execute("PRAGMA foreign_keys=ON")
+    connection.executescript(SCHEMA)
+    return connection
+
+def _pack_words(words):
+    """(joined words, float32 start/end blob) for a segment's word list, or (None, None)."""
+    if not words:
+        return None, None
+    times = np.array([(word["start"], word["end"]) for word in words], dtype=np.float32)
+    return WORD_SEPARATOR.join(word["word"] for word in words), times.tobytes()
+
+def unpack_words(row):
+    """A segment row's words as [{"word", "start", "end"}]."""
+    if not row["words"]:
+        return []
+    times = np.frombuffer(row["word_times"], dtype=np.float32).reshape(-1, 2)
+    return [{"word": word, "start": float(start), "end": float(end)}
+            for word, (start, end) in zip(row["words"].split(WORD_SEPARATOR), times)]
+
+def save(result, duration=None, model_name=None, audio_path=None, created=None, connection=None):
+    """Store a Whisper-style result ({"text", "segments", "language"}); returns the recording id."""
+    own_connection = connection is None
+    connection = connection or connect()
+    try:
+        with metrics.span("store_save"), connection:
+            cursor = connection.execute(
+                "INSERT INTO recordings (created, duration, model, language, audio_path, text) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (created or time.time(), duration, model_name, result.get("language"), audio_path,
+                 result.get("text", "").strip()))
+            recording_id = cursor.lastrowid
+            connection.executemany(
+                "INSERT INTO segments (recording_id, start_seconds, end_seconds, text, words, word_times) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(recording_id, float(segment["start"]), float(segment["end"]), segment["text"].strip(),
+                  *_pack_words(segment.get("words"))) for segment in result.get("segments", [])])
+        return recording_id
+    finally:
+        if own_connection:
+            connection.close()
+
+def fts_query(text):
+    """Turn free text into an FTS5 query: every word must match, the last one as a prefix."""
+    terms = re.findall(r"\w+", text)
+    if not terms:
+        return None
+    return " ".join(f'"{term}"' for term in terms[:-1]) + (" " if len(terms) > 1 else "") + f'"{terms[-1]}"*'
+
+def _match_offset(row, terms):
+    """Start of the first word in a segment that matches one of the search terms."""
+    for word in unpack_words(row):
+        token = re.sub(r"\W+", "", word["word"]).lower()
+        if any(token.startswith(term) for term in terms):
+            return word["start"]
+    return row["start_seconds"]
+
+def search(text, limit=20, connection=None):
+    """Segments matching `text`, best match first.
+
+    Each hit is a dict with the recording id, creation time, audio path, segment time range,
+    a highlighted snippet and `offset`, the time in the recording to play from.
+    """
+    query = fts_query(text)
+    if query is None:
+        return []
+    terms = [term.lower() for term in re.findall(r"\w+", text)]
+    own_connection = connection is None
+    connection = connection or connect()
+    try:
+        with metrics.span("store_search"):
+            rows = connection.execute(
+                "SELECT s.id, s.recording_id, s.start_seconds, s.end_seconds, s.text, s.words, s.word_times, "
+                "r.created, r.audio_path, snippet(segments_fts, 0, '[', ']', '...', 12) AS snippet "
+                "FROM segments_fts JOIN segments s ON s.id = segments_fts.rowid "
+                "JOIN recordings r ON r.id = s.recording_id "
+                "WHERE segments_fts MATCH ? ORDER BY bm25(segments_fts), r.created DESC LIMIT ?",
+                (query, limit)).fetchall()
+        return [{"recording_id": row["recording_id"], "segment_id": row["id"], "created": row["created"],
+                 "audio_path": row["audio_path"], "start": row["start_seconds"], "end": row["end_seconds"],
+                 "offset": _match_offset(row, terms), "text": row["text"], "snippet": row["snippet"]}
+                for row in rows]
+    finally:
+        if own_connection:
+            connection.close()
+
+def get_recording(recording_id, connection=None):
+    """A stored recording with its segments (and words), or None."""
+    own_connection = connection is None
+    connection = connection or connect()
+    try:
+        recording = connection.execute("SELECT * FROM recordings WHERE id = ?", (recording_id,)).fetchone()
+        if recording is None:
+            return None
+        segments = connection.execute("SELECT * FROM segments WHERE recording_id = ? ORDER BY start_seconds",
+                                      (recording_id,)).fetchall()
+        result = dict(recording)
+        result["segments"] = [{"start": row["start_seconds"], "end": row["end_seconds"], "text": row["text"],
+                               "words": unpack_words(row)} for row in segments]
+        return result
+    finally:
+        if own_connection:
+            connection.close()
+
+def delete(recording_id, connection=None):
+    own_connection = connection is None
+    connection = connection or connect()
+    try:
+        with connection:
+            connection.execute("DELETE FROM recordings WHERE id = ?", (recording_id,))
+    finally:
+        if own_connection:
+            connection.close()
+
+def stats(connection=None):
+    """Number of recordings and segments, and the database size in MB."""
+    own_connection = connection is None
+    connection = connection or connect()
+    try:
+        recordings = connection.execute("SELECT COUNT(*) FROM recordings").fetchone()[0]
+        segments = connection.execute("SELECT COUNT(*) FROM segments").fetchone()[0]
+    finally:
+        if own_connection:
+            connection.close()
+    size_mb = os.path.getsize(TRANSCRIPT_DB) / (1024 * 1024) if os.path.exists(TRANSCRIPT_DB) else 0.0
+    return recordings, segments, size_mb
+
+def set_audio_path(recording_id, audio_path, connection=None):
+    """Point a recording at its audio, e.g. once the archive copy has been written."""
+    own_connection = connection is None
+    connection = connection or connect()
+    try:
+        with connection:
+            connection.execute("UPDATE recordings SET audio_path = ? WHERE id = ?", (audio_path, recording_id))
+    finally:
+        if own_connection:
+            connection.close()
+
+def read_audio(audio_path, start, seconds):
+    """Samples [start, start + seconds) of a stored recording's 16-bit WAV or archive file, as float32.
+
+    Seeks straight to the offset, so it costs the same at the start or end of a long file.
+    """
+    if not audio_path.lower().endswith(".wav"):
+        import archive  # Deferred: it pulls in the capture engine
+        return archive.read(audio_path, start, seconds)
+    with wave.open(audio_path, "rb") as wf:
+        rate, channels = wf.getframerate(), wf.getnchannels()
+        wf.setpos(min(int(start * rate), wf.getnframes()))
+        frames = np.frombuffer(wf.readframes(int(seconds * rate)), dtype=np.int16)
+    return (frames.reshape(-1, channels).mean(axis=1) / 32768.0).astype(np.float32), rate
@@ -1,96 +1,128 @@
-import tkinter as tk
-from tkinter import scrolledtext
+import time
+STARTUP_T0 = time.perf_counter()  # Reference point for the startup-time measurement
+
 import threading
-import sounddevice as sd
-import numpy as np
-import wave
-import tempfile
-import pyperclip
-import whisper
-import openai
-from dotenv import load_dotenv
+import argparse
+import atexit
 import os
-import customtkinter as ctk
+import json
+import sys
+import numpy as np
 
-# Set appearance mode and default color theme
-ctk.set_appearance_mode("dark")  # Modes: "dark", "light"
-ctk.set_default_color_theme("blue")  # Themes: "blue", "green", "dark-blue"
+import archive
+import backends
+import devices
+import engine
+import jobs
+import metrics
+from resample import Resampler
+from engine import RATE, CHANNELS, STREAMING_ENABLED, LONG_RECORDING_ENABLED, MODEL_SIZES
+
+# customtkinter, imported by build_gui() so the command-line subcommands run without Tk
+ctk = None
 
 # Dark green accent color
 ACCENT_COLOR = "#2e8b57"  # Sea green
 
-# Load environment variables
-load_dotenv('/home/km/Software/transcribe/.env')  # Adjust path as needed
-
-# Set up OpenAI API key
-openai.api_key = os.getenv("OPENAI_API_KEY")
-if not openai.api_key:
-    raise ValueError("No OpenAI API key found. Please check your .env file.")
-
 # Global variables for audio recording
-audio_frames = []    # List to store recorded audio chunks
 stream = None        # The sounddevice stream
 is_recording = False # Flag to indicate if we are actively recording
+is_paused = False    # Flag to indicate a paused session whose audio should be kept on resume
 
-# Global variable to store the chosen device (default to None)
+# Show the live performance panel at startup
+STATS_PANEL_ENABLED = os.getenv("TRANSCRIBE_STATS", "0") == "1"
+
+# Push-to-talk: keep the input stream open and armed so Record starts instantly with pre-roll
+ARMED_ENABLED = os.getenv("TRANSCRIBE_ARMED", "0") == "1"
+HOTKEY = os.getenv("TRANSCRIBE_HOTKEY", "")  # Global Record/Stop hotkey, e.g. "<ctrl>+<alt>+space"
+stream_device = None  # Name of the device the open stream records from
+hotkey_listener = None
+
+# Finished recordings are transcribed as jobs, so recording can go on meanwhile
+job_queue = None
+
+# Name of the device chosen in the dialog (None: the last good device or the system default)
 selected_input_device = None
 
-# Audio configuration: Adjusted for Whisper's optimal performance
-RATE = 16000          # Changed from 48000 to 16000 for Whisper
-CHANNELS = 1
-CHUNK_SIZE = 4096     # Increased from 1024 to 4096 to reduce overflow warnings
-DEVICE_TIMEOUT = 1.0   # Device timeout in seconds
+def on_model_ready(name, entry, error):
+    """Report a finished background model load in the status bar (called off the UI thread)."""
+    if error is not None:
+        set_status(f"Error loading model '{name}': {error}")
+    elif entry is not None:
+        set_status(f"Model '{name}' ready (load {entry['load_time']:.1f}s, "
+                   f"warm-up {entry['warmup_time']:.1f}s)")
+
+def set_model(name):
+    """Switch the active Whisper model and warm it in the background."""
+    engine.set_active_model(name)
+    if name not in engine.loaded_models:
+        status_label.configure(text=f"Loading model '{name}'...")
+    engine.preload_model(name, on_model_ready)
 
 def audio_callback(indata, frames, time, status):
-    """This callback is called for each audio block from the microphone."""
-    global audio_frames
-    if status:
-        # Print overflow warnings (or other statuses) if they occur.
-        # Overflows are common if the callback is not fast enough.
-        if 'overflow' in str(status):
-            print(f"Audio callback warning: {status}")
-        else:
-            print(f"Audio Callback Status: {status}")
-    
+    """This callback is called for each audio block from the microphone.
+
+    It runs on the real-time audio thread, so it only queues the block (and the status flags)
+    for engine's consumer thread; it never touches Tk or takes a lock.
+    """
     try:
-        # Only append if we're recording and the block has data.
-        if is_recording and indata.size > 0:
-            audio_frames.append(indata.copy())
-            # Prevent memory overflow by limiting total recording time (300 seconds max)
-            if len(audio_frames) > (RATE * 300) // CHUNK_SIZE:
-                stop_recording()
-                status_label.configure(text="Recording stopped - maximum length reached")
+        # Only queue if we're recording (or armed, to fill the pre-roll) and the block has data.
+        if (is_recording or engine.armed) and indata.size > 0:
+            engine.capture_block(indata, status)
     except Exception as e:
         print(f"Error in audio callback: {e}")
 
+def on_capture_full():
+    """The bounded capture buffer filled up (called from the consumer thread)."""
+    root.after(0, stop_at_max_length)
+
+def stop_at_max_length():
+    stop_recording()
+    status_label.configure(text="Recording stopped - maximum length reached")
+
+def set_status(text):
+    """Update the status bar from any thread."""
+    root.after(0, lambda: status_label.configure(text=text))
+
 def list_audio_devices():
-    """List all available audio input devices and their properties."""
-    devices = sd.query_devices()
-    input_devices = []
+    """Enumerate the input devices into the registry and print them and their properties."""
+    input_devices = devices.registry.refresh()
     print("\nDetailed Audio Device List:")
     print("-" * 50)
     
-    for i, device in enumerate(devices):
-        try:
-            detailed_info = sd.query_devices(device=i)
-            if detailed_info['max_input_channels'] > 0:
-                print(f"\nDevice ID: [{i}] {detailed_info['name']}")
-                print(f"    API: {detailed_info['hostapi']}")
-                print(f"    Input channels: {detailed_info['max_input_channels']}")
-                print(f"    Sample Rate: {detailed_info['default_samplerate']}Hz")
-                print(f"    Is Default Device: {'*' if detailed_info.get('default_input') else ''}")
-                input_devices.append(i)
-        except Exception as e:
-            print(f"Error querying device {i}: {e}")
+    for device in input_devices:
+        print(f"\nDevice ID: [{device.index}] {device.name}")
+        print(f"    API: {device.hostapi}")
+        print(f"    Input channels: {device.channels}")
+        print(f"    Sample Rate: {device.default_rate}Hz")
+        print(f"    Is Default Device: {'*' if device.is_default else ''}")
     
     if not input_devices:
         print("\nNo input devices found! Please check your microphone connection.")
     
-    return devices
+    return input_devices
+
+def init_devices():
+    """Enumerate devices, probe their sample rates and start the hot-plug monitor (off the UI thread)."""
+    try:
+        list_audio_devices()
+        devices.registry.probe_rates()
+    except Exception as e:
+        print(f"Error listing audio devices: {e}")
+    devices.registry.busy = lambda: stream is not None
+    devices.registry.on_change = on_devices_changed
+    devices.registry.start_monitor()
+
+def on_devices_changed(added, removed):
+    """Report hot-plugged devices in the status bar (called from the monitor thread)."""
+    changes = [f"+ {name}" for name in added] + [f"- {name}" for name in removed]
+    print(f"Input devices changed: {', '.join(changes)}")
+    if not (is_recording or is_paused or engine.armed):
+        set_status(f"Input devices changed: {', '.join(changes)}")
 
 def create_device_selection_dialog():
     """Create a GUI dialog for device selection."""
-    global selected_input_device, RATE
+    import sounddevice as sd
     dialog = ctk.CTkToplevel(root)
     dialog.title("Select Audio Input Device")
     dialog.geometry("450x500")  # Smaller dialog size
@@ -115,31 +147,36 @@ def create_device_selection_dialog():
         global selected_input_device
         try:
             device_id = int(selected_device_str.get().split()[0])
-            device_info = sd.query_devices(device=device_id)
+            device = devices.registry.get(device_id)
             
-            # We'll keep RATE at 16000 for Whisper compatibility regardless of device
-            # but we'll make sure the device supports it
-            if device_info['default_samplerate'] < 16000:
-                info_text.delete("0.0", "end")
-                info_text.insert("0.0", f"Warning: Device {device_info['name']} has a sample rate of {device_info['default_samplerate']}Hz, which is below the recommended 16000Hz for Whisper.")
-                return
+            # The device is recorded at its own rate and converted to 16000Hz, so only
+            # rates too low to carry speech need a warning
+            info_text.delete("0.0", "end")
+            if device.default_rate < 16000:
+                info_text.insert("end", f"Warning: Device {device.name} has a sample rate of {device.default_rate}Hz. "
+                                        f"It will be upsampled to 16000Hz, which can reduce accuracy.\n")
             
             # Update the default device (input only)
             current_default = sd.default.device
             if current_default is None or not isinstance(current_default, (list, tuple)):
                 current_default = (None, None)
             sd.default.device = (device_id, current_default[1])
-            selected_input_device = device_id  # Store the selected device
+            selected_input_device = device.name  # Store the selected device
             
-            info_text.delete("0.0", "end")
-            info_text.insert("0.0", f"Testing device: {device_info['name']}\n")
+            native_rate = device.default_rate
+            channels = max(1, min(device.channels, engine.CAPTURE_MAX_CHANNELS))
+            info_text.insert("end", f"Testing device: {device.name}\n")
+            info_text.insert("end", f"Native format: {native_rate}Hz, {channels} channel(s) -> 16000Hz mono\n")
             info_text.insert("end", "Recording for 3 seconds...\n")
             info_text.insert("end", "Please speak into the microphone...\n")
             dialog.update()
             
             duration = 3
-            recording = sd.rec(int(duration * RATE), samplerate=RATE, channels=1, dtype='float32', device=device_id)
-            sd.wait()
+            with devices.registry.lock:  # No hot-plug refresh while the test stream is open
+                recording = sd.rec(int(duration * native_rate), samplerate=native_rate, channels=channels,
+                                   dtype='float32', device=device_id)
+                sd.wait()
+            recording = Resampler(native_rate, RATE).process(recording)
             
             max_level = np.max(np.abs(recording))
             info_text.insert("end", f"\nMaximum audio level: {max_level:.4f}\n")
@@ -169,20 +206,18 @@ def create_device_selection_dialog():
                 if current_default is None or not isinstance(current_default, (list, tuple)):
                     current_default = (None, None)
                 sd.default.device = (device_id, current_default[1])
-                selected_input_device = device_id  # Store the selected device
-                status_label.configure(text=f"Selected: {sd.query_devices(device=device_id)['name']}")
+                selected_input_device = devices.registry.get(device_id).name  # Store the selected device
+                status_label.configure(text=f"Selected: {selected_input_device}")
                 dialog.destroy()
+                if engine.armed and not (is_recording or is_paused):
+                    disarm_stream()
+                    arm_stream()  # Reopen the always-open stream on the new device
         except Exception as e:
             info_text.delete("0.0", "end")
             info_text.insert("0.0", f"Error setting device: {str(e)}")
     
-    devices = sd.query_devices()
-    device_list = []
-    
-    for i, device in enumerate(devices):
-        if device['max_input_channels'] > 0:
-            device_str = f"{i} - {device['name']} ({device['max_input_channels']} channels)"
-            device_list.append(device_str)
+    input_devices = devices.registry.devices()
+    device_list = [f"{device.index} - {device.name} ({device.channels} channels)" for device in input_devices]
     
     if device_list:
         device_selector_label = ctk.CTkLabel(frame, text="Audio Input Device:", 
@@ -195,7 +230,9 @@ def create_device_selection_dialog():
                                       button_color=ACCENT_COLOR,  # Using accent color
                                       button_hover_color="#1c6e3d")  # Darker accent for hover
         device_menu.pack(pady=5)
-        selected_device_str.set(device_list[0])
+        current = devices.registry.resolve(selected_input_device)
+        selected_device_str.set(next((entry for entry in device_list if entry.startswith(f"{current.index} - ")),
+                                     device_list[0]))
         
         button_frame = ctk.CTkFrame(frame, fg_color="transparent")
         button_frame.pack(pady=15, fill="x")  # Reduced padding
@@ -217,12 +254,13 @@ def create_device_selection_dialog():
         select_button.pack(side="right", padx=8)  # Reduced padding
         
         info_text.insert("0.0", "Available Input Devices:\n\n")
-        for i, device in enumerate(devices):
-            if device['max_input_channels'] > 0:
-                info_text.insert("end", f"Device ID: [{i}] {device['name']}\n")
-                info_text.insert("end", f"    Channels: {device['max_input_channels']}\n")
-                info_text.insert("end", f"    Sample Rate: {device['default_samplerate']}Hz\n")
-                info_text.insert("end", f"    Default: {'Yes' if device.get('default_input') else 'No'}\n\n")
+        for device in input_devices:
+            info_text.insert("end", f"Device ID: [{device.index}] {device.name}\n")
+            info_text.insert("end", f"    Channels: {device.channels}\n")
+            info_text.insert("end", f"    Sample Rate: {device.default_rate}Hz\n")
+            if device.rates is not None:
+                info_text.insert("end", f"    Supported Rates: {', '.join(str(rate) for rate in device.rates)}\n")
+            info_text.insert("end", f"    Default: {'Yes' if device.is_default else 'No'}\n\n")
     else:
         info_text.insert("0.0", "No input devices found!\n")
         info_text.insert("end", "Please check your microphone connection.")
@@ -266,86 +304,175 @@ def add_device_selection_button(control_frame):
     )
     device_button.pack(side="right", padx=10)
 
+def resolve_input_device():
+    """Pick the input device and capture format: (device_id, device, rate, channels).
+
+    Answered from the device registry, so only the first call (if the startup listing
+    hasn't finished yet) enumerates the devices.
+    """
+    device = devices.registry.resolve(selected_input_device)
+    
+    if engine.NATIVE_RATE_CAPTURE or not device.supports_rate(RATE):
+        # Capture in the device's own format; engine converts to 16 kHz mono off the audio thread
+        capture_rate = device.default_rate
+        capture_channels = max(1, min(device.channels, engine.CAPTURE_MAX_CHANNELS))
+    else:
+        # Let the host audio layer resample to 16000Hz inside the callback
+        capture_rate = RATE
+        capture_channels = CHANNELS
+    return device.index, device, capture_rate, capture_channels
+
+def open_input_stream(device_id, capture_rate, capture_channels):
+    """Create (but don't start) the input stream feeding audio_callback."""
+    import sounddevice as sd
+    return sd.InputStream(
+        samplerate=capture_rate,
+        channels=capture_channels,
+        callback=audio_callback,
+        device=device_id,
+        dtype='float32',
+        blocksize=engine.block_frames(capture_rate),  # Same block duration at any rate
+        latency='high'  # Changed from 'low' to 'high' to reduce overflow errors
+    )
+
+def show_recording_started(device_name):
+    """Update the buttons and status for a running recording."""
+    start_button.configure(state="disabled")
+    pause_button.configure(state="normal")
+    stop_button.configure(state="normal")
+    
+    # Animate the recording indicator
+    update_recording_indicator()
+    monitor_silence()
+    
+    status_label.configure(text=f"Recording... (Using {device_name})")
+
 def start_recording():
     """Start (or resume) audio recording."""
-    global stream, is_recording, audio_frames, selected_input_device, RATE
-    if not is_recording:
-        try:
-            audio_frames = []
-            # Determine the input device ID:
-            if selected_input_device is not None:
-                device_id = selected_input_device
-            elif (sd.default.device is not None and isinstance(sd.default.device, (list, tuple)) 
-                  and sd.default.device[0] is not None):
-                device_id = sd.default.device[0]
-            else:
-                # Get the first available input device
-                devices = sd.query_devices()
-                device_id = None
-                
-                # First try to find the HD Pro Webcam C920 if available
-                for i, device in enumerate(devices):
-                    if device['max_input_channels'] > 0 and 'HD Pro Webcam C920' in device['name']:
-                        device_id = i
-                        print(f"Found and using HD Pro Webcam C920 as device {i}")
-                        break
-                
-                # If webcam not found, use any available input device
-                if device_id is None:
-                    for i, device in enumerate(devices):
-                        if device['max_input_channels'] > 0:
-                            device_id = i
-                            break
-                
-                if device_id is None:
-                    raise ValueError("No input devices found")
-            
-            # Get device info
-            device_info = sd.query_devices(device=device_id)
-            
-            # Always use 16000Hz for Whisper, resampling if needed
-            supported_rate = 16000
+    global stream, is_recording, is_paused
+    if is_recording:
+        return
+    if engine.armed:
+        # The stream is already running: just open the recording window over its blocks
+        with metrics.span("record_start"):
+            engine.start_segment(long_recording_var.get(), resume=is_paused)
+            is_recording = True
+            if not is_paused:
+                engine.reset_silence_monitor()
+                if streaming_var.get():
+                    engine.start_streaming(
+                        lambda committed, partial: root.after(0, show_streaming_text, committed, partial))
+            is_paused = False
+        show_recording_started(stream_device)
+        return
+    try:
+        start = time.perf_counter()
+        with devices.registry.lock:  # No hot-plug refresh while the stream is being opened
+            device_id, device, capture_rate, capture_channels = resolve_input_device()
             
-            print(f"\nStarting recording with device: {device_info['name']}")
-            print(f"Sample rate: {supported_rate}Hz (fixed for Whisper)")
-            print(f"Channels: {CHANNELS}")
+            print(f"\nStarting recording with device: {device.name}")
+            print(f"Sample rate: {capture_rate}Hz (transcribed at {RATE}Hz)")
+            print(f"Channels: {capture_channels}")
             
             # Create and start the stream
-            stream = sd.InputStream(
-                samplerate=supported_rate,
-                channels=CHANNELS,
-                callback=audio_callback,
-                device=device_id,
-                dtype='float32',
-                blocksize=CHUNK_SIZE,
-                latency='high'  # Changed from 'low' to 'high' to reduce overflow errors
-            )
+            stream = open_input_stream(device_id, capture_rate, capture_channels)
             
+            if not is_paused:
+                engine.start_capture(long_recording_var.get(), capture_rate, capture_channels,
+                                     on_full=on_capture_full)
             stream.start()
-            is_recording = True
-            
-            # Update UI elements to reflect recording state
-            start_button.configure(state="disabled")
-            pause_button.configure(state="normal")
-            stop_button.configure(state="normal")
-            
-            # Animate the recording indicator
-            update_recording_indicator()
-            
-            status_label.configure(text=f"Recording... (Using {device_info['name']})")
-            
+        devices.registry.remember(device, capture_rate, capture_channels)
+        is_recording = True
+        if not is_paused:
+            engine.reset_silence_monitor()
+            if streaming_var.get():
+                engine.start_streaming(
+                    lambda committed, partial: root.after(0, show_streaming_text, committed, partial))
+        is_paused = False
+        metrics.record_span("record_start", time.perf_counter() - start)
+        
+        # Update UI elements to reflect recording state
+        show_recording_started(device.name)
+        
+    except Exception as e:
+        error_msg = f"Recording error: {str(e)}"
+        status_label.configure(text=error_msg)
+        print(f"Detailed error: {e.__class__.__name__}: {str(e)}")
+        # Reset the stream if there was an error
+        if stream is not None:
+            try:
+                stream.close()
+            except:
+                pass
+            stream = None
+        is_recording = False
+
+def toggle_recording():
+    """Record/Stop from the global hotkey."""
+    if is_recording:
+        stop_recording()
+    else:
+        start_recording()
+
+def arm_stream():
+    """Open the input stream now and keep it running, so Record only moves a cursor."""
+    global stream, stream_device
+    try:
+        with devices.registry.lock:  # No hot-plug refresh while the stream is being opened
+            device_id, device, capture_rate, capture_channels = resolve_input_device()
+            stream = open_input_stream(device_id, capture_rate, capture_channels)
+            engine.arm_capture(capture_rate, capture_channels, on_full=on_capture_full)
+            stream.start()
+        devices.registry.remember(device, capture_rate, capture_channels)
+        stream_device = device.name
+        print(f"Armed: {stream_device} at {capture_rate}Hz x {capture_channels}, "
+              f"{engine.PREROLL_SECONDS:g}s pre-roll")
+        status_label.configure(text=f"Armed - {stream_device} ({engine.PREROLL_SECONDS:g}s pre-roll)")
+    except Exception as e:
+        print(f"Error arming input stream: {e.__class__.__name__}: {str(e)}")
+        status_label.configure(text=f"Could not arm input: {str(e)}")
+        disarm_stream()
+        armed_var.set(False)
+
+def disarm_stream():
+    """Close the always-open input stream."""
+    global stream
+    if stream is not None:
+        try:
+            stream.stop()
+            stream.close()
         except Exception as e:
-            error_msg = f"Recording error: {str(e)}"
-            status_label.configure(text=error_msg)
-            print(f"Detailed error: {e.__class__.__name__}: {str(e)}")
-            # Reset the stream if there was an error
-            if stream is not None:
-                try:
-                    stream.close()
-                except:
-                    pass
-                stream = None
-            is_recording = False
+            print(f"Error closing input stream: {e}")
+        stream = None
+    engine.disarm_capture()
+
+def toggle_armed():
+    """Switch push-to-talk mode on or off (only between recordings)."""
+    if is_recording or is_paused:
+        armed_var.set(engine.armed)
+        status_label.configure(text="Stop the current recording before switching Armed mode")
+        return
+    if armed_var.get():
+        arm_stream()
+    else:
+        disarm_stream()
+        status_label.configure(text="Ready - Press 'Record' to start")
+
+def start_hotkey_listener(hotkey):
+    """Toggle recording with a system-wide hotkey (requires pynput)."""
+    global hotkey_listener
+    try:
+        from pynput import keyboard
+    except ImportError as e:
+        print(f"Global hotkey needs pynput ({e}); install it with 'pip install pynput'")
+        return
+    try:
+        # The listener calls back on its own thread; hand the keypress to the Tk thread
+        hotkey_listener = keyboard.GlobalHotKeys({hotkey: lambda: root.after(0, toggle_recording)})
+        hotkey_listener.start()
+        print(f"Global hotkey {hotkey} toggles recording")
+    except Exception as e:
+        print(f"Could not register hotkey {hotkey}: {e}")
 
 def update_recording_indicator():
     """Update the recording indicator animation"""
@@ -373,12 +500,16 @@ def update_recording_indicator():
 
 def pause_recording():
     """Pause the current recording session."""
-    global stream, is_recording
+    global stream, is_recording, is_paused
     if is_recording and stream is not None:
-        stream.stop()
-        stream.close()
-        stream = None
+        if engine.armed:
+            engine.pause_segment()  # The stream keeps running and refills the pre-roll
+        else:
+            stream.stop()
+            stream.close()
+            stream = None
         is_recording = False
+        is_paused = True
         status_label.configure(text="Paused")
         
         # Update button states
@@ -390,14 +521,24 @@ def pause_recording():
 
 def stop_recording():
     """Stop recording and start processing the recorded audio."""
-    global stream, is_recording
-    if is_recording and stream is not None:
+    global stream, is_recording, is_paused
+    if is_recording or is_paused:
         try:
             is_recording = False
-            stream.stop()
-            stream.close()
-            stream = None
+            is_paused = False
+            if engine.armed:
+                engine.end_segment()  # Stays armed for the next recording
+            else:
+                if stream is not None:  # Already closed when the recording was paused
+                    stream.stop()
+                    stream.close()
+                    stream = None
+                engine.finish_capture()
             status_label.configure(text="Processing transcription...")
+            overflows = metrics.counters.get("input_overflows", 0)
+            dropped = metrics.counters.get("dropped_blocks", 0)
+            if overflows or dropped:
+                print(f"Audio callback: {overflows} input overflows, {dropped} dropped blocks so far")
             
             # Update button states 
             start_button.configure(state="normal")
@@ -407,212 +548,509 @@ def stop_recording():
             # Reset recording indicator
             recording_indicator.configure(text_color="#333333")
             
-            # Show a progress indicator in the text area
-            text_box.delete("0.0", "end")
-            text_box.insert("0.0", "Transcribing audio...\nThis may take a moment.")
-            
-            threading.Thread(target=process_audio, daemon=True).start()
+            submit_recording()
         except Exception as e:
             print(f"Error stopping recording: {e}")
 
-def process_audio():
-    """Process the recorded audio: write to WAV, transcribe with Whisper, and update the GUI."""
-    global audio_frames
-    wav_path = None
-    
+def submit_recording():
+    """Queue the recording that just stopped for transcription."""
+    global job_queue
+    if job_queue is None:
+        job_queue = jobs.JobQueue()
+    job = jobs.job_from_capture()
     try:
-        if not audio_frames or len(audio_frames) == 0:
-            transcription = "No audio recorded."
-            status_label.configure(text="No audio recorded.")
-            stop_button.configure(state="normal")
-            return
-
-        print(f"Processing {len(audio_frames)} audio chunks...")
-        audio_data = np.concatenate(audio_frames, axis=0)
-        print(f"Combined audio shape: {audio_data.shape}")
-        
-        audio_max = np.max(np.abs(audio_data))
-        print(f"Maximum audio level: {audio_max}")
-        
-        if audio_max < 0.01:
-            transcription = "Audio level too low - please check microphone"
-            status_label.configure(text="Audio level too low")
-            stop_button.configure(state="normal")
-            return
-
-        audio_data_int16 = np.int16(audio_data * 32767)
-
-        with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as tmpfile:
-            wav_path = tmpfile.name
-            with wave.open(wav_path, 'wb') as wf:
-                wf.setnchannels(CHANNELS)
-                wf.setsampwidth(2)
-                wf.setframerate(RATE)  # Use the fixed RATE of 16000Hz
-                wf.writeframes(audio_data_int16.tobytes())
-
-        print(f"Audio saved to: {wav_path}")
-        print("Loading Whisper model...")
-        
-        model = whisper.load_model("base")
-        result = model.transcribe(wav_path)
-        transcription = result.get("text", "").strip()
-        
-        if not transcription:
-            transcription = "No speech detected in the audio."
+        future = job_queue.submit(
+            job, on_progress=lambda fraction: set_status(f"Transcribing... {fraction:.0%}"))
+    except jobs.JobQueueFull as e:
+        status_label.configure(text=f"Recording discarded: {e}")
+        if job.is_spooled:
+            job.audio.remove()
+        return
+    future.add_done_callback(lambda done: root.after(0, on_job_done, done))
+    if len(job_queue) == 1 and job.streaming is None:
+        # Show a progress indicator in the text area (streamed text is already there)
+        text_box.delete("0.0", "end")
+        text_box.insert("0.0", "Transcribing audio...\nThis may take a moment.")
+    update_job_status()
 
-    except Exception as e:
-        print(f"Error during transcription: {str(e)}")
-        transcription = f"Error during transcription: {str(e)}"
-        
-    finally:
-        if wav_path and os.path.exists(wav_path):
-            try:
-                os.unlink(wav_path)
-            except Exception as e:
-                print(f"Error deleting temporary file: {str(e)}")
-        
-        audio_frames = []
-        root.after(0, update_gui, transcription)
-        stop_button.configure(state="normal")
+def on_job_done(future):
+    """Show a finished job's transcript (runs on the Tk thread)."""
+    if future.cancelled():
+        status_label.configure(text=f"Transcription {future.job.job_id} cancelled")
+    else:
+        error = future.exception()
+        if isinstance(error, jobs.JobCancelled):
+            status_label.configure(text=f"Transcription {future.job.job_id} cancelled")
+        elif error is not None:
+            print(f"Error during transcription: {str(error)}")
+            update_gui(f"Error during transcription: {str(error)}")
+        else:
+            result = future.result()
+            update_gui(result["text"])
+            if result["status"]:
+                status_label.configure(text=result["status"])
+    update_job_status()
+
+def update_job_status():
+    """Enable Cancel while jobs are in flight and say how many are left."""
+    remaining = len(job_queue) if job_queue is not None else 0
+    cancel_button.configure(state="normal" if remaining else "disabled")
+    if remaining and not is_recording:
+        status_label.configure(text=f"Transcribing {remaining} recording{'s' if remaining > 1 else ''}...")
+
+def cancel_transcription():
+    """Cancel the newest transcription still waiting or running."""
+    pending = job_queue.jobs() if job_queue is not None else []
+    if pending:
+        job_queue.cancel(pending[-1].job_id)
+    update_job_status()
+
+def monitor_silence():
+    """Stop recording once VAD_AUTO_STOP_SECONDS of silence follow detected speech."""
+    if not is_recording or engine.VAD_AUTO_STOP_SECONDS <= 0:
+        return
+    if engine.silence_after_speech():
+        stop_recording()
+        status_label.configure(text=f"Recording stopped after {engine.VAD_AUTO_STOP_SECONDS:g}s of silence")
+        return
+    root.after(250, monitor_silence)
+
+def show_streaming_text(committed, partial):
+    """Show committed text followed by the still-changing partial text."""
+    text_box.delete("0.0", "end")
+    text_box.insert("0.0", committed)
+    if partial:
+        text_box.insert("end", (" " if committed else "") + partial, "partial")
+    text_box.see("end")
+
+def toggle_stats_panel():
+    """Show or hide the live performance panel."""
+    if stats_var.get():
+        stats_box.pack(fill="x", pady=(0, 6), before=text_frame)
+        refresh_stats_panel()
+    else:
+        stats_box.pack_forget()
+
+def refresh_stats_panel():
+    """Redraw the stage timings and counters once a second while the panel is visible."""
+    if not stats_var.get():
+        return
+    stats_box.configure(state="normal")
+    stats_box.delete("0.0", "end")
+    stats_box.insert("0.0", metrics.format_table())
+    stats_box.configure(state="disabled")
+    root.after(1000, refresh_stats_panel)
 
 def update_gui(transcription):
     """Update the text widget with the transcription and copy the text to the clipboard."""
     text_box.delete("0.0", "end")
     text_box.insert("0.0", transcription)
+    import pyperclip
     pyperclip.copy(transcription)
     status_label.configure(text="✓ Transcription complete. Text copied to clipboard.")
 
 # --------------------- GUI Setup --------------------- #
-root = ctk.CTk()
-root.title("Voice to Text Transcriber")
-root.geometry("700x500")  # Reduced from 800x600
-root.minsize(600, 400)    # Reduced minimum size
-
-main_frame = ctk.CTkFrame(root)
-main_frame.pack(fill="both", expand=True, padx=15, pady=15)  # Reduced padding
-
-# Title area
-title_frame = ctk.CTkFrame(main_frame, fg_color="transparent")
-title_frame.pack(fill="x", pady=(0, 15))  # Reduced padding
-
-title_label = ctk.CTkLabel(
-    title_frame, 
-    text="Voice to Text Transcriber", 
-    font=ctk.CTkFont(size=20, weight="bold"),  # Smaller font
-    text_color=ACCENT_COLOR  # Using accent color
-)
-title_label.pack(side="left")
-
-# Recording indicator
-recording_indicator = ctk.CTkLabel(
-    title_frame,
-    text="●",
-    font=ctk.CTkFont(size=20),  # Smaller font
-    text_color="#333333"  # Start with gray (inactive)
-)
-recording_indicator.pack(side="right")
-
-# Control buttons area
-control_frame = ctk.CTkFrame(main_frame, fg_color="transparent")
-control_frame.pack(fill="x", pady=8)  # Reduced padding
-
-button_frame = ctk.CTkFrame(control_frame, fg_color="transparent")
-button_frame.pack(side="left")
-
-# Create custom recording control buttons with icons
-start_button = ctk.CTkButton(
-    button_frame, 
-    text="Record", 
-    command=start_recording,
-    fg_color="#444444",
-    hover_color=ACCENT_COLOR,  # Using accent color for hover
-    width=100,  # Smaller width
-    height=30,  # Smaller height
-    corner_radius=4
-)
-start_button.pack(side="left", padx=8)  # Reduced padding
-
-pause_button = ctk.CTkButton(
-    button_frame, 
-    text="Pause", 
-    command=pause_recording,
-    fg_color="#444444",
-    hover_color=ACCENT_COLOR,  # Using accent color for hover
-    width=100,  # Smaller width
-    height=30,  # Smaller height
-    corner_radius=4,
-    state="disabled"
-)
-pause_button.pack(side="left", padx=8)  # Reduced padding
-
-stop_button = ctk.CTkButton(
-    button_frame, 
-    text="Stop", 
-    command=stop_recording,
-    fg_color="#444444",
-    hover_color=ACCENT_COLOR,  # Using accent color for hover
-    width=100,  # Smaller width
-    height=30,  # Smaller height
-    corner_radius=4,
-    state="disabled"
-)
-stop_button.pack(side="left", padx=8)  # Reduced padding
+def build_gui():
+    """Create the main window and its widgets."""
+    global root, recording_indicator, start_button, pause_button, stop_button
+    global model_var, streaming_var, long_recording_var, status_label, text_box
+    global stats_var, stats_box, text_frame, armed_var, cancel_button, ctk
+    import customtkinter as ctk
 
-def add_device_selection_button(control_frame):
-    device_button = ctk.CTkButton(
-        control_frame,
-        text="Select Device",
-        command=create_device_selection_dialog,
+    # Set appearance mode and default color theme
+    ctk.set_appearance_mode("dark")  # Modes: "dark", "light"
+    ctk.set_default_color_theme("blue")  # Themes: "blue", "green", "dark-blue"
+
+    root = ctk.CTk()
+    root.title("Voice to Text Transcriber")
+    root.geometry("700x500")  # Reduced from 800x600
+    root.minsize(600, 400)    # Reduced minimum size
+
+    main_frame = ctk.CTkFrame(root)
+    main_frame.pack(fill="both", expand=True, padx=15, pady=15)  # Reduced padding
+
+    # Title area
+    title_frame = ctk.CTkFrame(main_frame, fg_color="transparent")
+    title_frame.pack(fill="x", pady=(0, 15))  # Reduced padding
+
+    title_label = ctk.CTkLabel(
+        title_frame, 
+        text="Voice to Text Transcriber", 
+        font=ctk.CTkFont(size=20, weight="bold"),  # Smaller font
+        text_color=ACCENT_COLOR  # Using accent color
+    )
+    title_label.pack(side="left")
+
+    # Recording indicator
+    recording_indicator = ctk.CTkLabel(
+        title_frame,
+        text="●",
+        font=ctk.CTkFont(size=20),  # Smaller font
+        text_color="#333333"  # Start with gray (inactive)
+    )
+    recording_indicator.pack(side="right")
+
+    # Control buttons area
+    control_frame = ctk.CTkFrame(main_frame, fg_color="transparent")
+    control_frame.pack(fill="x", pady=8)  # Reduced padding
+
+    button_frame = ctk.CTkFrame(control_frame, fg_color="transparent")
+    button_frame.pack(side="left")
+
+    # Create custom recording control buttons with icons
+    start_button = ctk.CTkButton(
+        button_frame, 
+        text="Record", 
+        command=start_recording,
         fg_color="#444444",
         hover_color=ACCENT_COLOR,  # Using accent color for hover
         width=100,  # Smaller width
         height=30,  # Smaller height
         corner_radius=4
     )
-    device_button.pack(side="right", padx=8)  # Reduced padding
-
-add_device_selection_button(control_frame)
-
-# Status area
-status_frame = ctk.CTkFrame(main_frame, fg_color="transparent")
-status_frame.pack(fill="x", pady=6)  # Reduced padding
-
-status_label = ctk.CTkLabel(
-    status_frame, 
-    text="Ready - Press 'Record' to start",
-    font=ctk.CTkFont(size=12),  # Smaller font
-    text_color="#aaaaaa"
-)
-status_label.pack(anchor="w")
-
-# Text display area
-text_frame = ctk.CTkFrame(main_frame)
-text_frame.pack(fill="both", expand=True, pady=8)  # Reduced padding
-
-text_box = ctk.CTkTextbox(
-    text_frame, 
-    wrap="word",
-    font=ctk.CTkFont(size=14),  # Smaller font
-    corner_radius=4,  # Smaller corner radius
-    border_width=1,
-    border_color=ACCENT_COLOR,  # Using accent color for border
-)
-text_box.pack(fill="both", expand=True, padx=8, pady=8)  # Reduced padding
-
-# Footer with instructions
-footer_frame = ctk.CTkFrame(main_frame, fg_color="transparent")
-footer_frame.pack(fill="x", pady=(8, 0))  # Reduced padding
-
-footer_label = ctk.CTkLabel(
-    footer_frame,
-    text="Transcription automatically copied to clipboard",  # Shortened text
-    font=ctk.CTkFont(size=10),  # Smaller font
-    text_color="#888888"
-)
-footer_label.pack(side="right")
-
-# List available devices on startup (printed to console)
-list_audio_devices()
+    start_button.pack(side="left", padx=8)  # Reduced padding
 
-if __name__ == "__main__":
+    pause_button = ctk.CTkButton(
+        button_frame, 
+        text="Pause", 
+        command=pause_recording,
+        fg_color="#444444",
+        hover_color=ACCENT_COLOR,  # Using accent color for hover
+        width=100,  # Smaller width
+        height=30,  # Smaller height
+        corner_radius=4,
+        state="disabled"
+    )
+    pause_button.pack(side="left", padx=8)  # Reduced padding
+
+    stop_button = ctk.CTkButton(
+        button_frame, 
+        text="Stop", 
+        command=stop_recording,
+        fg_color="#444444",
+        hover_color=ACCENT_COLOR,  # Using accent color for hover
+        width=100,  # Smaller width
+        height=30,  # Smaller height
+        corner_radius=4,
+        state="disabled"
+    )
+    stop_button.pack(side="left", padx=8)  # Reduced padding
+
+    # Cancels the newest transcription still in flight
+    cancel_button = ctk.CTkButton(
+        button_frame, 
+        text="Cancel", 
+        command=cancel_transcription,
+        fg_color="#444444",
+        hover_color=ACCENT_COLOR,  # Using accent color for hover
+        width=100,  # Smaller width
+        height=30,  # Smaller height
+        corner_radius=4,
+        state="disabled"
+    )
+    cancel_button.pack(side="left", padx=8)  # Reduced padding
+
+    def add_device_selection_button(control_frame):
+        device_button = ctk.CTkButton(
+            control_frame,
+            text="Select Device",
+            command=create_device_selection_dialog,
+            fg_color="#444444",
+            hover_color=ACCENT_COLOR,  # Using accent color for hover
+            width=100,  # Smaller width
+            height=30,  # Smaller height
+            corner_radius=4
+        )
+        device_button.pack(side="right", padx=8)  # Reduced padding
+
+    add_device_selection_button(control_frame)
+
+    # Model size selector: switching warms the new model in the background
+    model_var = ctk.StringVar(value=engine.WHISPER_MODEL)
+    model_menu = ctk.CTkOptionMenu(
+        control_frame,
+        variable=model_var,
+        values=MODEL_SIZES if engine.WHISPER_MODEL in MODEL_SIZES else MODEL_SIZES + [engine.WHISPER_MODEL],
+        command=set_model,
+        fg_color="#444444",
+        button_color=ACCENT_COLOR,
+        button_hover_color="#1c6e3d",
+        width=100,
+        height=30
+    )
+    model_menu.pack(side="right", padx=8)
+
+    # Unlimited recording length: spool audio to disk instead of keeping it in memory
+    long_recording_var = ctk.BooleanVar(value=LONG_RECORDING_ENABLED)
+    long_recording_switch = ctk.CTkSwitch(
+        control_frame,
+        text="No limit",
+        variable=long_recording_var,
+        progress_color=ACCENT_COLOR,
+        width=60
+    )
+    long_recording_switch.pack(side="right", padx=8)
+
+    # Live (streaming) transcription toggle
+    streaming_var = ctk.BooleanVar(value=STREAMING_ENABLED)
+    streaming_switch = ctk.CTkSwitch(
+        control_frame,
+        text="Live",
+        variable=streaming_var,
+        progress_color=ACCENT_COLOR,
+        width=60
+    )
+    streaming_switch.pack(side="right", padx=8)
+
+    # Push-to-talk: keep the stream open so Record/Pause/Resume start instantly with pre-roll
+    armed_var = ctk.BooleanVar(value=False)
+    armed_switch = ctk.CTkSwitch(
+        control_frame,
+        text="Armed",
+        variable=armed_var,
+        command=toggle_armed,
+        progress_color=ACCENT_COLOR,
+        width=60
+    )
+    armed_switch.pack(side="right", padx=8)
+
+    # Live performance panel: per-stage timings, callback overflows and queue depths
+    stats_var = ctk.BooleanVar(value=STATS_PANEL_ENABLED)
+    stats_switch = ctk.CTkSwitch(
+        control_frame,
+        text="Stats",
+        variable=stats_var,
+        command=toggle_stats_panel,
+        progress_color=ACCENT_COLOR,
+        width=60
+    )
+    stats_switch.pack(side="right", padx=8)
+
+    # Status area
+    status_frame = ctk.CTkFrame(main_frame, fg_color="transparent")
+    status_frame.pack(fill="x", pady=6)  # Reduced padding
+
+    status_label = ctk.CTkLabel(
+        status_frame, 
+        text="Ready - Press 'Record' to start",
+        font=ctk.CTkFont(size=12),  # Smaller font
+        text_color="#aaaaaa"
+    )
+    status_label.pack(anchor="w")
+
+    # Text display area
+    text_frame = ctk.CTkFrame(main_frame)
+    text_frame.pack(fill="both", expand=True, pady=8)  # Reduced padding
+
+    text_box = ctk.CTkTextbox(
+        text_frame, 
+        wrap="word",
+        font=ctk.CTkFont(size=14),  # Smaller font
+        corner_radius=4,  # Smaller corner radius
+        border_width=1,
+        border_color=ACCENT_COLOR,  # Using accent color for border
+    )
+    text_box.pack(fill="both", expand=True, padx=8, pady=8)  # Reduced padding
+    text_box.tag_config("partial", foreground="#888888")  # Uncommitted streaming text
+
+    # Stats panel, packed above the text area while the Stats switch is on
+    stats_box = ctk.CTkTextbox(
+        main_frame,
+        height=150,
+        font=ctk.CTkFont(family="Courier", size=11),
+        corner_radius=4,
+        wrap="none",
+    )
+    if STATS_PANEL_ENABLED:
+        toggle_stats_panel()
+
+    # Footer with instructions
+    footer_frame = ctk.CTkFrame(main_frame, fg_color="transparent")
+    footer_frame.pack(fill="x", pady=(8, 0))  # Reduced padding
+
+    footer_label = ctk.CTkLabel(
+        footer_frame,
+        text="Transcription automatically copied to clipboard",  # Shortened text
+        font=ctk.CTkFont(size=10),  # Smaller font
+        text_color="#888888"
+    )
+    footer_label.pack(side="right")
+
+def report_startup_time(exit_after=False):
+    """Print the time from process start until the main window is drawn."""
+    root.update_idletasks()
+    elapsed_ms = (time.perf_counter() - STARTUP_T0) * 1000
+    print(f"Startup: window ready in {elapsed_ms:.0f} ms")
+    if exit_after:
+        print(json.dumps({"startup_ms": round(elapsed_ms, 1)}))
+        root.destroy()
+
+def search_transcripts(query, limit=20, as_json=False, play=False, seconds=10.0):
+    """Print past transcript segments matching `query`; optionally play the best one."""
+    import store
+    hits = store.search(query, limit)
+    if as_json:
+        print(json.dumps(hits, indent=2))
+    else:
+        for hit in hits:
+            when = time.strftime("%Y-%m-%d %H:%M", time.localtime(hit["created"]))
+            minutes, secs = divmod(hit["offset"], 60)
+            print(f"#{hit['recording_id']} {when} @ {int(minutes):02d}:{secs:05.2f}  {hit['snippet']}")
+            if hit["audio_path"]:
+                print(f"    {hit['audio_path']}")
+        recordings, segments, size_mb = store.stats()
+        print(f"{len(hits)} hits in {recordings} recordings ({segments} segments, {size_mb:.1f} MB)")
+    if play and hits:
+        hit = hits[0]
+        if not hit["audio_path"] or not os.path.exists(hit["audio_path"]):
+            print("The best hit has no saved audio (enable TRANSCRIBE_WAV_DIR to keep recordings)")
+            return 1
+        import sounddevice as sd
+        audio_data, rate = store.read_audio(hit["audio_path"], hit["offset"], seconds)
+        sd.play(audio_data, rate)
+        sd.wait()
+    return 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Voice to text transcriber")
+    parser.add_argument("--measure-startup", action="store_true",
+                        help="Print startup time as JSON once the window is drawn, then exit")
+    parser.add_argument("--backend", choices=backends.BACKENDS, default=backends.WHISPER_BACKEND,
+                        help="Inference backend (default: WHISPER_BACKEND or torch)")
+    parser.add_argument("--threads", type=int, help="Intra-op threads per model (default: WHISPER_THREADS)")
+    parser.add_argument("--interop-threads", type=int,
+                        help="Inter-op threads per model (default: WHISPER_INTEROP_THREADS)")
+    parser.add_argument("--armed", action="store_true", default=ARMED_ENABLED,
+                        help="Start with the input stream open and armed for push-to-talk")
+    parser.add_argument("--hotkey", default=HOTKEY,
+                        help='Global Record/Stop hotkey in pynput syntax, e.g. "<ctrl>+<alt>+space"')
+    subparsers = parser.add_subparsers(dest="command")
+    batch_parser = subparsers.add_parser("batch", help="Transcribe audio files without the GUI")
+    batch_parser.add_argument("paths", nargs="+", help="Audio files or directories")
+    batch_parser.add_argument("-o", "--output-dir", help="Output directory (default: next to each input)")
+    batch_parser.add_argument("-f", "--format", default="json,srt,txt",
+                              help="Comma-separated output formats: json, srt, txt")
+    batch_parser.add_argument("-j", "--workers", type=int, default=1,
+                              help="Worker processes, each holding one resident model")
+    batch_parser.add_argument("-m", "--model", default=engine.WHISPER_MODEL, help="Whisper model name")
+    batch_parser.add_argument("-b", "--batch-size", type=int, default=1,
+                              help="Decode this many 30 s windows per forward pass (1 = one file at a time)")
+    serve_parser = subparsers.add_parser("serve", help="Run the HTTP/WebSocket transcription server")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8765)
+    serve_parser.add_argument("-j", "--workers", type=int, default=1,
+                              help="Worker processes, each holding one resident model")
+    serve_parser.add_argument("-q", "--queue-size", type=int, default=4,
+                              help="Requests allowed to wait for a worker before new ones get HTTP 503")
+    serve_parser.add_argument("-m", "--model", default=engine.WHISPER_MODEL, help="Whisper model name")
+    serve_parser.add_argument("-b", "--batch-size", type=int, default=1,
+                              help="Uploads arriving together that are transcribed in one batched job")
+    recover_parser = subparsers.add_parser("recover", help="Recover recordings interrupted by a crash")
+    recover_parser.add_argument("directory", nargs="?",
+                                help="Spool directory to recover (default: list unfinished recordings)")
+    recover_parser.add_argument("-o", "--output", help="WAV file to write (default: <directory>.wav)")
+    recover_parser.add_argument("--transcribe", action="store_true", help="Also print a transcript")
+    meeting_parser = subparsers.add_parser("meeting", help="Record several devices or channels at once "
+                                                          "and write a speaker-tagged transcript")
+    meeting_parser.add_argument("-s", "--source", action="append", required=True, metavar="DEVICE[:CH,...][=LABEL,...]",
+                                help='Device (index or part of its name) to record, optionally split into '
+                                     'channels with a speaker label each, e.g. "2:1,2=Ann,Bob"; repeat per device')
+    meeting_parser.add_argument("--seconds", type=float, help="Stop after this long (default: press Enter)")
+    meeting_parser.add_argument("-j", "--workers", type=int,
+                                help="Worker processes transcribing tracks in parallel (default: one per track)")
+    meeting_parser.add_argument("-m", "--model", default=engine.WHISPER_MODEL, help="Whisper model name")
+    meeting_parser.add_argument("-o", "--output-dir", help="Also write the transcript as JSON/SRT/TXT here")
+    search_parser = subparsers.add_parser("search", help="Search past transcripts")
+    search_parser.add_argument("query", nargs="+", help="Words to find (the last one may be a prefix)")
+    search_parser.add_argument("-n", "--limit", type=int, default=20, help="Maximum number of hits")
+    search_parser.add_argument("--json", action="store_true", help="Print the hits as JSON")
+    search_parser.add_argument("--play", action="store_true", help="Play the best hit from its offset")
+    search_parser.add_argument("--seconds", type=float, default=10.0, help="How much audio --play plays")
+    cache_parser = subparsers.add_parser("cache", help="Show or clear the transcription result cache")
+    cache_parser.add_argument("--clear", action="store_true", help="Delete every cached result")
+    args = parser.parse_args(argv)
+
+    if metrics.METRICS_FILE:
+        atexit.register(metrics.write_dump)
+    backends.set_backend(args.backend)
+    backends.configure_threads(args.threads, args.interop_threads)
+
+    if args.command == "batch":
+        import batch
+        formats = [fmt.strip() for fmt in args.format.split(",") if fmt.strip()]
+        unknown = set(formats) - set(batch.BATCH_FORMATS)
+        if unknown:
+            parser.error(f"unknown format(s): {', '.join(sorted(unknown))}")
+        return batch.run_batch(args.paths, args.output_dir, formats, max(1, args.workers), args.model,
+                               max(1, args.batch_size))
+
+    if args.command == "serve":
+        try:
+            import server
+        except ImportError as e:
+            parser.error(f"server mode needs aiohttp ({e}); install it with 'pip install aiohttp'")
+        server.run_server(args.host, args.port, max(1, args.workers), max(0, args.queue_size), args.model,
+                          args.batch_size)
+        return 0
+
+    if args.command == "meeting":
+        import meeting
+        try:
+            sources = [meeting.parse_source(spec) for spec in args.source]
+        except ValueError as e:
+            parser.error(str(e))
+        result = meeting.record_meeting(sources, args.seconds, args.workers, args.model)
+        if args.output_dir:
+            import batch
+            os.makedirs(args.output_dir, exist_ok=True)
+            tagged = dict(result, path=time.strftime("meeting_%Y%m%d_%H%M%S"),
+                          segments=meeting.tagged_segments(result))
+            batch.write_outputs(tagged, args.output_dir, batch.BATCH_FORMATS)
+        return 1 if any(track["error"] for track in result["tracks"]) else 0
+
+    if args.command == "search":
+        return search_transcripts(" ".join(args.query), args.limit, args.json, args.play, args.seconds)
+
+    if args.command == "cache":
+        import cache
+        if args.clear:
+            cache.clear()
+        entries, size_mb = cache.stats()
+        print(f"{cache.RESULT_CACHE_DIR}: {entries} results, {size_mb:.1f} MB "
+              f"(cap {cache.RESULT_CACHE_MB:.0f} MB)")
+        return 0
+
+    if args.command == "recover":
+        if args.directory is None:
+            unfinished = engine.find_unfinished_spools()
+            print("\n".join(unfinished) if unfinished else "No unfinished recordings.")
+            return 0
+        engine.recover_spool(args.directory, args.output)
+        if args.transcribe:
+            print(engine.transcribe_long(engine.SpoolBuffer(args.directory, mode="r")))
+        return 0
+
+    for directory in engine.find_unfinished_spools():
+        print(f"Unfinished recording found: {directory} "
+              f"(recover it with 'python transcribe.py recover {directory}')")
+
+    build_gui()
+    root.after(0, report_startup_time, args.measure_startup)
+    if not args.measure_startup:
+        # Device listing and the model load (which imports torch) happen off the UI thread
+        threading.Thread(target=init_devices, daemon=True).start()
+        # Warm the configured model while the window is idle so the first Stop doesn't pay for it
+        engine.preload_model(engine.WHISPER_MODEL, on_model_ready)
+        if args.armed:
+            armed_var.set(True)
+            root.after(0, arm_stream)
+        if args.hotkey:
+            start_hotkey_listener(args.hotkey)
     root.mainloop()
+    if archive.archiver.enabled:
+        print("Finishing the audio archive...")
+        archive.archiver.join()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())